@@ -24,6 +24,14 @@ from addict import Dict
 
 from metal_library.core.reader import Reader
 from metal_library.core.selector import Selector
+from metal_library.core.streaming_selector import StreamingSelector
+from metal_library.core.federated_selector import FederatedSelector
+from metal_library.core.surrogate import Surrogate
+from metal_library.core.grid import RegularGrid
+from metal_library.core.sensitivity import LocalJacobian
+from metal_library.core.server import SelectorServer, SelectorClient
 
 from metal_library.core.librarian import QLibrarian
-from metal_library.core.sweeper import QSweeper
\ No newline at end of file
+from metal_library.core.sweep_store import SweepWriter, SweepReader
+from metal_library.core.sweeper import QSweeper
+from metal_library.core.ingestor import Ingestor
\ No newline at end of file
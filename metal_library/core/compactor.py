@@ -0,0 +1,352 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+'''
+Compaction of the `metal_library.library` CSVs.
+
+A library CSV repeats many columns which never change (e.g. `pos_x`, `chip`,
+`layer`, `gds_cell_name`, the hfss / q3d / aedt inductance fields), stores
+low-cardinality strings as plain text, and sometimes contains the same geometry
+more than once because it was simulated in overlapping sweeps.
+
+`compact_library` turns such a DataFrame into a compact form:
+    1. Constant columns are moved into `compact_info["constants"]`.
+    2. Rows w/ identical geometries are merged. Numeric characteristics are averaged,
+       the original row numbers are kept in the `__PROVENANCE__` column.
+    3. Low-cardinality string columns are stored as `pd.Categorical`.
+       On disk only the integer codes are written, the dictionary lives in the `.json` file.
+
+`expand_library` undoes all of this, so the result can be fed to `Selector`
+(and therefore round-trips to QComponent.options).
+
+Example:
+compact_df, compact_info = compact_library(df)
+save_compact_library(compact_df, compact_info, 'metal_library/library/TransmonCross/QubitOnly')
+# Writes: QubitOnly.compact.csv.gz, QubitOnly.compact.json
+'''
+
+SPLITTER = '__SPLITTER__'
+PROVENANCE = '__PROVENANCE__'
+PROVENANCE_SEPARATOR = ';'
+
+COMPACT_DATA_SUFFIX = '.compact.csv.gz'
+COMPACT_INFO_SUFFIX = '.compact.json'
+
+
+def compact_library(df: pd.DataFrame,
+                    merge_duplicates: bool = True,
+                    max_categorical_fraction: float = 0.5) -> tuple[pd.DataFrame, dict]:
+    """
+    Compact a library DataFrame (as read from `metal_library.library.component_name.component_type.csv`).
+
+    Args:
+        df (pd.DataFrame): Library w/ geometry columns, then `__SPLITTER__`, then characteristic columns.
+        merge_duplicates (bool, optional): Merge rows w/ identical geometries. Defaults to True.
+        max_categorical_fraction (float, optional): String columns w/ `nunique / len` at or below
+            this fraction are stored as categoricals. Defaults to 0.5.
+
+    Returns:
+        compact_df (pd.DataFrame): Varying columns only, plus a `__PROVENANCE__` column.
+        compact_info (dict): Everything needed by `expand_library`.
+            {
+                'columns': (list[str]) Original column order, including `__SPLITTER__`,
+                'geometry_columns': (list[str]),
+                'characteristic_columns': (list[str]),
+                'constants': (dict) Column name -> value shared by every row,
+                'categories': (dict) Column name -> list of categories,
+                'num_rows': (int) Number of rows before merging duplicates,
+                'num_merged': (int) Number of rows removed by merging duplicates
+            }
+    """
+    if SPLITTER not in df.columns:
+        raise KeyError(f'`df` must contain a `{SPLITTER}` column separating geometry and characteristics.')
+
+    splitter_loc = df.columns.get_loc(SPLITTER)
+    geometry_columns = list(df.columns[:splitter_loc])
+    characteristic_columns = list(df.columns[splitter_loc + 1:])
+
+    compact_info = dict(columns=list(df.columns),
+                        geometry_columns=geometry_columns,
+                        characteristic_columns=characteristic_columns,
+                        constants={},
+                        categories={},
+                        num_rows=len(df),
+                        num_merged=0)
+
+    compact_df = df.drop(columns=SPLITTER)
+    compact_df[PROVENANCE] = df.index.astype(str)
+
+    # 1. Move constant columns into metadata
+    if len(compact_df) > 0:
+        for column in geometry_columns + characteristic_columns:
+            if compact_df[column].nunique(dropna=False) == 1:
+                compact_info['constants'][column] = _to_native(compact_df[column].iloc[0])
+        compact_df = compact_df.drop(columns=list(compact_info['constants']))
+
+    # 2. Merge duplicate geometries
+    if merge_duplicates:
+        compact_df = _merge_duplicates(compact_df, compact_info)
+        compact_info['num_merged'] = compact_info['num_rows'] - len(compact_df)
+
+    # 3. Dictionary-encode low-cardinality strings
+    compact_df = _encode_categoricals(compact_df, compact_info, max_categorical_fraction)
+
+    return compact_df.reset_index(drop=True), compact_info
+
+
+def append_compact_library(compact_df: pd.DataFrame,
+                           compact_info: dict,
+                           new_df: pd.DataFrame,
+                           first_row: int = None,
+                           merge_duplicates: bool = True,
+                           max_categorical_fraction: float = 0.5) -> tuple[pd.DataFrame, dict]:
+    """
+    Add new library rows to a compacted library, w/o expanding and recompacting it.
+
+    Constants which the new rows disagree with become regular columns again.
+    Duplicates are merged w/ a mean weighted by how many rows were already merged into each entry.
+
+    Args:
+        compact_df (pd.DataFrame): Output of `compact_library`.
+        compact_info (dict): Output of `compact_library`.
+        new_df (pd.DataFrame): New rows in the library CSV layout (w/ or w/o `__SPLITTER__`).
+        first_row (int, optional): Row number of `new_df`'s first row in the full library,
+            used for `__PROVENANCE__`. Defaults to `compact_info['num_rows']`.
+        merge_duplicates (bool, optional): Merge rows w/ identical geometries. Defaults to True.
+        max_categorical_fraction (float, optional): See `compact_library`. Defaults to 0.5.
+
+    Returns:
+        compact_df (pd.DataFrame)
+        compact_info (dict)
+    """
+    if first_row is None:
+        first_row = compact_info['num_rows']
+
+    compact_info = dict(compact_info, constants=dict(compact_info['constants']), categories={})
+    compact_df = compact_df.copy()
+    for column in compact_df.columns:
+        if isinstance(compact_df[column].dtype, pd.CategoricalDtype):
+            compact_df[column] = compact_df[column].astype(compact_df[column].cat.categories.dtype)
+
+    new_df = new_df.drop(columns=SPLITTER, errors='ignore').reset_index(drop=True)
+    new_df[PROVENANCE] = pd.RangeIndex(first_row, first_row + len(new_df)).astype(str)
+
+    # Constants the new rows disagree with go back into the DataFrame
+    for column, value in list(compact_info['constants'].items()):
+        values = new_df[column]
+        still_constant = values.isna().all() if pd.isna(value) else (values == value).all()
+        if not still_constant:
+            compact_df[column] = value
+            del compact_info['constants'][column]
+
+    compact_df = pd.concat([compact_df, new_df[list(compact_df.columns)]], ignore_index=True)
+    compact_info['num_rows'] += len(new_df)
+
+    if merge_duplicates:
+        compact_df = _merge_duplicates(compact_df, compact_info)
+    compact_info['num_merged'] = compact_info['num_rows'] - len(compact_df)
+
+    compact_df = _encode_categoricals(compact_df, compact_info, max_categorical_fraction)
+
+    return compact_df.reset_index(drop=True), compact_info
+
+
+def expand_library(compact_df: pd.DataFrame,
+                   compact_info: dict,
+                   keep_provenance: bool = False) -> pd.DataFrame:
+    """
+    Inverse of `compact_library`. Returns a DataFrame in the library CSV layout.
+
+    Args:
+        compact_df (pd.DataFrame): Output of `compact_library`.
+        compact_info (dict): Output of `compact_library`.
+        keep_provenance (bool, optional): Keep the `__PROVENANCE__` column (appended at the end). Defaults to False.
+
+    Returns:
+        df (pd.DataFrame): Geometry columns, `__SPLITTER__`, characteristic columns.
+    """
+    df = compact_df.copy()
+
+    for column in compact_info['categories']:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(df[column].cat.categories.dtype)
+
+    for column, value in compact_info['constants'].items():
+        df[column] = value
+
+    df[SPLITTER] = np.nan
+
+    columns = list(compact_info['columns'])
+    if keep_provenance and PROVENANCE in df.columns:
+        columns.append(PROVENANCE)
+
+    return df[columns]
+
+
+def get_options_from_compact(compact_df: pd.DataFrame,
+                             compact_info: dict,
+                             index: int) -> dict:
+    """
+    Get QComponent.options for a row of a compacted library, w/o expanding the whole library.
+
+    Args:
+        compact_df (pd.DataFrame): Output of `compact_library`.
+        compact_info (dict): Output of `compact_library`.
+        index (int): Row number in `compact_df`.
+
+    Returns:
+        options (dict): Associated dictionary for QComponent.options
+    """
+    from metal_library.core.sweeper_helperfunctions import create_dict_list
+
+    row = compact_df.iloc[index]
+    keys = []
+    values = []
+    for column in compact_info['geometry_columns']:
+        keys.append(column)
+        if column in compact_info['constants']:
+            values.append(compact_info['constants'][column])
+        else:
+            values.append(_to_native(row[column]))
+
+    return create_dict_list(keys=keys, values=[values])[0]
+
+
+def save_compact_library(compact_df: pd.DataFrame,
+                         compact_info: dict,
+                         path_prefix: str) -> tuple[str, str]:
+    """
+    Write a compacted library to disk.
+
+    Categorical columns are written as their integer codes, the categories are stored in the `.json` file.
+
+    Args:
+        compact_df (pd.DataFrame): Output of `compact_library`.
+        compact_info (dict): Output of `compact_library`.
+        path_prefix (str): Path w/o extension. Ex: `metal_library/library/TransmonCross/QubitOnly`
+
+    Returns:
+        data_path (str): Path to `<path_prefix>.compact.csv.gz`
+        info_path (str): Path to `<path_prefix>.compact.json`
+    """
+    data_path = path_prefix + COMPACT_DATA_SUFFIX
+    info_path = path_prefix + COMPACT_INFO_SUFFIX
+
+    df = compact_df.copy()
+    for column in compact_info['categories']:
+        df[column] = df[column].cat.codes
+
+    df.to_csv(data_path, index=False)
+    with open(info_path, 'w') as file:
+        json.dump(compact_info, file, indent=4)
+
+    return data_path, info_path
+
+
+def load_compact_library(path_prefix: str) -> tuple[pd.DataFrame, dict]:
+    """
+    Read a compacted library written by `save_compact_library`.
+
+    Args:
+        path_prefix (str): Path w/o extension. Ex: `metal_library/library/TransmonCross/QubitOnly`
+
+    Returns:
+        compact_df (pd.DataFrame)
+        compact_info (dict)
+    """
+    with open(path_prefix + COMPACT_INFO_SUFFIX, 'r') as file:
+        compact_info = json.load(file)
+
+    df = pd.read_csv(path_prefix + COMPACT_DATA_SUFFIX, dtype={PROVENANCE: str})
+    for column, categories in compact_info['categories'].items():
+        df[column] = pd.Categorical.from_codes(df[column], categories=categories)
+
+    return df, compact_info
+
+
+def iter_compact_library(path_prefix: str, chunksize: int):
+    """
+    Read a compacted library written by `save_compact_library` in chunks, expanded to the library CSV layout.
+
+    Args:
+        path_prefix (str): Path w/o extension. Ex: `metal_library/library/TransmonCross/QubitOnly`
+        chunksize (int): Rows per chunk.
+
+    Yields:
+        df (pd.DataFrame): Geometry columns, `__SPLITTER__`, characteristic columns.
+    """
+    with open(path_prefix + COMPACT_INFO_SUFFIX, 'r') as file:
+        compact_info = json.load(file)
+
+    with pd.read_csv(path_prefix + COMPACT_DATA_SUFFIX, dtype={PROVENANCE: str}, chunksize=chunksize) as chunks:
+        for chunk in chunks:
+            for column, categories in compact_info['categories'].items():
+                chunk[column] = pd.Categorical.from_codes(chunk[column], categories=categories)
+            yield expand_library(chunk, compact_info)
+
+
+def has_compact_library(path_prefix: str) -> bool:
+    """Check if `save_compact_library` has been run for `path_prefix`."""
+    return os.path.exists(path_prefix + COMPACT_DATA_SUFFIX) and os.path.exists(path_prefix + COMPACT_INFO_SUFFIX)
+
+
+def _merge_duplicates(compact_df: pd.DataFrame, compact_info: dict) -> pd.DataFrame:
+    """
+    Merge rows w/ identical varying geometry columns. Used in `compact_library` and `append_compact_library`.
+    Numeric characteristics are averaged, weighted by the number of rows in each `__PROVENANCE__` entry.
+    Missing values are skipped, along w/ their weight.
+    """
+    varying_geometry = [column for column in compact_info['geometry_columns'] if column in compact_df.columns]
+    if not varying_geometry or not compact_df.duplicated(subset=varying_geometry).any():
+        return compact_df
+
+    weights = compact_df[PROVENANCE].str.count(PROVENANCE_SEPARATOR) + 1
+    weighted_df = compact_df.copy()
+
+    aggregation = {}
+    numeric_columns = []
+    for column in compact_info['characteristic_columns']:
+        if column not in compact_df.columns:
+            continue
+        if pd.api.types.is_numeric_dtype(compact_df[column]):
+            weighted_df[column] = compact_df[column] * weights
+            aggregation[column] = 'sum'
+            # Only the weights of rows w/ a value
+            weighted_df[f'__WEIGHT__{column}'] = weights.where(compact_df[column].notna(), 0)
+            aggregation[f'__WEIGHT__{column}'] = 'sum'
+            numeric_columns.append(column)
+        else:
+            aggregation[column] = 'first'
+    aggregation[PROVENANCE] = PROVENANCE_SEPARATOR.join
+
+    merged_df = weighted_df.groupby(varying_geometry, sort=False, dropna=False).agg(aggregation).reset_index()
+    for column in numeric_columns:
+        merged_df[column] = merged_df[column] / merged_df[f'__WEIGHT__{column}']
+
+    return merged_df[list(compact_df.columns)]
+
+
+def _encode_categoricals(compact_df: pd.DataFrame,
+                         compact_info: dict,
+                         max_categorical_fraction: float) -> pd.DataFrame:
+    """Store low-cardinality string columns as `pd.Categorical`, and record their categories in `compact_info`."""
+    compact_info['categories'] = {}
+    for column in compact_df.columns:
+        if column == PROVENANCE:
+            continue
+        values = compact_df[column]
+        if pd.api.types.is_string_dtype(values) and values.nunique() <= max_categorical_fraction * len(values):
+            compact_df[column] = values.astype('category')
+            compact_info['categories'][column] = [_to_native(category) for category in compact_df[column].cat.categories]
+
+    return compact_df
+
+
+def _to_native(value):
+    """Convert numpy scalars to python scalars, so they can be written to `.json`."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
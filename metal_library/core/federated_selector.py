@@ -0,0 +1,248 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from metal_library import logging
+from metal_library.core.reader import Reader
+from metal_library.core.selector import Selector
+from metal_library.core.instrumentation import Trace
+
+
+class FederatedSelector:
+    """
+    `Selector` queries across several component libraries at once.
+
+    Every library is read and indexed in a thread pool. A query runs on every library in the same pool,
+    and the results are merged: `find_closest` keeps the `num_top` closest rows over all libraries,
+    `find_in_range` keeps every match. Rows are tagged by (component_name, component_type, index).
+
+    Only characteristics shared by every library can be queried: those declared in each library's
+    `metadata.json` (under its component type) w/ the same units, and present in its CSV.
+    Distances are then in the same units everywhere, so they can be compared across libraries.
+
+    Example:
+    # TransmonPocket has no QubitOnly library yet, it's skipped and its error kept in `selector.errors`
+    selector = FederatedSelector([("TransmonCross", "QubitOnly"), ("TransmonPocket", "QubitOnly")], ignore_errors=True)
+    indexes, characteristics, geometries = selector.find_closest({"Qubit_Frequency_GHz": 5, "Qubit_Anharmonicity_MHz": 200}, num_top=5)
+    indexes.get_level_values("component_name")  # Qubit style of each result
+    """
+
+    __supported_metrics__ = Selector.__supported_metrics__
+
+    def __init__(self,
+                 libraries: list,
+                 memory: str = None,
+                 max_workers: int = None,
+                 ignore_errors: bool = False):
+        """
+        Initalizes FederatedSelector class. Reads every library, concurrently.
+
+        Args:
+            libraries (list): Each one is either
+                - (component_name, component_type), read from `metal_library.library`,
+                - (component_name, component_type, library_path), see `Reader`, or
+                - a `Selector` which is already built.
+            memory (str, optional): Passed to `Reader.read_library`. Defaults to None.
+            max_workers (int, optional): Threads reading libraries and running queries. Defaults to one per library.
+            ignore_errors (bool, optional): Log and skip libraries which fail to load (see `self.errors`),
+                instead of raising. Defaults to False.
+        """
+        entries = {}
+        for library in libraries:
+            if isinstance(library, Selector):
+                key = (library.reader.component_name, library.component_type)
+            elif isinstance(library, (list, tuple)) and len(library) in (2, 3):
+                key = tuple(library[:2])
+            else:
+                raise TypeError("Each library must be (component_name, component_type), "
+                                "(component_name, component_type, library_path), or a `metal_library.Selector`.")
+            if key in entries:
+                raise ValueError(f"{key} is in `libraries` more than once.")
+            entries[key] = library
+        if not entries:
+            raise ValueError("`libraries` is empty.")
+
+        self.memory = memory
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or len(entries), thread_name_prefix="FederatedSelector")
+
+        # (component_name, component_type) -> Selector, in the order of `libraries`
+        self.selectors = {}
+        # (component_name, component_type) -> Exception, of libraries skipped w/ `ignore_errors`
+        self.errors = {}
+        trace = Trace("FederatedSelector.__init__", num_libraries=len(entries))
+        with trace.stage("load"):
+            futures = {key: self._executor.submit(self._load, library) for key, library in entries.items()}
+            for key, future in futures.items():
+                try:
+                    self.selectors[key] = future.result()
+                except Exception as error:
+                    if not ignore_errors:
+                        self.close()
+                        raise
+                    self.errors[key] = error
+                    logging.warning(f"Skipped library {key}: {error!r}")
+        trace.count("libraries", len(self.selectors))
+        self.load_trace = trace.finish()
+
+        if not self.selectors:
+            self.close()
+            raise ValueError(f"None of the libraries could be loaded: {self.errors}")
+
+        self.characteristic_columns, self.units = self._shared_characteristics()
+
+    def _load(self, library) -> Selector:
+        """Read and index one entry of `libraries`. Runs in the thread pool."""
+        if isinstance(library, Selector):
+            return library
+        component_name, component_type, *library_path = library
+        reader = Reader(component_name=component_name, library_path=library_path[0] if library_path else None)
+        if component_type not in reader.metadata.get("component-types", {}):
+            raise ValueError(f"{component_name} has no component type {component_type}")
+        reader.read_library(component_type=component_type, memory=self.memory)
+        return Selector(reader)
+
+    def _shared_characteristics(self) -> tuple[list[str], dict]:
+        """
+        Characteristics every library declares in its `metadata.json` w/ the same units, and has in its CSV.
+
+        Returns:
+            characteristic_columns (list[str]): In the order of the first library.
+            units (dict): Column name -> units.
+        """
+        declared = []
+        for (_, component_type), selector in self.selectors.items():
+            component_types = selector.reader.metadata.get("component-types", {})
+            characteristics = component_types.get(component_type, {}).get("characteristics", [])
+            declared.append({characteristic["column_name"]: characteristic.get("units") for characteristic in characteristics
+                             if characteristic["column_name"] in selector.characteristic.columns})
+
+        columns = [column for column, units in declared[0].items()
+                   if all(column in other and other[column] == units for other in declared[1:])]
+        return columns, {column: declared[0][column] for column in columns}
+
+    def _check_columns(self, params: dict):
+        """Raise if `params` uses a characteristic which isn't shared by every library."""
+        for column in params:
+            if column not in self.characteristic_columns:
+                raise ValueError(f"{column} is not a characteristic shared by every library. Choose from: {self.characteristic_columns}")
+
+    def _map(self, function) -> list:
+        """`function(selector)` for every library, in the thread pool. Results are in the order of `self.selectors`."""
+        if len(self.selectors) == 1:
+            return [function(selector) for selector in self.selectors.values()]
+        return list(self._executor.map(function, self.selectors.values()))
+
+    def find_closest(self,
+                     target_params: dict,
+                     num_top: int,
+                     metric: str = 'Euclidian'):
+        """
+        Select the closest presimulated geometries for a set of characteristics, over every library.
+
+        Args:
+            target_params (dict or list[dict]): Same as `Selector.find_closest`, but keys must be in
+                `self.characteristic_columns`. Pass a list of dictionaries to batch queries.
+            num_top (int): The number of rows to return, over all libraries.
+            metric (str, optional): Metric to determine closeness. Defaults to "Euclidian".
+                                    Must choose from `self.__supported_metrics__`.
+
+        Returns:
+            indexes (pd.MultiIndex): (component_name, component_type, index) of the `num_top` closest rows, closest first.
+                Ties are broken by library order, then by index.
+            characteristics (list[dict]): Associated characteristics, same order as `indexes`.
+            geometries (list[dict]): Geometries in the style of QComponent.options, same order as `indexes`.
+            For a list of dictionaries, a list of those tuples, in the same order.
+        """
+        if metric not in self.__supported_metrics__:
+            raise ValueError(f'`metric` must be one of the following: {self.__supported_metrics__}')
+        queries = [target_params] if isinstance(target_params, dict) else list(target_params)
+        for params in queries:
+            self._check_columns(params)
+        trace = Trace("FederatedSelector.find_closest", num_top=num_top, metric=metric, num_queries=len(queries))
+
+        def find_in_library(selector: Selector) -> tuple[list, int]:
+            found = []
+            library_trace = Trace("Selector._find_index")
+            for params in queries:
+                constraints, _ = selector._split_target_params(params)
+                num_searched = sum(len(labels) for labels, _ in selector._get_partitions(constraints))
+                labels, distances = selector._find_index(params, num_top=num_top, metric=metric, trace=library_trace)
+                found.append((labels, distances, num_searched))
+            return found, library_trace.counters.get("rows_scanned", 0)
+
+        with trace.stage("query"):
+            per_library = self._map(find_in_library)
+        trace.count("rows_scanned", sum(rows_scanned for _, rows_scanned in per_library))
+        trace.count("libraries", len(per_library))
+
+        with trace.stage("merge"):
+            results = []
+            for i, params in enumerate(queries):
+                found = [library_found[i] for library_found, _ in per_library]
+                if num_top > sum(num_searched for _, _, num_searched in found):
+                    raise ValueError('`num_top` cannot be bigger than size of read-in libraries.')
+                results.append(self._merge_closest(found, num_top))
+        trace.finish()
+
+        return results[0] if isinstance(target_params, dict) else results
+
+    def _merge_closest(self, found: list, num_top: int) -> tuple[pd.MultiIndex, list[dict], list[dict]]:
+        """Top `num_top` of every library's top `num_top`. Used in `self.find_closest`."""
+        library_numbers = np.concatenate([np.full(len(labels), i) for i, (labels, _, _) in enumerate(found)])
+        labels = np.concatenate([np.asarray(labels) for labels, _, _ in found])
+        distances = np.concatenate([distances for _, distances, _ in found])
+        top = np.lexsort((labels, library_numbers, distances))[:num_top]
+        return self._tag(library_numbers[top], labels[top])
+
+    def _tag(self, library_numbers: np.ndarray, labels: np.ndarray) -> tuple[pd.MultiIndex, list[dict], list[dict]]:
+        """Rows of several libraries, as (component_name, component_type, index) and their dicts."""
+        keys = list(self.selectors)
+        characteristics, geometries = [], []
+        for library_number, label in zip(library_numbers, labels):
+            selector = self.selectors[keys[library_number]]
+            position = selector._get_positions(pd.Index([label]))[0]
+            characteristics.append(selector.get_characteristic_from_index(index=position))
+            geometries.append(selector.get_geometry_from_index(index=position))
+        indexes = pd.MultiIndex.from_tuples([keys[library_number] + (label,) for library_number, label in zip(library_numbers, labels)],
+                                            names=["component_name", "component_type", "index"])
+        return indexes, characteristics, geometries
+
+    def find_in_range(self, ranges: dict):
+        """
+        Select every presimulated geometry whose characteristics fall w/in some ranges, over every library.
+
+        Args:
+            ranges (dict): Same as `Selector.find_in_range`, but keys must be in `self.characteristic_columns`.
+                           Ex: {"Qubit_Frequency_GHz": [4.9, 5.1], "Qubit_Anharmonicity_MHz": [190, 210]}
+
+        Returns:
+            indexes (pd.MultiIndex): (component_name, component_type, index) of the matching rows.
+                Grouped by library, in the order of `self.selectors`, then in library order.
+            characteristics (list[dict]): Associated characteristics, same order as `indexes`.
+            geometries (list[dict]): Geometries in the style of QComponent.options, same order as `indexes`.
+        """
+        self._check_columns(ranges)
+        trace = Trace("FederatedSelector.find_in_range")
+        with trace.stage("query"):
+            per_library = self._map(lambda selector: selector.find_in_range(ranges))
+        trace.count("libraries", len(per_library))
+        trace.finish()
+
+        tuples, characteristics, geometries = [], [], []
+        for key, (library_indexes, library_characteristics, library_geometries) in zip(self.selectors, per_library):
+            tuples.extend(key + (label,) for label in library_indexes)
+            characteristics.extend(library_characteristics)
+            geometries.extend(library_geometries)
+        indexes = pd.MultiIndex.from_tuples(tuples, names=["component_name", "component_type", "index"])
+        return indexes, characteristics, geometries
+
+    def close(self):
+        """Stop the thread pool."""
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
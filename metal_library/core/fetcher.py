@@ -0,0 +1,365 @@
+import os
+import json
+import hashlib
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from metal_library import logging
+
+'''
+Remote libraries.
+
+A remote library is a component folder (like `metal_library/library/TransmonCross`)
+served over HTTP, next to a `manifest.json` describing every file:
+
+{
+    "files": {
+        "metadata.json": {"sha256": "...", "size": 4242},
+        "QubitOnly.csv": {"sha256": "...", "size": 2965417,
+                          "shards": [{"offset": 0, "size": 1048576, "sha256": "..."}, ...]}
+    }
+}
+
+Run `write_manifest` on the folder before publishing it.
+
+`RemoteLibrary` downloads only the files of the requested component type (files named
+`<component_type>.*`), shard by shard in parallel w/ HTTP range requests. Every shard is stored
+in a `ContentCache` under its sha256, so shards shared between versions of a library, or between
+jobs on the same machine, are only downloaded once. Servers which ignore range requests are
+asked for each file once.
+
+The shards are assembled into a local mirror of the folder, inside the cache directory, which
+counts towards the cache's `max_bytes`.
+
+Example:
+reader = Reader(component_name="TransmonCross", library_path="https://example.org/library/TransmonCross")
+reader.read_library(component_type="QubitOnly")
+'''
+
+MANIFEST_FILE_NAME = "manifest.json"
+DEFAULT_SHARD_SIZE = 8 * 2**20
+DEFAULT_CACHE_DIRECTORY = os.environ.get("METAL_LIBRARY_CACHE",
+                                         os.path.join(os.path.expanduser("~"), ".cache", "metal_library"))
+DEFAULT_MAX_CACHE_BYTES = 10 * 2**30
+
+
+def is_remote_path(path: str) -> bool:
+    """Check if a `library_path` points to a remote library."""
+    return isinstance(path, str) and path.startswith(("http://", "https://"))
+
+
+def write_manifest(directory: str, shard_size: int = DEFAULT_SHARD_SIZE) -> str:
+    """
+    Write `manifest.json` for every file in `directory`, so it can be served as a remote library.
+
+    Args:
+        directory (str): Component folder. Ex: `metal_library/library/TransmonCross`
+        shard_size (int, optional): Files bigger than this are split into shards of this many bytes.
+            Defaults to 8 MiB.
+
+    Returns:
+        manifest_path (str)
+    """
+    files = {}
+    for file_name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, file_name)
+        if file_name == MANIFEST_FILE_NAME or not os.path.isfile(path):
+            continue
+
+        with open(path, 'rb') as file:
+            content = file.read()
+        entry = dict(sha256=hashlib.sha256(content).hexdigest(), size=len(content))
+        if len(content) > shard_size:
+            entry["shards"] = [dict(offset=offset,
+                                    size=len(content[offset:offset + shard_size]),
+                                    sha256=hashlib.sha256(content[offset:offset + shard_size]).hexdigest())
+                               for offset in range(0, len(content), shard_size)]
+        files[file_name] = entry
+
+    manifest_path = os.path.join(directory, MANIFEST_FILE_NAME)
+    with open(manifest_path, 'w') as file:
+        json.dump(dict(files=files), file, indent=4)
+    return manifest_path
+
+
+class ContentCache:
+    """
+    Local store of blobs addressed by their sha256, w/ least-recently-used eviction.
+
+    Blobs live in `<directory>/objects/<first 2 hex digits>/<sha256>`, and the mirrors of
+    `RemoteLibrary` in `<directory>/libraries/<hash of the url>`. Both count towards `max_bytes`.
+    Reading a blob, or fetching a mirrored file, updates its modification time, which is what eviction sorts by.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = DEFAULT_MAX_CACHE_BYTES):
+        """
+        Initalizes ContentCache class.
+
+        Args:
+            directory (str, optional): Cache root. Defaults to `$METAL_LIBRARY_CACHE` or `~/.cache/metal_library`.
+            max_bytes (int, optional): Size the cache is evicted down to. Defaults to 10 GiB.
+        """
+        self.directory = directory if directory is not None else DEFAULT_CACHE_DIRECTORY
+        self.max_bytes = max_bytes
+        self.objects_directory = os.path.join(self.directory, "objects")
+        self.libraries_directory = os.path.join(self.directory, "libraries")
+        os.makedirs(self.objects_directory, exist_ok=True)
+
+    def _path(self, sha256: str) -> str:
+        """Where the blob w/ hash `sha256` is stored."""
+        return os.path.join(self.objects_directory, sha256[:2], sha256)
+
+    def get(self, sha256: str, verify: bool = True) -> bytes:
+        """
+        Read a blob.
+
+        Args:
+            sha256 (str): Hash of the blob.
+            verify (bool, optional): Re-hash the blob, and drop it if it's corrupted. Defaults to True.
+
+        Returns:
+            content (bytes): None if the blob isn't cached (or was corrupted).
+        """
+        path = self._path(sha256)
+        try:
+            with open(path, 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            return None
+
+        if verify and hashlib.sha256(content).hexdigest() != sha256:
+            logging.warning(f"Dropping corrupted cache entry {sha256}")
+            os.remove(path)
+            return None
+
+        os.utime(path)
+        return content
+
+    def put(self, sha256: str, content: bytes):
+        """
+        Store a blob. Raises ValueError if `content` doesn't hash to `sha256`.
+
+        Args:
+            sha256 (str): Expected hash of `content`.
+            content (bytes)
+        """
+        if hashlib.sha256(content).hexdigest() != sha256:
+            raise ValueError(f"Content doesn't match its sha256 ({sha256}).")
+
+        path = self._path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as file:
+            file.write(content)
+        os.replace(temporary_path, path)
+
+    def size(self) -> int:
+        """Total bytes stored, blobs and mirrors."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep: set = None):
+        """
+        Delete least recently used blobs and mirrored files until the cache fits in `self.max_bytes`.
+
+        Args:
+            keep (set, optional): Hashes of blobs, and paths of mirrored files, which must not be evicted.
+                Defaults to None.
+        """
+        keep = keep or set()
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if os.path.basename(path) in keep or path in keep:
+                continue
+            os.remove(path)
+            total -= size
+
+    def _entries(self) -> list[tuple[str, int, float]]:
+        """(path, size, modification time) of every blob and mirrored file."""
+        entries = []
+        for directory in [self.objects_directory, self.libraries_directory]:
+            for root, _, file_names in os.walk(directory):
+                for file_name in file_names:
+                    if file_name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(root, file_name)
+                    stat = os.stat(path)
+                    entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+
+class RemoteLibrary:
+    """
+    Local mirror of a remote component folder, fetched on demand. See the top of `fetcher.py`.
+    """
+
+    def __init__(self,
+                 url: str,
+                 cache: ContentCache = None,
+                 num_workers: int = 8,
+                 timeout: float = 60):
+        """
+        Initalizes RemoteLibrary class, and downloads `manifest.json`.
+
+        Args:
+            url (str): URL of the component folder. Ex: "https://example.org/library/TransmonCross"
+            cache (ContentCache, optional): Where shards are stored. Defaults to `ContentCache()`.
+            num_workers (int, optional): Parallel downloads. Defaults to 8.
+            timeout (float, optional): Seconds before a request fails. Defaults to 60.
+        """
+        self.url = url.rstrip("/")
+        self.cache = cache if cache is not None else ContentCache()
+        self.num_workers = num_workers
+        self.timeout = timeout
+
+        url_hash = hashlib.sha256(self.url.encode()).hexdigest()[:16]
+        self.local_path = os.path.join(self.cache.libraries_directory, url_hash)
+        os.makedirs(self.local_path, exist_ok=True)
+        # Manifest entries of the mirrored files, as of when they were assembled
+        self.local_manifest_path = os.path.join(self.local_path, MANIFEST_FILE_NAME)
+
+        self.manifest = json.loads(self._request(MANIFEST_FILE_NAME)[1])
+
+        # Files which weren't current at the last `self.fetch`
+        self.stale_files = []
+
+    def fetch(self, file_names: list[str]) -> list[str]:
+        """
+        Make sure `file_names` are in `self.local_path` and match the manifest. Only missing shards are downloaded.
+
+        Args:
+            file_names (list[str]): Names of files in the manifest.
+
+        Returns:
+            paths (list[str]): Local paths, same order as `file_names`.
+        """
+        files = self.manifest["files"]
+        missing = [file_name for file_name in file_names if file_name not in files]
+        if missing:
+            raise FileNotFoundError(f"{missing} are not in the manifest of {self.url}")
+
+        paths = [os.path.join(self.local_path, file_name) for file_name in file_names]
+        local_files = self._read_local_manifest()
+        stale = [file_name for file_name, path in zip(file_names, paths) if not self._is_current(file_name, path, local_files)]
+        self.stale_files = stale
+
+        # Shards which aren't cached yet
+        uncached = {file_name: [shard for shard in self._shards(file_name) if self.cache.get(shard["sha256"]) is None]
+                    for file_name in stale}
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            # The first missing shard of every file tells if the server answers range requests.
+            # If it doesn't, the whole file came back, and the other shards are cut from it
+            first_jobs = [(file_name, shards[0]) for file_name, shards in uncached.items() if shards]
+            whole_files = list(executor.map(lambda job: self._fetch_shard(*job), first_jobs))
+            jobs = [(file_name, shard) for (file_name, _), whole_file in zip(first_jobs, whole_files) if not whole_file
+                    for shard in uncached[file_name][1:]]
+            list(executor.map(lambda job: self._fetch_shard(*job), jobs))
+
+        for file_name in stale:
+            self._assemble(file_name)
+            local_files[file_name] = self.manifest["files"][file_name]
+        if stale:
+            self._write_local_manifest(local_files)
+        for file_name, path in zip(file_names, paths):
+            if file_name not in stale:
+                os.utime(path)
+
+        keep = {shard["sha256"] for file_name in file_names for shard in self._shards(file_name)}
+        self.cache.evict(keep=keep | set(paths) | {self.local_manifest_path})
+        return paths
+
+    def fetch_component_type(self, component_type: str) -> list[str]:
+        """
+        Fetch every file belonging to `component_type` (named `<component_type>.*`).
+
+        Args:
+            component_type (str): Ex: "QubitOnly"
+
+        Returns:
+            paths (list[str]): Local paths of the fetched files.
+        """
+        file_names = [file_name for file_name in self.manifest["files"]
+                      if file_name.split(".")[0] == component_type]
+        return self.fetch(file_names)
+
+    def _shards(self, file_name: str) -> list[dict]:
+        """Shards of a file. Files w/o shards are one shard."""
+        entry = self.manifest["files"][file_name]
+        return entry.get("shards", [dict(offset=0, size=entry["size"], sha256=entry["sha256"])])
+
+    def _read_local_manifest(self) -> dict:
+        """Manifest entries of the mirrored files. Empty if the mirror has none."""
+        try:
+            with open(self.local_manifest_path) as file:
+                return json.load(file)["files"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return {}
+
+    def _write_local_manifest(self, files: dict):
+        """Atomically replace the manifest of the mirror."""
+        temporary_path = f"{self.local_manifest_path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w') as file:
+            json.dump(dict(files=files), file, indent=4)
+        os.replace(temporary_path, self.local_manifest_path)
+
+    def _is_current(self, file_name: str, path: str, local_files: dict) -> bool:
+        """
+        Check if the local copy of `file_name` exists, has the manifest's size, and was assembled
+        from the manifest's hash. Files were verified when assembled, so they aren't re-hashed.
+        """
+        entry = self.manifest["files"][file_name]
+        if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+            return False
+        return local_files.get(file_name, {}).get("sha256") == entry["sha256"]
+
+    def _fetch_shard(self, file_name: str, shard: dict) -> bool:
+        """
+        Download one shard into the cache.
+
+        Returns:
+            whole_file (bool): The server ignored the range request and sent the whole file,
+                so every shard of `file_name` was stored.
+        """
+        entry = self.manifest["files"][file_name]
+        byte_range = None
+        if shard["size"] != entry["size"]:
+            byte_range = (shard["offset"], shard["offset"] + shard["size"] - 1)
+
+        status, content = self._request(file_name, byte_range)
+        if byte_range is not None and status != 206:
+            logging.info(f"{self.url} ignored a range request, {file_name} was downloaded whole")
+            for other_shard in self._shards(file_name):
+                self.cache.put(other_shard["sha256"], content[other_shard["offset"]:other_shard["offset"] + other_shard["size"]])
+            return True
+        self.cache.put(shard["sha256"], content)
+        return False
+
+    def _assemble(self, file_name: str):
+        """Concatenate the cached shards of `file_name` into `self.local_path`, and verify the result."""
+        entry = self.manifest["files"][file_name]
+        path = os.path.join(self.local_path, file_name)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+
+        digest = hashlib.sha256()
+        with open(temporary_path, 'wb') as file:
+            for shard in self._shards(file_name):
+                content = self.cache.get(shard["sha256"], verify=False)
+                if content is None:
+                    raise FileNotFoundError(f"Shard {shard['sha256']} of {file_name} was evicted before it was used.")
+                digest.update(content)
+                file.write(content)
+
+        if digest.hexdigest() != entry["sha256"]:
+            os.remove(temporary_path)
+            raise ValueError(f"{file_name} doesn't match the sha256 in the manifest of {self.url}")
+        os.replace(temporary_path, path)
+
+    def _request(self, file_name: str, byte_range: tuple[int, int] = None) -> tuple[int, bytes]:
+        """GET `<self.url>/<file_name>`, optionally w/ an inclusive byte range. Returns (status, content)."""
+        request = urllib.request.Request(f"{self.url}/{file_name}")
+        if byte_range is not None:
+            request.add_header("Range", f"bytes={byte_range[0]}-{byte_range[1]}")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.status, response.read()
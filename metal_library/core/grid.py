@@ -0,0 +1,312 @@
+import numpy as np
+import pandas as pd
+from scipy.interpolate import RegularGridInterpolator
+
+from metal_library.core.reader_helperfunctions import parse_unit_column, split_unit, float32_to_float, UNIT_PATTERN
+from metal_library.core.misc_extractor import MISC_FIELDS
+
+'''
+Regular-grid libraries.
+
+Sweeps from `QSweeper` (through `extract_QSweep_parameters`) cover the full Cartesian product
+of the swept geometry parameters. When the rows of a library (or of a partition of it) do,
+`RegularGrid` stores their numeric characteristics as an N-D array indexed by the position
+of each swept value along its axis. Then:
+    - looking up the characteristics of a simulated geometry is O(1), by indexing,
+    - characteristics between simulated geometries are interpolated on the grid
+      (multilinear or splines, `scipy.interpolate.RegularGridInterpolator`), vectorized over many geometries.
+
+Axes don't have to be evenly spaced (e.g. ground_spacing = 4, 5, 7, 9, 10um).
+Geometries simulated more than once keep their last row.
+
+Example:
+reader = Reader(component_name="TransmonCross")
+reader.read_library(component_type="QubitOnly")
+grid = reader.get_grid()
+grid.lookup({"cross_length": "195um", "connection_pads.readout.claw_length": "185um", ...})
+grid.interpolate(candidate_geometries, method="cubic")
+'''
+
+
+class RegularGrid:
+    """
+    Numeric characteristics of a library on the grid of its swept geometry columns. See the top of `grid.py`.
+    """
+
+    __supported_interpolation_methods__ = ['linear', 'nearest', 'slinear', 'cubic', 'quintic', 'pchip']
+
+    def __init__(self,
+                 axis_columns: list[str],
+                 axes: list[np.ndarray],
+                 labels: np.ndarray,
+                 values: np.ndarray,
+                 characteristic_columns: list[str],
+                 units: dict = None):
+        """
+        Initalizes RegularGrid class. Use `RegularGrid.detect` to build one from a library.
+
+        Args:
+            axis_columns (list[str]): Swept geometry columns, as named in the library.
+            axes (list[np.ndarray]): Sorted values along each axis.
+            labels (np.ndarray): Shape `self.shape`. Library index label of each grid point.
+            values (np.ndarray): Shape `self.shape + (len(characteristic_columns),)`.
+            characteristic_columns (list[str]): Numeric characteristic columns in `values`.
+            units (dict, optional): Axis column -> unit of `axes` (e.g. "um"). Defaults to {}.
+        """
+        self.axis_columns = list(axis_columns)
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.labels = labels
+        self.values = values
+        self.characteristic_columns = list(characteristic_columns)
+        self.units = dict(units) if units else {}
+
+        # Value -> position along each axis, for O(1) lookups
+        self._positions = [{self._key(value): position for position, value in enumerate(axis)} for axis in self.axes]
+        self._interpolators = {}
+
+    @property
+    def shape(self) -> tuple:
+        return tuple(len(axis) for axis in self.axes)
+
+    @classmethod
+    def detect(cls,
+               geometry: pd.DataFrame,
+               characteristic: pd.DataFrame,
+               units: dict = None) -> 'RegularGrid':
+        """
+        Check if the rows of a library form a full grid over their varying geometry columns.
+
+        Args:
+            geometry (pd.DataFrame): Ex: `Reader.library.geometry`, or a partition of it.
+            characteristic (pd.DataFrame): Same index as `geometry`.
+            units (dict, optional): Units of geometry columns already parsed into numbers,
+                ex: `Reader.library.units`. Defaults to {}.
+
+        Returns:
+            grid (RegularGrid): None if the rows don't form a grid, or a varying geometry column isn't numeric.
+        """
+        partition_columns, grids = detect_grids(geometry, characteristic, units=units)
+        return None if partition_columns else grids.get(())
+
+    @classmethod
+    def from_numeric_geometry(cls, numeric_geometry: pd.DataFrame, characteristic: pd.DataFrame, units: dict = None) -> 'RegularGrid':
+        """`self.detect` for geometries already parsed into numbers. Used in `detect_grids` and `LocalJacobian`."""
+        units = units if units else {}
+        varying = [column for column in numeric_geometry.columns if numeric_geometry[column].nunique(dropna=False) > 1]
+        if not varying or numeric_geometry[varying].isna().any().any():
+            return None
+
+        axes = []
+        codes = []
+        for column in varying:
+            axis, code = np.unique(numeric_geometry[column].to_numpy(), return_inverse=True)
+            axes.append(axis)
+            codes.append(code)
+
+        shape = tuple(len(axis) for axis in axes)
+        if np.prod(shape, dtype=float) > len(numeric_geometry):
+            # More grid points than rows, can't be full
+            return None
+        flat = np.ravel_multi_index(codes, shape)
+        # Position of the last row of each grid point
+        reversed_unique, reversed_first = np.unique(flat[::-1], return_index=True)
+        if len(reversed_unique) != np.prod(shape):
+            return None
+        last = len(flat) - 1 - reversed_first
+
+        characteristic_columns = [column for column in characteristic.columns
+                                  if column.strip() not in MISC_FIELDS
+                                  and not isinstance(characteristic[column].dtype, pd.CategoricalDtype)
+                                  and not pd.api.types.is_bool_dtype(characteristic[column])
+                                  and pd.api.types.is_numeric_dtype(characteristic[column])]
+        values = characteristic[characteristic_columns].to_numpy(dtype=float, na_value=np.nan)[last]
+        labels = characteristic.index.to_numpy()[last]
+
+        return cls(axis_columns=varying,
+                   axes=axes,
+                   labels=labels.reshape(shape),
+                   values=values.reshape(shape + (len(characteristic_columns),)),
+                   characteristic_columns=characteristic_columns,
+                   units={column: unit for column, unit in units.items() if column in varying})
+
+    @staticmethod
+    def _key(value: float) -> float:
+        """Hashable form of an axis value, insensitive to float noise from unit conversions."""
+        return float(f"{value:.12g}")
+
+    def _parse_value(self, column: str, value) -> float:
+        """Number in units of `self.units[column]`. Strings w/ units (ex: "0.195mm") are converted."""
+        if not isinstance(value, str):
+            return float(value)
+        match = UNIT_PATTERN.match(value)
+        if match is None:
+            raise ValueError(f"`{column}` must be a number or a number w/ units, not {value!r}.")
+        number, unit = float(match.group(1)), match.group(2)
+        axis_unit = self.units.get(column, unit)
+        if unit == axis_unit or not unit:
+            return number
+        scale, base = split_unit(unit)
+        axis_scale, axis_base = split_unit(axis_unit)
+        if base != axis_base:
+            raise ValueError(f"`{column}` is in {axis_unit}, {value!r} can't be converted.")
+        return number * scale / axis_scale
+
+    def _parse_points(self, points) -> np.ndarray:
+        """
+        Geometries -> array of shape (N, len(self.axis_columns)).
+
+        Args:
+            points (dict or pd.DataFrame): Keys / columns are axis columns, w/ or w/o surrounding whitespace.
+                Values are numbers or strings w/ units. Other keys are ignored.
+        """
+        stripped = {str(column).strip(): column for column in (points.keys() if isinstance(points, dict) else points.columns)}
+        missing = [column for column in self.axis_columns if column.strip() not in stripped]
+        if missing:
+            raise ValueError(f"Geometries are missing the grid columns: {missing}")
+        if isinstance(points, dict):
+            points = pd.DataFrame({stripped[column.strip()]: np.atleast_1d(points[stripped[column.strip()]])
+                                   for column in self.axis_columns})
+
+        parsed = np.empty((len(points), len(self.axis_columns)))
+        for i, column in enumerate(self.axis_columns):
+            values = points[stripped[column.strip()]]
+            if pd.api.types.is_numeric_dtype(values):
+                parsed[:, i] = values.to_numpy(dtype=float)
+            else:
+                parsed[:, i] = [self._parse_value(column, value) for value in values]
+        return parsed
+
+    def lookup_index(self, geometry: dict):
+        """
+        Library index label of a simulated geometry, in O(1).
+
+        Args:
+            geometry (dict): Axis column -> value, ex: {"cross_length": "195um", ...}.
+
+        Returns:
+            label: None if `geometry` isn't a grid point.
+        """
+        position = self._grid_position(geometry)
+        return None if position is None else self.labels[position].item()
+
+    def lookup(self, geometry: dict) -> dict:
+        """
+        Characteristics of a simulated geometry, in O(1).
+
+        Args:
+            geometry (dict): Axis column -> value, ex: {"cross_length": "195um", ...}.
+
+        Returns:
+            characteristics (dict): Numeric characteristic -> value. None if `geometry` isn't a grid point.
+        """
+        position = self._grid_position(geometry)
+        return None if position is None else dict(zip(self.characteristic_columns, self.values[position].tolist()))
+
+    def _grid_position(self, geometry: dict) -> tuple:
+        """Position of `geometry` along every axis, or None if it isn't a grid point."""
+        positions = []
+        for position_of, value in zip(self._positions, self._parse_points(geometry)[0]):
+            position = position_of.get(self._key(value))
+            if position is None:
+                return None
+            positions.append(position)
+        return tuple(positions)
+
+    def interpolate(self, points, method: str = 'linear') -> pd.DataFrame:
+        """
+        Interpolate the characteristics of many geometries on the grid at once.
+
+        Args:
+            points (dict or pd.DataFrame): Geometries, see `self._parse_points`.
+            method (str, optional): Must choose from `self.__supported_interpolation_methods__`.
+                Spline methods need enough points along every axis (ex: 4 for "cubic"). Defaults to "linear".
+
+        Returns:
+            characteristics (pd.DataFrame): One row per geometry, columns `self.characteristic_columns`.
+                NaN outside of the grid.
+        """
+        if method not in self.__supported_interpolation_methods__:
+            raise ValueError(f'`method` must be one of the following: {self.__supported_interpolation_methods__}')
+        parsed = self._parse_points(points)
+
+        if method not in self._interpolators:
+            try:
+                self._interpolators[method] = RegularGridInterpolator(self.axes, self.values, method=method,
+                                                                      bounds_error=False, fill_value=np.nan)
+            except ValueError as error:
+                raise ValueError(f"Can't interpolate w/ `method` {method!r} on a grid of shape {self.shape}: {error}") from None
+
+        index = points.index if isinstance(points, pd.DataFrame) else None
+        return pd.DataFrame(self._interpolators[method](parsed), columns=self.characteristic_columns, index=index)
+
+
+def detect_grids(geometry: pd.DataFrame,
+                 characteristic: pd.DataFrame,
+                 categorical_columns: list[str] = (),
+                 units: dict = None) -> tuple[list[str], dict]:
+    """
+    Split a library into partitions, and detect which ones are regular grids. Used in `Reader.detect_grids`.
+
+    Args:
+        geometry (pd.DataFrame): Ex: `Reader.library.geometry`.
+        characteristic (pd.DataFrame): Ex: `Reader.library.characteristic`.
+        categorical_columns (list[str], optional): Categorical characteristics to partition by. Defaults to ().
+        units (dict, optional): Units of geometry columns already parsed into numbers,
+            ex: `Reader.library.units`. Defaults to {}.
+
+    Returns:
+        partition_columns (list[str]): `categorical_columns`, then varying geometry columns which aren't numbers
+            (ex: `gds_cell_name`). They can't be grid axes, so they partition the library too.
+        grids (dict): Partition key (tuple of values, same order as `partition_columns`) -> RegularGrid.
+            Partitions which aren't grids are left out. A library w/o partition columns has a single key, `()`.
+    """
+    units = dict(units) if units else {}
+    varying = [column for column in geometry.columns if geometry[column].nunique(dropna=False) > 1]
+    numeric_geometry = {}
+    for column in varying:
+        numbers = _parse_swept_column(geometry[column])
+        if numbers is not None:
+            numeric_geometry[column], unit = numbers
+            if column not in units and unit is not None:
+                units[column] = unit
+    numeric_geometry = pd.DataFrame(numeric_geometry, index=geometry.index)
+
+    categorical_geometry = [column for column in varying if column not in numeric_geometry.columns]
+    partition_columns = list(categorical_columns) + categorical_geometry
+    if partition_columns:
+        partition_values = pd.concat([characteristic[list(categorical_columns)], geometry[categorical_geometry]], axis=1)
+        groups = partition_values.groupby(partition_columns, sort=False, dropna=False, observed=True).indices
+    else:
+        groups = {(): np.arange(len(geometry))}
+
+    grids = {}
+    for key, positions in groups.items():
+        key = key if isinstance(key, tuple) else (key,)
+        grid = RegularGrid.from_numeric_geometry(numeric_geometry.iloc[positions], characteristic.iloc[positions], units)
+        if grid is not None:
+            grids[key] = grid
+    return partition_columns, grids
+
+
+def _parse_swept_column(values: pd.Series):
+    """
+    Numbers of a geometry column, like `parse_geometry`, but only parsing each unique value once.
+    float32 columns from `Reader.read_library(..., memory='compact')` go back to the floats written in the library.
+
+    Returns:
+        (numbers, unit) (tuple[np.ndarray, str]): `unit` is None for numeric columns.
+        None if the column isn't numbers or strings w/ units.
+    """
+    codes, unique_values = pd.factorize(values, use_na_sentinel=False)
+    unique_values = pd.Series(np.asarray(unique_values))
+    if pd.api.types.is_bool_dtype(unique_values):
+        return None
+    if pd.api.types.is_numeric_dtype(unique_values):
+        if unique_values.dtype == np.float32:
+            return np.array([float32_to_float(value) for value in unique_values])[codes], None
+        return unique_values.to_numpy(dtype=float)[codes], None
+
+    parsed = parse_unit_column(unique_values)
+    if parsed is None:
+        return None
+    return parsed[0][codes], parsed[1]
@@ -0,0 +1,340 @@
+import os
+import io
+import glob
+import json
+import hashlib
+import datetime
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import metal_library
+from metal_library import logging
+from metal_library.core.compactor import (SPLITTER, append_compact_library, save_compact_library,
+                                          load_compact_library, has_compact_library)
+from metal_library.core.misc_extractor import (MISC_COLUMN, extract_misc, has_misc_fields, collapse_misc_fields,
+                                               cold_storage_path, append_cold_storage)
+
+
+class Ingestor:
+    """
+    Merges sweep outputs (written by `QLibrarian.append_csv` / `QLibrarian.export_csv`)
+    into `metal_library.library.component_name.component_type.csv`.
+
+    Every file in a drop directory is hashed, validated and normalized in a process pool.
+    Files whose content hash is already in `ingested.json` are skipped, so the same
+    drop directory can be ingested over and over as new sweep files land in it.
+
+    The `misc` column is replaced by typed columns, and its raw text is appended to
+    `component_type.misc.jsonl.gz` (see `metal_library.core.misc_extractor`). Libraries which
+    still store the raw `misc` column are left as they are, until converted w/ `extract_library_misc`.
+
+    Example:
+    ingestor = Ingestor(component_name="TransmonCross")
+    ingestor.ingest("path/to/drop", component_type="QubitOnly",
+                    author={"name": ["Clark Miyamoto"], "pi": ["Eli Levenson-Falk"], "institution": ["USC"]})
+
+    Command line:
+    python -m metal_library.core.ingestor path/to/drop TransmonCross QubitOnly --name "Clark Miyamoto"
+    """
+
+    ledger_file_name = "ingested.json"
+
+    def __init__(self,
+                 component_name: str,
+                 library_path: str = None,
+                 num_workers: int = None,
+                 extract_misc: bool = True):
+        """
+        Initalizes Ingestor class.
+
+        Args:
+            component_name (str): Name of the component to ingest into.
+                                  This is the name of a folder in `metal_library.library`.
+            library_path (str, optional): Path to components library. Same as `Reader`.
+                It defaults to "metal_library/library"
+            num_workers (int, optional): Number of processes used to validate files.
+                Use 1 to validate in this process. Defaults to `os.cpu_count()`.
+            extract_misc (bool, optional): Extract `misc` into typed columns when starting a new library.
+                Libraries which already have the typed columns are always extracted into. Defaults to True.
+        """
+        self.component_name = component_name
+        if (library_path == None):
+            self.path = os.path.join(metal_library.__library_path__, component_name)
+        else:
+            self.path = library_path
+        self.num_workers = num_workers
+        self.extract_misc = extract_misc
+
+        self.metadata_path = os.path.join(self.path, "metadata.json")
+        with open(self.metadata_path, 'r') as file:
+            self.metadata = json.load(file)
+
+        self.ledger_path = os.path.join(self.path, self.ledger_file_name)
+        if os.path.exists(self.ledger_path):
+            with open(self.ledger_path, 'r') as file:
+                self.ledger = json.load(file)
+        else:
+            self.ledger = {}
+
+        # Derived caches to bring up to date after new rows are appended.
+        # Each is called as `updater(component_type, new_df, first_row)`.
+        self.cache_updaters = [self._update_compact_cache]
+
+    def ingest(self,
+               drop_directory: str,
+               component_type: str,
+               author: dict = None,
+               pattern: str = "*.csv") -> list[str]:
+        """
+        Append every new, valid sweep file in `drop_directory` to the library.
+
+        Args:
+            drop_directory (str): Directory to scan.
+            component_type (str): Type of component. Must be in `metadata.json`'s "component-types".
+            author (dict, optional): Contributor of the sweeps, in the style of `metadata.json`.
+                Ex: {"name": [...], "pi": [...], "institution": [...]}
+                If given, their line range for `component_type` is updated. Defaults to None.
+            pattern (str, optional): Glob pattern for sweep files. Defaults to "*.csv".
+
+        Returns:
+            ingested_files (list[str]): Paths of files appended to the library, in order.
+        """
+        if component_type not in self.metadata["component-types"]:
+            raise ValueError(f'`component_type` must be from the following: {list(self.metadata["component-types"])}')
+
+        library_csv_path = os.path.join(self.path, str(component_type) + ".csv")
+        columns = self._get_library_columns(library_csv_path)
+
+        file_paths = sorted(glob.glob(os.path.join(drop_directory, pattern)))
+        known_hashes = set(self.ledger)
+        extract = has_misc_fields(columns) if columns is not None else self.extract_misc
+        jobs = [(file_path, columns, known_hashes, extract) for file_path in file_paths]
+
+        if (self.num_workers == 1):
+            results = [_validate_sweep_file(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                results = list(executor.map(_validate_sweep_file, *zip(*jobs))) if jobs else []
+
+        ingested_files = []
+        first_row = self._count_library_rows(library_csv_path)
+        for file_path, content_hash, df, raw_misc, error in results:
+            if df is None:
+                if error is not None:
+                    logging.warning(f"Skipping {file_path}: {error}")
+                continue
+            if content_hash in self.ledger:
+                # Same file dropped twice in one batch
+                continue
+            if columns is None:
+                columns = list(df.columns)
+            elif list(df.columns) != columns:
+                logging.warning(f"Skipping {file_path}: columns don't match the first ingested file.")
+                continue
+
+            self._append_rows(library_csv_path, df)
+            if raw_misc is not None:
+                append_cold_storage(cold_storage_path(library_csv_path), raw_misc, first_row=first_row)
+
+            # Recorded as soon as the rows are in the library, so a failure later on can't append them twice
+            self.ledger[content_hash] = dict(file_name=os.path.basename(file_path),
+                                             component_type=component_type,
+                                             rows=[first_row, first_row + len(df)],
+                                             ingested=datetime.datetime.now().isoformat(timespec='seconds'))
+            self._write_json(self.ledger_path, self.ledger)
+            if author is not None:
+                self._update_contributor(author, component_type, first_row, first_row + len(df))
+                self._write_json(self.metadata_path, self.metadata)
+
+            for updater in self.cache_updaters:
+                updater(component_type, df, first_row)
+
+            first_row += len(df)
+            ingested_files.append(file_path)
+            logging.info(f"Ingested {len(df)} rows from {file_path}")
+
+        return ingested_files
+
+    def _get_library_columns(self, library_csv_path: str) -> list[str]:
+        """Column names of the library `.csv`, or None if it doesn't exist / is empty."""
+        if not os.path.exists(library_csv_path) or os.path.getsize(library_csv_path) == 0:
+            return None
+        return list(pd.read_csv(library_csv_path, nrows=0).columns)
+
+    def _count_library_rows(self, library_csv_path: str) -> int:
+        """Number of rows in the library `.csv`."""
+        if self._get_library_columns(library_csv_path) is None:
+            return 0
+        return len(pd.read_csv(library_csv_path, usecols=[0]))
+
+    def _append_rows(self, library_csv_path: str, df: pd.DataFrame):
+        """Append `df` to the library `.csv`, writing the header if the library is empty."""
+        write_header = self._get_library_columns(library_csv_path) is None
+
+        # The library .csv's don't always end w/ a newline
+        needs_newline = False
+        if not write_header:
+            with open(library_csv_path, 'rb') as file:
+                file.seek(-1, os.SEEK_END)
+                needs_newline = file.read(1) != b'\n'
+
+        with open(library_csv_path, 'a', newline='') as file:
+            if needs_newline:
+                file.write('\n')
+            df.to_csv(file, index=False, header=write_header)
+
+    def _update_compact_cache(self, component_type: str, new_df: pd.DataFrame, first_row: int):
+        """
+        Update `component_type.compact.*` (see `Reader.compact_library`) if it exists.
+        Rows missed by an earlier, failed update are read back from the library `.csv` first.
+        """
+        path_prefix = os.path.join(self.path, str(component_type))
+        if not has_compact_library(path_prefix):
+            return
+        compact_df, compact_info = load_compact_library(path_prefix)
+        num_missed = first_row - compact_info['num_rows']
+        if num_missed > 0:
+            missed_df = pd.read_csv(path_prefix + ".csv", skiprows=range(1, compact_info['num_rows'] + 1), nrows=num_missed)
+            compact_df, compact_info = append_compact_library(compact_df, compact_info, missed_df, first_row=compact_info['num_rows'])
+        compact_df, compact_info = append_compact_library(compact_df, compact_info, new_df, first_row=first_row)
+        save_compact_library(compact_df, compact_info, path_prefix)
+
+    def _update_contributor(self, author: dict, component_type: str, start: int, end: int):
+        """
+        Record rows [start, end) of `component_type` as contributed by `author` in `self.metadata`.
+        Extends the author's existing range if it ends at `start`, otherwise adds a new author entry.
+        """
+        authors = self.metadata["contributors"]["simulation"]["authors"]
+        for entry in authors:
+            if entry.get("name") != author.get("name"):
+                continue
+            contribution = entry.setdefault("contribution", {})
+            if not isinstance(contribution, dict):
+                continue
+            line_range = contribution.setdefault(component_type, dict(csv_startline=None, csv_endline=None, method_path=None))
+            if line_range["csv_startline"] is None:
+                line_range["csv_startline"], line_range["csv_endline"] = start, end
+                return
+            if line_range["csv_endline"] == start:
+                line_range["csv_endline"] = end
+                return
+
+        new_entry = dict(author)
+        new_entry["contribution"] = {component_type: dict(csv_startline=start, csv_endline=end, method_path=None)}
+        authors.append(new_entry)
+
+    @staticmethod
+    def _write_json(path: str, data: dict):
+        """Atomically write `data` to `path`, w/ the same formatting as `metadata.json`."""
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w') as file:
+            json.dump(data, file, indent=4)
+        os.replace(temporary_path, path)
+
+
+def _validate_sweep_file(file_path: str, columns: list[str], known_hashes: set, extract: bool = False):
+    """
+    Hash, validate and normalize one sweep file. Runs in a worker process of `Ingestor.ingest`.
+
+    Accepts files w/ a header (`QLibrarian.export_csv`) and w/o one (`QLibrarian.append_csv`),
+    w/ the raw `misc` column or w/ its typed columns.
+
+    Args:
+        file_path (str): Sweep file.
+        columns (list[str]): Library column names, or None if the library is empty.
+        known_hashes (set): Content hashes which have already been ingested.
+        extract (bool, optional): Replace a raw `misc` column w/ typed columns. Defaults to False.
+
+    Returns:
+        file_path (str)
+        content_hash (str): sha256 of the file.
+        df (pd.DataFrame): Normalized rows w/ the library's column names, or None.
+        raw_misc (pd.Series): Raw `misc` text, if it was extracted. Otherwise None.
+        error (str): Why the file was rejected, or None.
+    """
+    with open(file_path, 'rb') as file:
+        content = file.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+    if content_hash in known_hashes:
+        return file_path, content_hash, None, None, None
+
+    raw_misc = None
+
+    try:
+        text = content.decode('utf-8')
+        first_line = text.split('\n', 1)[0]
+        has_header = SPLITTER in [name.strip() for name in first_line.split(',')]
+
+        if has_header:
+            df = pd.read_csv(io.StringIO(text))
+            misc_column = [column for column in df.columns if column.strip() == MISC_COLUMN]
+            if extract and misc_column:
+                df, raw_misc = extract_misc(df, column=misc_column[0])
+            if columns is not None:
+                stripped_columns = {column.strip(): column for column in columns}
+                if sorted(stripped_columns) != sorted(column.strip() for column in df.columns):
+                    return file_path, content_hash, None, None, "columns don't match the library."
+                df = df.rename(columns=lambda column: stripped_columns[column.strip()])[columns]
+        else:
+            if columns is None:
+                return file_path, content_hash, None, None, "file has no header and the library is empty."
+            df = pd.read_csv(io.StringIO(text), header=None)
+            raw_columns = collapse_misc_fields(columns) if extract else columns
+            if df.shape[1] == len(columns):
+                df.columns = columns
+            elif df.shape[1] == len(raw_columns):
+                df.columns = raw_columns
+                df, raw_misc = extract_misc(df)
+            else:
+                return file_path, content_hash, None, None, f"expected {len(columns)} columns, found {df.shape[1]}."
+
+        splitter_column = [column for column in df.columns if column.strip() == SPLITTER][0]
+        splitter_loc = df.columns.get_loc(splitter_column)
+
+        if splitter_loc == 0:
+            return file_path, content_hash, None, None, "no geometry columns."
+
+        # Drop repeated header rows, and rows w/o any characteristics
+        first_column = df.columns[0]
+        df = df[df[first_column].astype(str).str.strip() != first_column.strip()]
+        df = df.dropna(how='all', subset=list(df.columns[splitter_loc + 1:]))
+
+        if not df[splitter_column].isna().all():
+            return file_path, content_hash, None, None, f"`{SPLITTER}` column isn't empty."
+        if len(df) == 0:
+            return file_path, content_hash, None, None, "no rows."
+    except Exception as error:
+        return file_path, content_hash, None, None, f"couldn't parse file ({error})."
+
+    if raw_misc is not None:
+        raw_misc = raw_misc.loc[df.index].reset_index(drop=True)
+    return file_path, content_hash, df.reset_index(drop=True), raw_misc, None
+
+
+def main(args=None):
+    """Command line entry point. See `python -m metal_library.core.ingestor --help`."""
+    parser = argparse.ArgumentParser(description="Ingest sweep outputs into metal_library.library")
+    parser.add_argument("drop_directory", help="Directory containing sweep .csv files")
+    parser.add_argument("component_name", help="Ex: TransmonCross")
+    parser.add_argument("component_type", help="Ex: QubitOnly")
+    parser.add_argument("--library-path", default=None, help="Defaults to metal_library/library/<component_name>")
+    parser.add_argument("--pattern", default="*.csv")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--name", action="append", default=None, help="Contributor name (repeatable)")
+    parser.add_argument("--pi", action="append", default=[])
+    parser.add_argument("--institution", action="append", default=[])
+    args = parser.parse_args(args)
+
+    author = None
+    if args.name:
+        author = dict(name=args.name, pi=args.pi, institution=args.institution)
+
+    ingestor = Ingestor(args.component_name, library_path=args.library_path, num_workers=args.workers)
+    ingested_files = ingestor.ingest(args.drop_directory, args.component_type, author=author, pattern=args.pattern)
+    print(f"Ingested {len(ingested_files)} file(s).")
+
+
+if __name__ == '__main__':
+    main()
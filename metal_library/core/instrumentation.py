@@ -0,0 +1,189 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from metal_library import logging
+
+'''
+Instrumentation of `Reader.read_library` and `Selector`.
+
+Every instrumented call fills a `Trace`: seconds spent in each stage (parse, split, index build,
+distance, top-k, dict conversion, ...), counters (rows scanned, ...) and whether a cache was hit.
+Finished traces are sent to every registered sink as a dict:
+
+{
+    "operation": "Selector.find_closest",
+    "total_seconds": 0.0012,
+    "stages": {"distance": 0.0002, "top_k": 0.0001, "dict_conversion": 0.0008},
+    "counters": {"rows_scanned": 728, "partitions_scanned": 1, "delta_rows": 0},
+    "cache": None,  # or "hit" / "miss"
+    "info": {"num_top": 3, "metric": "Euclidian"}
+}
+
+`Selector.find_closest(..., explain=True)` also returns it.
+
+Sinks are any callable taking that dict, or a `PrometheusTextfileSink` for dashboards.
+
+Example:
+from metal_library.core import instrumentation
+instrumentation.add_sink(print)
+instrumentation.add_sink(instrumentation.PrometheusTextfileSink("/var/lib/node_exporter/metal_library.prom"))
+'''
+
+_sinks = []
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink):
+    """
+    Send every finished trace to `sink`.
+
+    Args:
+        sink (callable): Called w/ the trace dict. Exceptions it raises are logged, not propagated.
+    """
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def remove_sink(sink):
+    """Stop sending traces to `sink`."""
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+
+def emit(record: dict):
+    """Send a trace dict to every sink."""
+    with _sinks_lock:
+        sinks = list(_sinks)
+    for sink in sinks:
+        try:
+            sink(record)
+        except Exception:
+            logging.exception(f"Instrumentation sink {sink} failed")
+
+
+class Trace:
+    """
+    Timings and counters of one instrumented call. See the top of `instrumentation.py`.
+    """
+
+    def __init__(self, operation: str, **info):
+        """
+        Initalizes Trace class, and starts its clock.
+
+        Args:
+            operation (str): Ex: "Selector.find_closest"
+            **info: Parameters of the call worth reporting. Ex: num_top=3
+        """
+        self.operation = operation
+        self.info = info
+        self.stages = {}
+        self.counters = {}
+        self.cache = None
+        self._start = time.perf_counter()
+        self.total_seconds = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the body of a `with` block as stage `name`. Repeated stages add up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name: str, value: int = 1):
+        """Add `value` to counter `name`."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self) -> dict:
+        """Stop the clock, send the trace to the sinks, and return it as a dict."""
+        self.total_seconds = time.perf_counter() - self._start
+        record = self.to_dict()
+        if _sinks:
+            emit(record)
+        return record
+
+    def to_dict(self) -> dict:
+        return dict(operation=self.operation,
+                    total_seconds=self.total_seconds,
+                    stages=dict(self.stages),
+                    counters=dict(self.counters),
+                    cache=self.cache,
+                    info=dict(self.info))
+
+
+def _escape_label_value(value) -> str:
+    """Escape a Prometheus label value: backslashes, double quotes and newlines."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusTextfileSink:
+    """
+    Sink which accumulates traces into counters, and writes them in the Prometheus text format
+    (e.g. for node_exporter's textfile collector).
+
+    Metrics:
+        metal_library_operations_total{operation}
+        metal_library_operation_seconds_total{operation}
+        metal_library_stage_seconds_total{operation, stage}
+        metal_library_<counter>_total{operation}          Ex: metal_library_rows_scanned_total
+        metal_library_cache_total{operation, result}
+    """
+
+    def __init__(self, path: str, min_interval: float = 0.0):
+        """
+        Initalizes PrometheusTextfileSink class.
+
+        Args:
+            path (str): File to (over)write. Ex: "/var/lib/node_exporter/metal_library.prom"
+            min_interval (float, optional): Seconds between writes. Traces in between are still counted,
+                and `self.write` flushes them. Defaults to 0.
+        """
+        self.path = path
+        self.min_interval = min_interval
+        self.metrics = {}
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, record: dict):
+        operation = record["operation"]
+        with self._lock:
+            self._add("metal_library_operations_total", dict(operation=operation), 1)
+            self._add("metal_library_operation_seconds_total", dict(operation=operation), record["total_seconds"])
+            for stage, seconds in record["stages"].items():
+                self._add("metal_library_stage_seconds_total", dict(operation=operation, stage=stage), seconds)
+            for counter, value in record["counters"].items():
+                self._add(f"metal_library_{counter}_total", dict(operation=operation), value)
+            if record["cache"] is not None:
+                self._add("metal_library_cache_total", dict(operation=operation, result=record["cache"]), 1)
+            write = time.monotonic() - self._last_write >= self.min_interval
+        if write:
+            self.write()
+
+    def _add(self, name: str, labels: dict, value: float):
+        key = (name, tuple(sorted(labels.items())))
+        self.metrics[key] = self.metrics.get(key, 0) + value
+
+    def to_text(self) -> str:
+        """Metrics in the Prometheus text format."""
+        with self._lock:
+            metrics = sorted(self.metrics.items())
+        lines = []
+        for (name, labels), value in metrics:
+            if not lines or not lines[-1].startswith(f"{name}{{"):
+                lines.append(f"# TYPE {name} counter")
+            label_text = ",".join(f'{key}="{_escape_label_value(value_)}"' for key, value_ in labels)
+            lines.append(f"{name}{{{label_text}}} {value:.9g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """Write `self.to_text()` to `self.path`, atomically."""
+        text = self.to_text()
+        temporary_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, 'w') as file:
+            file.write(text)
+        os.replace(temporary_path, self.path)
+        self._last_write = time.monotonic()
@@ -2,6 +2,8 @@ import pandas as pd
 import datetime
 import os
 
+from metal_library.core import misc_extractor
+
 class QLibrarian:
     '''
     This class is split into 3 sections
@@ -46,11 +48,11 @@ class QLibrarian:
         
         if (target_df == 'single_qoption'):
             keys, values = QLibrarian.extract_keysvalues(dictionary)
-            self.qoptions = self.qoptions.append(dict(zip(keys, values)), ignore_index=True)
+            self.qoptions = pd.concat([self.qoptions, pd.DataFrame([dict(zip(keys, values))])], ignore_index=True)
         elif (target_df == 'multi_qoption'):
             raise NotImplementedError('`multi_options` is not implemented.')
         elif (target_df == 'simulation'):
-            self.simulations = self.simulations.append(dictionary, ignore_index=True)
+            self.simulations = pd.concat([self.simulations, pd.DataFrame([dictionary])], ignore_index=True)
         else:
             raise ValueError(f'target_df must be one of the following: {self.supported_datatypes}')
     
@@ -136,10 +138,7 @@ class QLibrarian:
 
         # Default to date & time name
         if (filepath == None):
-            now = datetime.datetime.now()
-            date_string = now.strftime("%Y-%m-%d")
-    
-            filepath = 'testing_{date_string}.csv'
+            filepath = QLibrarian.default_filepath()
         
         # Combine the two DataFrames and add a splitter column between them
         combined_df = []
@@ -154,7 +153,38 @@ class QLibrarian:
         combined_df.to_csv(filepath, index=False, mode=mode, **kwargs)
 
     @staticmethod
-    def append_csv(qoption_data, simulation_data, filepath=None):
+    def default_filepath():
+        '''
+        Where `self.export_csv` and `self.append_csv` write w/o a `filepath`.
+        Ex: testing_2023-06-01.csv
+        '''
+        date_string = datetime.datetime.now().strftime("%Y-%m-%d")
+        return f'testing_{date_string}.csv'
+
+    @staticmethod
+    def write_csv_header(qoption_columns, simulation_columns, filepath=None):
+        '''
+        Write the header of a file filled by `self.append_csv`:
+        qoption columns, `__SPLITTER__`, simulation columns.
+
+        Skipped if `filepath` already has content, so a resumed sweep doesn't repeat it.
+
+        Inputs:
+        * qoption_columns (list[str])
+        * simulation_columns (list[str])
+        * filepath (str, optional)
+        '''
+        if (filepath == None):
+            filepath = QLibrarian.default_filepath()
+
+        if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+            return
+
+        header = list(qoption_columns) + ['__SPLITTER__'] + list(simulation_columns)
+        pd.DataFrame(columns=header).to_csv(filepath, index=False)
+
+    @staticmethod
+    def append_csv(qoption_data, simulation_data, filepath=None, extract_misc=False):
         '''
         Static verison of `self.write_csv`
 
@@ -164,13 +194,17 @@ class QLibrarian:
         Inputs:
         * qoption_data (pd.DataFrame)
         * simulation_data (pd.DataFrame)
+        * extract_misc (bool, optional) - Write the `misc` column as typed columns
+            (see `metal_library.core.misc_extractor`), and its raw text to `<filepath>.misc.jsonl.gz`.
+            Defaults to False.
         '''
         # Default to date & time name
         if (filepath == None):
-            now = datetime.datetime.now()
-            date_string = now.strftime("%Y-%m-%d")
-    
-            filepath = f'testing_{date_string}.csv'
+            filepath = QLibrarian.default_filepath()
+        
+        if extract_misc and misc_extractor.MISC_COLUMN in simulation_data.columns:
+            simulation_data, raw = misc_extractor.extract_misc(simulation_data)
+            misc_extractor.append_cold_storage(misc_extractor.cold_storage_path(filepath), raw)
         
         # Combine the two DataFrames and add an empty column between them
         combined_df = pd.concat([qoption_data, pd.DataFrame(columns=['__SPLITTER__']), simulation_data], axis=1)
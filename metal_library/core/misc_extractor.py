@@ -0,0 +1,225 @@
+import os
+import re
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+
+'''
+Structured extraction of the `misc` column.
+
+`misc` holds whatever the analysis returned besides the characteristics (pyEPR project info,
+dissipation settings, convergence tables, ...), written to the .csv as the repr of a dict of
+pandas objects. It's ~4 kB per row and can only be re-read by parsing text.
+
+`extract_misc` replaces it w/ typed columns:
+    misc.setup_name (str)              Ex: "TransmonSetup"
+    misc.num_passes (int)              Adaptive passes until the solver stopped.
+    misc.final_delta_percent (float)   Max delta freq. % of the last pass.
+    misc.convergence_deltas (str)      Delta of every pass, separated by ";". Ex: "89.153;17.507;..."
+    misc.dissipative_surfaces (str)    Surfaces in the "dissip" settings, separated by ";".
+and returns the raw text, which `append_cold_storage` writes to `<name>.misc.jsonl.gz` next to the .csv
+(one JSON line per row: {"row": ..., "misc": ...}). Its number of lines is kept in `<name>.misc.index.json`,
+so appending a row doesn't decompress the whole file to count them.
+
+Convergence filtering then doesn't need the text:
+selector.find_in_range({"misc.final_delta_percent": [None, 0.1]})
+'''
+
+MISC_COLUMN = "misc"
+COLD_STORAGE_SUFFIX = ".misc.jsonl.gz"
+COLD_STORAGE_INDEX_SUFFIX = ".misc.index.json"
+MISC_FIELDS = {"misc.setup_name": "str",
+               "misc.num_passes": "Int64",
+               "misc.final_delta_percent": "float",
+               "misc.convergence_deltas": "str",
+               "misc.dissipative_surfaces": "str"}
+
+SETUP_NAME_PATTERN = re.compile(r"^\s*setup_name\s+(\S+)\s*$", re.MULTILINE)
+DISSIP_PATTERN = re.compile(r"'dissip':(.*?)dtype: object", re.DOTALL)
+SURFACES_PATTERN = re.compile(r"\[([^\]]*)\]")
+CONVERGENCE_PATTERN = re.compile(r"'convergence':(.*?)(?:'convergence_f_pass'|\}\s*$)", re.DOTALL)
+PASS_PATTERN = re.compile(r"^\s*(\d+)\s+\S+\s+([^\s,]+),?\s*$", re.MULTILINE)
+
+
+def parse_misc(misc) -> dict:
+    """
+    Pull the fields in `MISC_FIELDS` out of one `misc` entry.
+
+    Args:
+        misc (str or dict): Text from the .csv, or the dict returned by the analysis.
+
+    Returns:
+        fields (dict): Keys are `MISC_FIELDS`. Fields which can't be found are None.
+    """
+    fields = dict.fromkeys(MISC_FIELDS)
+    if misc is None or (isinstance(misc, float) and np.isnan(misc)):
+        return fields
+    text = str(misc)
+
+    match = SETUP_NAME_PATTERN.search(text)
+    if match:
+        fields["misc.setup_name"] = match.group(1)
+
+    match = DISSIP_PATTERN.search(text)
+    if match:
+        surfaces = [surface.strip().strip("'\"") for group in SURFACES_PATTERN.findall(match.group(1))
+                    for surface in group.split(",")]
+        fields["misc.dissipative_surfaces"] = ";".join(surface for surface in surfaces if surface)
+
+    # Keep the last convergence table, if the analysis ran more than once
+    tables = CONVERGENCE_PATTERN.findall(text)
+    if tables:
+        passes = PASS_PATTERN.findall(tables[-1])
+        if passes:
+            deltas = [float(delta) for _, delta in passes]
+            fields["misc.num_passes"] = int(passes[-1][0])
+            fields["misc.final_delta_percent"] = deltas[-1]
+            fields["misc.convergence_deltas"] = ";".join(repr(delta) for delta in deltas if not np.isnan(delta))
+
+    return fields
+
+
+def extract_misc(df: pd.DataFrame, column: str = MISC_COLUMN) -> tuple[pd.DataFrame, pd.Series]:
+    """
+    Replace the `misc` column of `df` w/ the typed columns in `MISC_FIELDS`, at the same position.
+
+    Args:
+        df (pd.DataFrame): Library rows, or `QLibrarian.simulations`.
+        column (str, optional): Name of the `misc` column. Defaults to "misc".
+
+    Returns:
+        df (pd.DataFrame): Copy of `df` w/ typed columns instead of `column`.
+        raw (pd.Series): Text of `column`, to write to cold storage. Same index as `df`.
+    """
+    if column not in df.columns:
+        raise ValueError(f"`{column}` is not a column in `df`.")
+
+    raw = df[column].map(lambda misc: None if misc is None or (isinstance(misc, float) and np.isnan(misc)) else str(misc))
+    fields = pd.DataFrame([parse_misc(misc) for misc in raw], index=df.index, columns=list(MISC_FIELDS))
+    fields = fields.astype({name: dtype for name, dtype in MISC_FIELDS.items() if dtype != "str"})
+
+    loc = df.columns.get_loc(column)
+    extracted = pd.concat([df.iloc[:, :loc], fields, df.iloc[:, loc + 1:]], axis=1)
+    return extracted, raw.rename(column)
+
+
+def has_misc_fields(columns) -> bool:
+    """Check if `columns` already hold the typed columns of `extract_misc`."""
+    stripped = [str(column).strip() for column in columns]
+    return all(name in stripped for name in MISC_FIELDS)
+
+
+def collapse_misc_fields(columns: list[str]) -> list[str]:
+    """Inverse of `extract_misc` on column names: the typed columns become one `misc` column."""
+    collapsed = []
+    for column in columns:
+        if column.strip() not in MISC_FIELDS:
+            collapsed.append(column)
+        elif column.strip() == next(iter(MISC_FIELDS)):
+            collapsed.append(MISC_COLUMN)
+    return collapsed
+
+
+def cold_storage_path(csv_path: str) -> str:
+    """Ex: "QubitOnly.csv" -> "QubitOnly.misc.jsonl.gz\""""
+    return os.path.splitext(csv_path)[0] + COLD_STORAGE_SUFFIX
+
+
+def cold_storage_index_path(path: str) -> str:
+    """Ex: "QubitOnly.misc.jsonl.gz" -> "QubitOnly.misc.index.json\""""
+    if path.endswith(COLD_STORAGE_SUFFIX):
+        return path[:-len(COLD_STORAGE_SUFFIX)] + COLD_STORAGE_INDEX_SUFFIX
+    return path + ".index.json"
+
+
+def count_cold_storage(path: str) -> int:
+    """
+    Number of rows in a cold storage file. 0 if it doesn't exist.
+    Read from its index, unless the file changed size since the index was written.
+    """
+    if not os.path.exists(path):
+        return 0
+    try:
+        with open(cold_storage_index_path(path)) as file:
+            index = json.load(file)
+        if index["size"] == os.path.getsize(path):
+            return index["num_rows"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+    with gzip.open(path, 'rt') as file:
+        return sum(1 for _ in file)
+
+
+def _write_cold_storage_index(path: str, num_rows: int):
+    """Atomically record the number of rows and the size of a cold storage file."""
+    index_path = cold_storage_index_path(path)
+    temporary_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w') as file:
+        json.dump(dict(num_rows=num_rows, size=os.path.getsize(path)), file)
+    os.replace(temporary_path, index_path)
+
+
+def append_cold_storage(path: str, raw: pd.Series, first_row: int = None):
+    """
+    Append raw `misc` text to a cold storage file. Each call adds one gzip member, so earlier rows aren't rewritten,
+    and updates the index of the file.
+
+    Args:
+        path (str): Ex: "QubitOnly.misc.jsonl.gz"
+        raw (pd.Series): Returned by `extract_misc`.
+        first_row (int, optional): Library row of `raw.iloc[0]`. Defaults to the rows already in `path`.
+    """
+    num_rows = count_cold_storage(path)
+    if first_row is None:
+        first_row = num_rows
+    with gzip.open(path, 'at') as file:
+        for i, misc in enumerate(raw):
+            file.write(json.dumps(dict(row=first_row + i, misc=misc)) + "\n")
+    _write_cold_storage_index(path, num_rows + len(raw))
+
+
+def read_cold_storage(path: str, rows=None) -> dict:
+    """
+    Read raw `misc` text back from cold storage.
+
+    Args:
+        path (str): Ex: "QubitOnly.misc.jsonl.gz"
+        rows (list[int], optional): Library rows to read. Defaults to every row.
+
+    Returns:
+        misc (dict): Row -> raw text.
+    """
+    rows = None if rows is None else set(int(row) for row in rows)
+    misc = {}
+    with gzip.open(path, 'rt') as file:
+        for line in file:
+            entry = json.loads(line)
+            if rows is None or entry["row"] in rows:
+                misc[entry["row"]] = entry["misc"]
+    return misc
+
+
+def extract_library_misc(csv_path: str) -> str:
+    """
+    Rewrite a library .csv w/ typed `misc` columns, moving the raw text to cold storage.
+
+    Args:
+        csv_path (str): Ex: "metal_library/library/TransmonCross/QubitOnly.csv"
+
+    Returns:
+        cold_storage_path (str)
+    """
+    df = pd.read_csv(csv_path)
+    misc_column = [column for column in df.columns if column.strip() == MISC_COLUMN]
+    if not misc_column:
+        raise ValueError(f"{csv_path} has no `{MISC_COLUMN}` column.")
+
+    df, raw = extract_misc(df, column=misc_column[0])
+    path = cold_storage_path(csv_path)
+    if os.path.exists(path):
+        os.remove(path)
+    append_cold_storage(path, raw, first_row=0)
+    df.to_csv(csv_path, index=False)
+    return path
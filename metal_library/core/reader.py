@@ -2,10 +2,21 @@ import pandas as pd
 import numpy as np
 import os
 import json
+import itertools
 from tabulate import tabulate
 
 import metal_library
-from metal_library import Dict
+from metal_library import Dict, logging
+from metal_library.core.compactor import (compact_library, expand_library, save_compact_library,
+                                          load_compact_library, iter_compact_library, has_compact_library)
+from metal_library.core.reader_helperfunctions import make_dtype_plan, apply_dtype_plan, get_categorical_columns
+from metal_library.core.fetcher import RemoteLibrary, ContentCache, is_remote_path
+from metal_library.core.misc_extractor import MISC_COLUMN, extract_misc, has_misc_fields
+from metal_library.core.instrumentation import Trace
+from metal_library.core.grid import RegularGrid, detect_grids
+
+# `Reader.library.version`s, unique in the process so caches keyed on it (ex: `Selector.get_jacobians`) never collide
+_library_versions = itertools.count(1)
 
 
 class Reader:
@@ -13,9 +24,12 @@ class Reader:
     Designed to parse data from `metal_library.library`
     """
 
+    __supported_memory_modes__ = [None, 'compact']
+
     def __init__(self,
                  component_name: str,
-                 library_path: str = None):
+                 library_path: str = None,
+                 cache: ContentCache = None):
         """
         Initalizes Reader class.
 
@@ -24,11 +38,19 @@ class Reader:
                                   This is the name of a folder in `metal_library.library`.
             library_path (str, optional): Path to components library. In the future, the library will be too
                 big to host on GitHub, so this variable will point to where you need to download the data.
+                It can also be the URL of a remote library (see `metal_library.core.fetcher`), in which case
+                only the files of the component types you read are downloaded.
                 It defaults to "metal_library/library"
+            cache (ContentCache, optional): Local cache for remote libraries. Defaults to `ContentCache()`.
         """
         self.component_name = component_name
+        self.remote = None
         if (library_path == None):
             self.path = os.path.join(metal_library.__library_path__, component_name)
+        elif is_remote_path(library_path):
+            self.remote = RemoteLibrary(library_path, cache=cache)
+            self.remote.fetch(["metadata.json"])
+            self.path = self.remote.local_path
         else:
             self.path = library_path
 
@@ -121,28 +143,276 @@ class Reader:
         
         return component_characteristics
     
-    def read_library(self, component_type: str) -> pd.DataFrame:
+    def read_library(self, component_type: str, memory: str = None, detect_grid: bool = False) -> pd.DataFrame:
         """
         Reads component in `metal_library.library.component_name.component_type.csv`.
 
 
         Args:
             component_type (str): Type of component. Choose from `self.component_types`.
+            memory (str, optional): Memory mode. Must choose from `self.__supported_memory_modes__`.
+                None: Keep pandas' default dtypes.
+                'compact': Apply a per-column dtype plan (see `reader_helperfunctions.make_dtype_plan`).
+                    Geometries w/ units are stored as numbers, their units are kept in `self.library.units`.
+                    `self.library.memory_usage` holds the memory used before and after.
+                Defaults to None.
+            detect_grid (bool, optional): Detect if the library is a regular grid over its swept geometries now,
+                see `self.detect_grids`. Defaults to False, `self.get_grid` detects it on first use.
+
+        Time spent fetching, parsing, splitting and compacting is kept in `self.library.trace`
+        and sent to the sinks of `metal_library.core.instrumentation`.
+        For remote libraries, its `cache` is "hit" if the local mirror was already current.
         
         Returns:
             df (pd.DataFrame): 
         """
         if component_type not in self._get_component_types():
             raise ValueError(f'`component_type` must be from the following: {self._get_component_types()}')
+        if memory not in self.__supported_memory_modes__:
+            raise ValueError(f'`memory` must be from the following: {self.__supported_memory_modes__}')
+        trace = Trace("Reader.read_library", component_name=self.component_name,
+                      component_type=component_type, memory=memory)
+        with trace.stage("fetch"):
+            self._fetch_component_type(component_type)
+        if self.remote is not None:
+            trace.cache = "miss" if self.remote.stale_files else "hit"
         csv_file_name = str(component_type) + ".csv"
         component_type_path = os.path.join(self.path, csv_file_name)
-        df = pd.read_csv(component_type_path)
+        compact_path_prefix = os.path.join(self.path, str(component_type))
+
+        # Fall back to the compacted library if the full .csv isn't shipped
+        with trace.stage("parse"):
+            if not os.path.exists(component_type_path) and has_compact_library(compact_path_prefix):
+                df = expand_library(*load_compact_library(compact_path_prefix))
+            else:
+                df = pd.read_csv(component_type_path)
 
         
         # Split the combined DataFrame into the two separate DataFrames
-        try:
-            self.library.component_type = component_type
-            self.library.geometry = df.iloc[:, :df.columns.get_loc('__SPLITTER__')]
-            self.library.characteristic = df.iloc[:, df.columns.get_loc('__SPLITTER__')+1:]
-        except KeyError:
-            raise KeyError("""ERROR: There are no columns in your `.csv`. This error probably came from using QLibrarian.append_csv() to make a new file. Data won't be formatted properly. """)
+        with trace.stage("split"):
+            try:
+                self.library.component_type = component_type
+                self.library.geometry = df.iloc[:, :df.columns.get_loc('__SPLITTER__')]
+                self.library.characteristic = df.iloc[:, df.columns.get_loc('__SPLITTER__')+1:]
+            except KeyError:
+                raise KeyError("""ERROR: There are no columns in your `.csv`. This error probably came from using QLibrarian.append_csv() to make a new file. Data won't be formatted properly. """)
+
+        # Nothing is kept from a previous read
+        self.library.units = Dict()
+        self.library.dtype_plan = Dict()
+        self.library.pending_rows = []
+        self.library.pop('memory_usage', None)
+        self.library.version = next(_library_versions)
+        if (memory == 'compact'):
+            with trace.stage("compact"):
+                self._apply_compact_memory()
+        if detect_grid:
+            with trace.stage("grid_detection"):
+                self.detect_grids()
+
+        trace.count("rows_read", len(df))
+        self.library.trace = trace.finish()
+
+    def append(self, rows: pd.DataFrame, merge: bool = True) -> pd.Index:
+        """
+        Add new rows (e.g. fresh simulations) to `self.library` w/o re-reading the `.csv`.
+        Nothing is written to disk, use `Ingestor` for that.
+
+        Args:
+            rows (pd.DataFrame): In the layout of the library `.csv`: geometry columns, `__SPLITTER__`, characteristic columns.
+                Column names are matched w/o surrounding whitespace, extra columns are ignored.
+                A raw `misc` column is extracted if the library has typed `misc` columns.
+            merge (bool, optional): Concatenate the rows into `self.library.geometry` and `self.library.characteristic` now.
+                If False, they're kept as (geometry, characteristic) frames in `self.library.pending_rows`
+                until `self.merge_appended`, so many small appends don't copy the library each time. Defaults to True.
+
+        Returns:
+            index (pd.Index): Index labels given to the new rows. They continue the library's index.
+        """
+        if not (hasattr(self.library, 'geometry') and hasattr(self.library, 'characteristic')):
+            raise AttributeError('`Reader` must have `Reader.library` created. Run `Reader.read_library` before appending.')
+
+        geometry, characteristic = self.library.geometry, self.library.characteristic
+        if MISC_COLUMN in [str(column).strip() for column in rows.columns] and has_misc_fields(characteristic.columns):
+            misc_column = [column for column in rows.columns if str(column).strip() == MISC_COLUMN][0]
+            rows, _ = extract_misc(rows, column=misc_column)
+
+        stripped = {str(column).strip(): column for column in rows.columns}
+        missing = [column for column in list(geometry.columns) + list(characteristic.columns) if column.strip() not in stripped]
+        if missing:
+            raise ValueError(f"`rows` is missing columns: {missing}")
+
+        pending_rows = self.library.setdefault('pending_rows', [])
+        last_characteristic = pending_rows[-1][1] if pending_rows else characteristic
+        start = int(last_characteristic.index.max()) + 1 if len(last_characteristic) else 0
+        index = pd.RangeIndex(start, start + len(rows))
+        new_geometry = pd.DataFrame({column: rows[stripped[column.strip()]].to_numpy() for column in geometry.columns}, index=index)
+        new_characteristic = pd.DataFrame({column: rows[stripped[column.strip()]].to_numpy() for column in characteristic.columns}, index=index)
+        new_geometry, new_characteristic = new_geometry.infer_objects(), new_characteristic.infer_objects()
+
+        if self.library.dtype_plan:
+            new_geometry = apply_dtype_plan(new_geometry, self.library.dtype_plan)
+            new_characteristic = apply_dtype_plan(new_characteristic, self.library.dtype_plan)
+
+        if len(index):
+            pending_rows.append((new_geometry, new_characteristic))
+            self.library.version = next(_library_versions)
+        if merge:
+            self.merge_appended()
+        return index
+
+    def merge_appended(self):
+        """Concatenate `self.library.pending_rows` (see `self.append`) into `self.library`, in one copy."""
+        num_pending = len(self.library.get('pending_rows', []))
+        if num_pending:
+            self._replace_pending(*self._concat_pending(num_pending), num_pending)
+
+    def _concat_pending(self, num_pending: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        `self.library` w/ its first `num_pending` pending rows, w/o changing it.
+        Split from `self._replace_pending` so `Selector.merge_delta` can concatenate outside its lock.
+        """
+        pending_rows = self.library.pending_rows[:num_pending]
+        if not pending_rows:
+            return self.library.geometry, self.library.characteristic
+        geometry = self._concat_rows(self.library.geometry, [new_geometry for new_geometry, _ in pending_rows])
+        characteristic = self._concat_rows(self.library.characteristic, [new_characteristic for _, new_characteristic in pending_rows])
+        return geometry, characteristic
+
+    def _replace_pending(self, geometry: pd.DataFrame, characteristic: pd.DataFrame, num_pending: int):
+        """Swap in the frames from `self._concat_pending(num_pending)`, and drop the rows they merged from `self.library.pending_rows`."""
+        self.library.geometry = geometry
+        self.library.characteristic = characteristic
+        del self.library.pending_rows[:num_pending]
+
+    def detect_grids(self) -> dict:
+        """
+        Detect which partitions of `self.library` are full grids over their swept geometry columns,
+        and store their characteristics as N-D arrays. See `metal_library.core.grid`.
+
+        Partitions are the categorical characteristics, and swept geometry columns which aren't numbers.
+        Assigns `self.library.grids` and `self.library.grid_partition_columns`.
+
+        Returns:
+            grids (dict): Partition key (tuple, ordered as `self.library.grid_partition_columns`) -> RegularGrid.
+        """
+        self.merge_appended()
+        categorical_columns = get_categorical_columns(self.metadata, self.library.component_type, self.library.characteristic.columns)
+        partition_columns, grids = detect_grids(self.library.geometry, self.library.characteristic,
+                                                categorical_columns=categorical_columns, units=self.library.units)
+        self.library.grid_partition_columns = partition_columns
+        self.library.grids = grids
+        self.library.grids_version = self.library.version
+        return grids
+
+    def get_grid(self, partition: tuple = ()) -> RegularGrid:
+        """
+        Regular grid of a partition of `self.library`. Detected on first use, and again if rows were appended since.
+
+        Args:
+            partition (tuple, optional): Values of `self.library.grid_partition_columns`.
+                Defaults to (), the whole library when it has no partitions.
+
+        Returns:
+            grid (RegularGrid): None if the partition isn't a regular grid.
+        """
+        if self.library.get('grids_version') != self.library.version:
+            self.detect_grids()
+        return self.library.grids.get(tuple(partition))
+
+    @staticmethod
+    def _concat_rows(df: pd.DataFrame, new_rows: list[pd.DataFrame]) -> pd.DataFrame:
+        """Concatenate `new_rows` below `df`, keeping categorical columns categorical. Used in `self._concat_pending`."""
+        new_rows = pd.concat(new_rows) if len(new_rows) > 1 else new_rows[0].copy()
+        df_columns = {}
+        for column in df.columns:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                categories = df[column].cat.categories.union(pd.Index(new_rows[column].dropna().unique()), sort=False)
+                df_columns[column] = df[column].cat.set_categories(categories)
+                new_rows[column] = pd.Categorical(new_rows[column], categories=categories)
+        if df_columns:
+            df = df.assign(**df_columns)
+        return pd.concat([df, new_rows])
+
+    def _fetch_component_type(self, component_type: str):
+        """Download the files of `component_type` if this is a remote library. Does nothing for local libraries."""
+        if self.remote is not None:
+            self.remote.fetch_component_type(component_type)
+
+    def iter_library(self, component_type: str, chunksize: int = 100_000):
+        """
+        Reads component in `metal_library.library.component_name.component_type.csv` in chunks of `chunksize` rows,
+        w/o holding the whole library in memory. Used for libraries too big to load w/ `self.read_library`.
+        Falls back to the compacted library, like `self.read_library`.
+
+        Args:
+            component_type (str): Type of component. Choose from `self.component_types`.
+            chunksize (int, optional): Rows per chunk. Defaults to 100_000.
+
+        Yields:
+            geometry (pd.DataFrame): Same columns as `self.library.geometry`. Index continues across chunks.
+            characteristic (pd.DataFrame): Same columns as `self.library.characteristic`.
+        """
+        if component_type not in self._get_component_types():
+            raise ValueError(f'`component_type` must be from the following: {self._get_component_types()}')
+        self._fetch_component_type(component_type)
+        component_type_path = os.path.join(self.path, str(component_type) + ".csv")
+        compact_path_prefix = os.path.join(self.path, str(component_type))
+
+        if not os.path.exists(component_type_path) and has_compact_library(compact_path_prefix):
+            chunks = iter_compact_library(compact_path_prefix, chunksize=chunksize)
+        else:
+            chunks = pd.read_csv(component_type_path, chunksize=chunksize)
+
+        for df in chunks:
+            try:
+                splitter_loc = df.columns.get_loc('__SPLITTER__')
+            except KeyError:
+                raise KeyError("""ERROR: There are no columns in your `.csv`. This error probably came from using QLibrarian.append_csv() to make a new file. Data won't be formatted properly. """)
+            yield df.iloc[:, :splitter_loc], df.iloc[:, splitter_loc+1:]
+
+    def _apply_compact_memory(self):
+        """
+        Shrinks `self.library.geometry` and `self.library.characteristic` in place. Used in `self.read_library`.
+        """
+        before = self._library_memory_usage()
+
+        self.library.dtype_plan = Dict()
+        for name in ['geometry', 'characteristic']:
+            df = self.library[name]
+            dtype_plan = make_dtype_plan(df, exact_floats=(name == 'geometry'))
+            self.library[name] = apply_dtype_plan(df, dtype_plan)
+            self.library.dtype_plan.update(dtype_plan)
+
+        self.library.units = Dict({column: plan['unit'] for column, plan in self.library.dtype_plan.items()
+                                   if plan['unit'] is not None})
+
+        after = self._library_memory_usage()
+        self.library.memory_usage = Dict(before=before, after=after)
+        logging.info(f"Library memory usage (deep): {before / 1e6:.3f} MB -> {after / 1e6:.3f} MB")
+
+    def _library_memory_usage(self) -> int:
+        """Bytes used by `self.library.geometry` and `self.library.characteristic`, w/ `deep=True`."""
+        return int(self.library.geometry.memory_usage(deep=True).sum()
+                   + self.library.characteristic.memory_usage(deep=True).sum())
+
+    def compact_library(self, component_type: str) -> tuple[str, str]:
+        """
+        Writes a compacted copy of `metal_library.library.component_name.component_type.csv` next to it.
+        See `metal_library.core.compactor` for what gets compacted.
+
+        Args:
+            component_type (str): Type of component. Choose from `self.component_types`.
+
+        Returns:
+            data_path (str): Path to `component_type.compact.csv.gz`
+            info_path (str): Path to `component_type.compact.json`
+        """
+        if component_type not in self._get_component_types():
+            raise ValueError(f'`component_type` must be from the following: {self._get_component_types()}')
+        self._fetch_component_type(component_type)
+        component_type_path = os.path.join(self.path, str(component_type) + ".csv")
+        df = pd.read_csv(component_type_path)
+
+        compact_df, compact_info = compact_library(df)
+        return save_compact_library(compact_df, compact_info, os.path.join(self.path, str(component_type)))
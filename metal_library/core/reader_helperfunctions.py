@@ -0,0 +1,255 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+'''
+Helper functions for `Reader`.
+
+The library CSVs store geometries in the style of QComponent.options,
+so most geometry values are strings w/ units attached (e.g. '185um', '10nH').
+The functions below convert those into numbers, and back again, and decide
+which dtype each column of a library should be stored as.
+
+Example:
+values, unit = parse_unit_column(pd.Series(['185um', '195um']))
+print(values, unit)
+# prints: [185. 195.] um
+print(format_unit_value(values[0], unit))
+# prints: 185um
+'''
+
+UNIT_PATTERN = re.compile(r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-zA-Z]*)\s*$')
+
+SI_PREFIXES = {
+    'f': 1e-15,
+    'p': 1e-12,
+    'n': 1e-9,
+    'u': 1e-6,
+    'm': 1e-3,
+    'k': 1e3,
+    'M': 1e6,
+    'G': 1e9,
+}
+
+
+def split_unit(unit: str) -> tuple[float, str]:
+    """
+    Split a unit into its SI prefix scale and base unit.
+
+    Args:
+        unit (str): Ex: 'um', 'nH', 'GHz', 'm'
+
+    Returns:
+        scale (float): Ex: 1e-6
+        base (str): Ex: 'm'
+    """
+    if len(unit) > 1 and unit[0] in SI_PREFIXES:
+        return SI_PREFIXES[unit[0]], unit[1:]
+    return 1.0, unit
+
+
+def parse_unit_column(series: pd.Series, unit: str = None):
+    """
+    Parse a column of strings w/ units (e.g. '185um') into floats.
+    All values are converted to the unit of the first value.
+
+    Args:
+        series (pd.Series): Column to parse.
+        unit (str, optional): Convert to this unit instead. Defaults to None.
+
+    Returns:
+        (values, unit) (tuple[np.ndarray, str]): Floats in units of `unit`.
+        None if the column isn't made of strings w/ units, or the units are incompatible.
+    """
+    if len(series) == 0 or not (pd.api.types.is_string_dtype(series) or pd.api.types.is_object_dtype(series)):
+        return None
+
+    extracted = series.astype(str).str.extract(UNIT_PATTERN)
+    if extracted[0].isna().any():
+        return None
+
+    numbers = extracted[0].astype(float).to_numpy()
+    units = extracted[1].fillna('')
+
+    unit = units.iloc[0] if unit is None else unit
+    if (units == unit).all():
+        return numbers, unit
+
+    # Mixed units. Convert everything into `unit` if they share a base unit.
+    scale, base = split_unit(unit)
+    scales = np.empty(len(units))
+    for i, other_unit in enumerate(units):
+        other_scale, other_base = split_unit(other_unit)
+        if other_base != base:
+            return None
+        scales[i] = other_scale / scale
+    return numbers * scales, unit
+
+
+def format_unit_value(value, unit: str) -> str:
+    """
+    Inverse of `parse_unit_column` for a single value.
+
+    Args:
+        value (float): Number.
+        unit (str): Unit to attach.
+
+    Returns:
+        str: Ex: '185um'
+    """
+    return np.format_float_positional(value, trim='-') + unit
+
+
+def float32_to_float(value: np.float32) -> float:
+    """
+    Convert a float32 to the python float w/ the same shortest decimal representation.
+    Ex: np.float32(7e-06) -> 7e-06, instead of 6.999999868639186e-06.
+    """
+    return float(np.format_float_positional(value, trim='-'))
+
+
+def parse_geometry(geometry: pd.DataFrame) -> pd.DataFrame:
+    """
+    Unit-parse a geometry DataFrame (ex: `Reader.library.geometry`) into a purely numeric DataFrame.
+    Numeric columns are kept, strings w/ units are converted to floats, every other column is dropped.
+
+    Args:
+        geometry (pd.DataFrame): Geometry in the style of the library CSVs.
+
+    Returns:
+        numeric_geometry (pd.DataFrame): float64 columns, same index as `geometry`.
+    """
+    numeric_geometry = {}
+    for column in geometry.columns:
+        values = geometry[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(values.cat.categories.dtype)
+
+        if pd.api.types.is_bool_dtype(values):
+            continue
+        if pd.api.types.is_numeric_dtype(values):
+            numeric_geometry[column] = values.to_numpy(dtype=float)
+            continue
+
+        # Sweeps repeat a handful of values, so only parse each one once
+        codes, unique_values = pd.factorize(values, use_na_sentinel=False)
+        parsed = parse_unit_column(pd.Series(np.asarray(unique_values, dtype=object)))
+        if parsed is not None:
+            numeric_geometry[column] = parsed[0][codes]
+
+    return pd.DataFrame(numeric_geometry, index=geometry.index)
+
+
+def make_dtype_plan(df: pd.DataFrame,
+                    parse_units: bool = True,
+                    rtol: float = 1e-6,
+                    exact_floats: bool = False,
+                    max_categorical_fraction: float = 0.5) -> dict:
+    """
+    Decide a memory efficient dtype for each column of `df`.
+
+    Rules (first match wins):
+    1. Strings w/ units which exactly round-trip through `format_unit_value` -> float32 (or float64) + unit.
+    2. Floats which fit in float32 w/in relative tolerance `rtol` -> float32.
+       If `exact_floats`, the shortest decimal representation of each value must survive instead.
+    3. Integers -> smallest integer type holding every value.
+    4. Strings w/ `nunique / len <= max_categorical_fraction` -> category.
+    5. Everything else is left alone.
+
+    Args:
+        df (pd.DataFrame): Library data.
+        parse_units (bool, optional): Apply rule 1. Defaults to True.
+        rtol (float, optional): Relative tolerance for float32. Defaults to 1e-6.
+        exact_floats (bool, optional): Use for geometries, so values round-trip to QComponent.options. Defaults to False.
+        max_categorical_fraction (float, optional): See rule 4. Defaults to 0.5.
+
+    Returns:
+        dtype_plan (dict): Column name -> {'dtype': (str), 'unit': (str or None)}
+    """
+    dtype_plan = {}
+    for column in df.columns:
+        values = df[column]
+        plan = dict(dtype=str(values.dtype), unit=None)
+
+        if pd.api.types.is_bool_dtype(values) or values.isna().all():
+            pass
+        elif pd.api.types.is_float_dtype(values):
+            if _fits_float32(values.to_numpy(), rtol, exact_floats):
+                plan['dtype'] = 'float32'
+        elif pd.api.types.is_integer_dtype(values):
+            plan['dtype'] = str(pd.to_numeric(values, downcast='integer').dtype)
+        elif pd.api.types.is_string_dtype(values) or pd.api.types.is_object_dtype(values):
+            parsed = parse_unit_column(values) if parse_units else None
+            if parsed is not None and _round_trips(values, *parsed):
+                numbers, unit = parsed
+                exact_float32 = _round_trips(values, numbers.astype(np.float32), unit)
+                plan = dict(dtype='float32' if exact_float32 else 'float64', unit=unit)
+            elif values.nunique() <= max_categorical_fraction * len(values):
+                plan['dtype'] = 'category'
+
+        dtype_plan[column] = plan
+
+    return dtype_plan
+
+
+def apply_dtype_plan(df: pd.DataFrame, dtype_plan: dict) -> pd.DataFrame:
+    """
+    Convert the columns of `df` according to a plan made by `make_dtype_plan`.
+
+    Args:
+        df (pd.DataFrame): Library data.
+        dtype_plan (dict): Output of `make_dtype_plan`.
+
+    Returns:
+        df (pd.DataFrame): New DataFrame w/ converted columns. Columns w/ a unit are now numeric.
+    """
+    converted = {}
+    for column in df.columns:
+        values = df[column]
+        plan = dtype_plan.get(column)
+        if plan is None or plan['dtype'] == str(values.dtype):
+            converted[column] = values
+        elif plan['unit'] is not None:
+            parsed = parse_unit_column(values, unit=plan['unit'])
+            if parsed is None:
+                raise ValueError(f"`{column}` can't be converted to {plan['unit']}.")
+            converted[column] = pd.Series(parsed[0].astype(plan['dtype']), index=df.index)
+        else:
+            converted[column] = values.astype(plan['dtype'])
+
+    return pd.DataFrame(converted, index=df.index)
+
+
+def _fits_float32(values: np.ndarray, rtol: float, exact: bool = False) -> bool:
+    """Check if float64 `values` survive a round-trip through float32 w/in `rtol`, or `exact`ly in decimal."""
+    values = values[np.isfinite(values)]
+    if np.any(np.abs(values) > np.finfo(np.float32).max):
+        return False
+    if exact:
+        return all(float32_to_float(np.float32(value)) == value for value in np.unique(values))
+    return bool(np.allclose(values.astype(np.float32), values, rtol=rtol, atol=0))
+
+
+def _round_trips(values: pd.Series, numbers: np.ndarray, unit: str) -> bool:
+    """Check if formatting `numbers` w/ `unit` gives back exactly `values`."""
+    unique_numbers, inverse = np.unique(numbers, return_inverse=True)
+    formatted = np.array([format_unit_value(number, unit) for number in unique_numbers])[inverse]
+    return bool(np.array_equal(values.astype(str).str.strip().to_numpy(dtype=object), formatted.astype(object)))
+
+
+def get_categorical_columns(metadata: dict, component_type: str, columns) -> list[str]:
+    """
+    Characteristics declared w/ units "str" in `metadata.json` (e.g. `wavelength`, `feedline_coupling`).
+
+    Args:
+        metadata (dict): `Reader.metadata`.
+        component_type (str): Type of component.
+        columns (list[str]): Characteristic columns actually in the library.
+
+    Returns:
+        categorical_columns (list[str]): In the order they're declared in `metadata.json`.
+    """
+    characteristics = metadata.get("component-types", {}).get(component_type, {}).get("characteristics", [])
+    declared = [c["column_name"] for c in characteristics if c.get("units") == "str"]
+    return [column for column in declared if column in columns]
@@ -0,0 +1,150 @@
+import os
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from metal_library.core.surrogate import Surrogate
+
+'''
+Runtime prediction and scheduling for `QSweeper`.
+
+`QSweeper.run_single_component_sweep` logs how long each configuration took to
+`<save_path>.timing.csv` (the configuration's QComponent.options, flattened like the
+library, plus `runtime_s`). `RuntimeModel` learns runtime from geometry on those logs:
+a `Surrogate` fitted to log(runtime), since big pads and small gaps mean more mesh passes,
+and runtimes vary by factors rather than by offsets.
+
+w/ a model, a sweep can be
+    - estimated before running it (`QSweeper.estimate`): total compute time, wall time and cost,
+    - run longest-predicted-first, and split between workers so they finish together
+      (`schedule_longest_first`, the LPT rule: each configuration, longest first,
+      goes to the worker w/ the least predicted work so far).
+
+Example:
+model = RuntimeModel.from_timing_logs(["sweep_1.timing.csv", "sweep_2.timing.csv"])
+sweeper.estimate("Q1", parameters, runtime_model=model, num_workers=4, cost_per_hour=2.5)
+# Each of the 4 worker processes, w/ its own design:
+sweeper.run_single_component_sweep("Q1", parameters, analysis, save_path="sweep_w0.csv",
+                                   runtime_model=model, worker=(0, 4))
+'''
+
+TIMING_LOG_SUFFIX = ".timing.csv"
+RUNTIME_COLUMN = "runtime_s"
+
+
+def timing_log_path(save_path: str) -> str:
+    """Ex: "sweep.csv" -> "sweep.timing.csv\""""
+    return os.path.splitext(save_path)[0] + TIMING_LOG_SUFFIX
+
+
+def append_timing_log(path: str, qoption: pd.DataFrame, runtime: float):
+    """
+    Append the runtime of one configuration to a timing log.
+
+    Args:
+        path (str): Ex: "sweep.timing.csv"
+        qoption (pd.DataFrame): One row, ex: `QLibrarian.qoptions.tail(n=1)`.
+        runtime (float): Seconds.
+    """
+    row = qoption.reset_index(drop=True).assign(**{RUNTIME_COLUMN: float(runtime)})
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        # Keep the columns of the log, so rows stay aligned
+        columns = pd.read_csv(path, nrows=0).columns
+        row.reindex(columns=columns).to_csv(path, mode='a', header=False, index=False)
+    else:
+        row.to_csv(path, index=False)
+
+
+def read_timing_logs(paths: list[str]) -> pd.DataFrame:
+    """Concatenate timing logs. Configurations w/o a positive runtime are dropped."""
+    logs = pd.concat([pd.read_csv(path) for path in paths], ignore_index=True)
+    return logs[pd.to_numeric(logs[RUNTIME_COLUMN], errors='coerce') > 0].reset_index(drop=True)
+
+
+def schedule_longest_first(predicted_seconds, num_workers: int = 1) -> list[list[int]]:
+    """
+    Split configurations between workers w/ the longest-processing-time-first rule.
+
+    Args:
+        predicted_seconds (array-like): Predicted runtime of each configuration.
+        num_workers (int, optional): Defaults to 1.
+
+    Returns:
+        schedule (list[list[int]]): Positions of the configurations each worker runs, in order (longest first).
+            Ties keep the original order.
+    """
+    if num_workers < 1:
+        raise ValueError('`num_workers` must be at least 1.')
+    predicted_seconds = np.asarray(predicted_seconds, dtype=float)
+    schedule = [[] for _ in range(num_workers)]
+    loads = [(0.0, worker) for worker in range(num_workers)]
+    for position in np.argsort(-predicted_seconds, kind='stable'):
+        load, worker = heapq.heappop(loads)
+        schedule[worker].append(int(position))
+        heapq.heappush(loads, (load + predicted_seconds[position], worker))
+    return schedule
+
+
+class RuntimeModel:
+    """
+    Runtime of a simulation from its geometry, learned from timing logs. See the top of `scheduler.py`.
+    """
+
+    def __init__(self, degree: int = 2, ridge: float = 1e-3):
+        """
+        Initalizes RuntimeModel class. Call `self.fit` before `self.predict`.
+
+        Args:
+            degree (int, optional): Degree of the polynomial in `Surrogate`. Defaults to 2.
+            ridge (float, optional): L2 regularization of `Surrogate`. Defaults to 1e-3.
+        """
+        self.surrogate = Surrogate(degree=degree, ridge=ridge)
+        self.num_samples = 0
+
+    @classmethod
+    def from_timing_logs(cls, paths: list[str], **kwargs) -> 'RuntimeModel':
+        """
+        Fit a model to timing logs written by `QSweeper.run_single_component_sweep`.
+
+        Args:
+            paths (list[str]): Ex: ["sweep.timing.csv"]
+            **kwargs: Passed to `RuntimeModel.__init__`.
+
+        Returns:
+            runtime_model (RuntimeModel)
+        """
+        logs = read_timing_logs(paths)
+        return cls(**kwargs).fit(logs.drop(columns=RUNTIME_COLUMN), logs[RUNTIME_COLUMN])
+
+    def fit(self, geometry: pd.DataFrame, runtimes) -> 'RuntimeModel':
+        """
+        Fit the model.
+
+        Args:
+            geometry (pd.DataFrame): Configurations, in the style of `QLibrarian.qoptions`.
+            runtimes (array-like): Seconds each configuration took.
+
+        Returns:
+            self (RuntimeModel)
+        """
+        runtimes = np.asarray(runtimes, dtype=float)
+        if len(runtimes) == 0 or np.any(runtimes <= 0):
+            raise ValueError('`runtimes` must be positive, and there must be at least one.')
+        self.surrogate.fit(geometry.reset_index(drop=True), pd.DataFrame({RUNTIME_COLUMN: np.log(runtimes)}))
+        self.num_samples = len(runtimes)
+        return self
+
+    def predict(self, geometry: pd.DataFrame) -> np.ndarray:
+        """
+        Expected runtime of configurations.
+
+        Args:
+            geometry (pd.DataFrame): Configurations, must contain the columns which varied in the timing logs.
+
+        Returns:
+            seconds (np.ndarray): Mean of the log-normal prediction, exp(mean + std^2 / 2),
+                so totals over many configurations aren't biased low.
+        """
+        mean, std = self.surrogate.predict(geometry)
+        return np.exp(mean[RUNTIME_COLUMN].to_numpy() + std[RUNTIME_COLUMN].to_numpy()**2 / 2)
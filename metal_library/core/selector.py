@@ -1,25 +1,58 @@
+import threading
+
 import numpy as np
 import pandas as pd
+from scipy.optimize import linear_sum_assignment
 
 from metal_library import logging
 from metal_library.core.reader import Reader
 from metal_library.core.sweeper_helperfunctions import create_dict_list
+from metal_library.core.reader_helperfunctions import format_unit_value, float32_to_float, get_categorical_columns
+from metal_library.core.instrumentation import Trace
+from metal_library.core.sensitivity import LocalJacobian
+
 
 class Selector:
 
     __supported_metrics__ = ['Euclidian', 'Manhattan', 'Chebyshev']
     __supported_estimation_methods__ = ['Interpolation']
+    __supported_assignment_constraints__ = ['min_spacing', 'forbidden']
 
-    def __init__(self, reader):
+    def __init__(self, reader, merge_threshold: int = 10_000):
+        """
+        Initalizes Selector class.
+
+        Args:
+            reader (Reader): Must have run `Reader.read_library`.
+            merge_threshold (int, optional): Rows added w/ `self.append` are kept in a delta buffer, searched alongside
+                the index, and merged into it (and into `self.geometry` and `self.characteristic`) in a background thread
+                once there are this many. Defaults to 10_000.
+        """
+        self.merge_threshold = merge_threshold
 
         # Will be overwritten by `self.parseReader`
         self.component_type = None
         self.geometry = None
         self.characteristic = None
+        self.units = None
+        self.categorical_columns = None
+        self.numeric_columns = None
+        self._partitions = None
+
+        # Rows added by `self.append`, same layout as `self._partitions`. `self._merging` is being merged.
+        self._delta = {}
+        self._merging = {}
+        self._lock = threading.RLock()
+        self._merge_thread = None
+
+        # `LocalJacobian`s by (characteristic_columns, num_neighbors), for `self._jacobians_version` of the library
+        self._jacobians = {}
+        self._jacobians_version = None
         
         if isinstance(reader, Reader):
             self.reader = reader
             self._parse_reader(reader) # Assigns: self.component_type, self.geometry, self.characteristic
+            self._build_index() # Assigns: self.categorical_columns, self.numeric_columns, self._partitions, self.index_trace
         else:
             raise TypeError("`reader` must be `metal_library.Reader`")
     
@@ -36,6 +69,148 @@ class Selector:
         self.component_type = reader.library.component_type
         self.geometry = reader.library.geometry
         self.characteristic = reader.library.characteristic
+        # Only populated when `Reader.read_library(..., memory='compact')` parsed geometries into numbers
+        self.units = dict(reader.library.units) if reader.library.units else {}
+
+    def _build_index(self):
+        """
+        Partition `self.characteristic` by its categorical characteristics,
+        and store the numeric characteristics of each partition as a float array.
+
+        `self._partitions` maps a tuple of categorical values (ordered as `self.categorical_columns`)
+        to `(labels, values)`, where `labels` are the DataFrame index labels and
+        `values` has shape (len(labels), len(self.numeric_columns)).
+        A library w/o categorical characteristics has a single partition, `()`.
+        Its timing is kept in `self.index_trace`, see `metal_library.core.instrumentation`.
+        """
+        trace = Trace("Selector.build_index", component_type=self.component_type)
+        self.categorical_columns = get_categorical_columns(self.reader.metadata, self.component_type, self.characteristic.columns)
+        self.numeric_columns = [column for column in self.characteristic.columns
+                                if column not in self.categorical_columns
+                                and pd.api.types.is_numeric_dtype(self.characteristic[column])]
+
+        with trace.stage("index_build"):
+            self._partitions = self._partition(self.characteristic)
+        trace.count("rows_indexed", len(self.characteristic))
+        trace.count("partitions", len(self._partitions))
+        self.index_trace = trace.finish()
+
+    def _partition(self, characteristic: pd.DataFrame) -> dict:
+        """Split `characteristic` into `{key: (labels, values)}`, see `self._build_index`."""
+        labels = characteristic.index.to_numpy()
+        values = characteristic[self.numeric_columns].to_numpy(dtype=float)
+
+        partitions = {}
+        if self.categorical_columns:
+            groups = characteristic.groupby(self.categorical_columns, sort=False, dropna=False, observed=True).indices
+            for key, positions in groups.items():
+                key = key if isinstance(key, tuple) else (key,)
+                partitions[key] = (labels[positions], values[positions])
+        else:
+            partitions[()] = (labels, values)
+        return partitions
+
+    def append(self, rows: pd.DataFrame) -> pd.Index:
+        """
+        Add new rows (e.g. live results of a sweep) w/o rebuilding the index. They're searchable right away.
+        See `Reader.append` for the layout of `rows`. They stay in `Reader.library.pending_rows`
+        until `self.merge_delta`, so an append doesn't copy the library.
+
+        Args:
+            rows (pd.DataFrame): New library rows.
+
+        Returns:
+            index (pd.Index): Index labels given to the new rows.
+        """
+        with self._lock:
+            index = self.reader.append(rows, merge=False)
+            if not len(index):
+                return index
+
+            _, new_characteristic = self.reader.library.pending_rows[-1]
+            for key, (labels, values) in self._partition(new_characteristic).items():
+                if key in self._delta:
+                    labels = np.concatenate([self._delta[key][0], labels])
+                    values = np.concatenate([self._delta[key][1], values])
+                self._delta[key] = (labels, values)
+
+            merging = self._merge_thread is not None and self._merge_thread.is_alive()
+            if not merging and sum(len(labels) for labels, _ in self._delta.values()) >= self.merge_threshold:
+                self._merge_thread = threading.Thread(target=self.merge_delta, daemon=True)
+                self._merge_thread.start()
+        return index
+
+    def merge_delta(self):
+        """
+        Merge the rows added by `self.append` into the index, and into `self.geometry` and `self.characteristic`.
+        Called in the background by `self.append`.
+        """
+        thread = self._merge_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+        with self._lock:
+            if not self._delta or self._merging:
+                return
+            self._merging, self._delta = self._delta, {}
+            partitions, merging = self._partitions, self._merging
+            num_pending = len(self.reader.library.pending_rows)
+
+        # Queries keep searching the old index + `self._merging` meanwhile
+        geometry, characteristic = self.reader._concat_pending(num_pending)
+        merged = dict(partitions)
+        for key, (labels, values) in merging.items():
+            if key in merged:
+                labels = np.concatenate([merged[key][0], labels])
+                values = np.concatenate([merged[key][1], values])
+            merged[key] = (labels, values)
+
+        with self._lock:
+            self._partitions = merged
+            self._merging = {}
+            self.reader._replace_pending(geometry, characteristic, num_pending)
+            self.geometry, self.characteristic = geometry, characteristic
+
+    def _split_target_params(self, target_params: dict) -> tuple[dict, dict]:
+        """
+        Separate exact-match categorical constraints from numeric targets.
+
+        Args:
+            target_params (dict): Keys are column names in `self.characteristic`.
+
+        Returns:
+            constraints (dict): Categorical column -> required value.
+            numeric_params (dict): Numeric column -> target value.
+        """
+        constraints = {}
+        numeric_params = {}
+        for column, value in target_params.items():
+            if column in self.categorical_columns:
+                constraints[column] = value
+            elif column in self.numeric_columns:
+                numeric_params[column] = value
+            else:
+                raise ValueError(f"{column} is not a searchable column. Choose from: {self.numeric_columns + self.categorical_columns}")
+        return constraints, numeric_params
+
+    def _get_partitions(self, constraints: dict, trace: Trace = None) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        All `(labels, values)` partitions matching the exact-match `constraints`, including rows from `self.append`.
+        Those rows, not merged into the index yet, are counted as "delta_rows" in `trace` (if given).
+        """
+        with self._lock:
+            sources = [self._partitions, self._merging, self._delta]
+        matching = []
+        num_delta_rows = 0
+        for i, partitions in enumerate(sources):
+            for key, partition in partitions.items():
+                if all(key[self.categorical_columns.index(column)] == value for column, value in constraints.items()):
+                    matching.append(partition)
+                    if i > 0:
+                        num_delta_rows += len(partition[0])
+        if trace is not None:
+            trace.count("delta_rows", num_delta_rows)
+        return matching
 
     def _outside_bounds(self, df: pd.DataFrame, params: dict, display=True) -> bool:
         """
@@ -64,47 +239,57 @@ class Selector:
                      target_params: dict, 
                      num_top: int, 
                      metric: str = 'Euclidian',
-                     display: bool = True):
+                     display: bool = True,
+                     explain: bool = False):
         """
         Main functionality. Select the closest presimulated geometry for a set of characteristics.
         
         Args:
-            target_params (dict): A dictionary where the keys are the column names in `self.characteristic`,
+            target_params (dict or list[dict]): A dictionary where the keys are the column names in `self.characteristic`,
                                   and the values are the target values to compare against.
+                                  Categorical characteristics (see `self.categorical_columns`) are exact-match
+                                  constraints, e.g. {"feedline_coupling": "inductive"}. Only rows w/ those
+                                  values are searched, and they don't enter the distance.
+                                  Pass a list of dictionaries to batch queries (nothing is displayed).
             num_top (int): The number of rows with the smallest Euclidean distances to return.
             metric (str, optional): Metric to determine closeness. Defaults to "Euclidian". 
                                     Must choose from `self.__supported_metrics__`.
             display (boo, optional): Print out results? Defaults to True.
+            explain (bool, optional): Also return where the time went. Defaults to False.
 
         Returns:
             indexes_smallest (pd.Index): Indexes of the 'num_top' rows with the smallest distances to the target parameters.
             best_characteristics (list[dict]): Associated characteristics. Ranked closest to furthest, same order as `best_geometries`
             best_geometries (list[dict]): Geometries in the style of QComponent.options. Ranked closest to furthest.
+            explanation (dict): Only if `explain`. Seconds spent splitting `target_params`, computing distances,
+                in top-k and converting rows to dicts, and the rows scanned. See `metal_library.core.instrumentation`.
+            For a list of dictionaries, a list of those tuples, in the same order.
 
         """
+        if not isinstance(target_params, dict):
+            return [self.find_closest(params, num_top=num_top, metric=metric, display=False, explain=explain)
+                    for params in target_params]
+        trace = Trace("Selector.find_closest", num_top=num_top, metric=metric)
+
         ### Checks
         # Check for supported metric
         if metric not in self.__supported_metrics__:
             raise ValueError(f'`metric` must be one of the following: {self.__supported_metrics__}')
-        # Check for improper size of library
-        if (num_top > len(self.characteristic)):
+        with trace.stage("split"):
+            constraints, numeric_params = self._split_target_params(target_params)
+            # Check for improper size of library
+            num_searched = sum(len(labels) for labels, _ in self._get_partitions(constraints))
+        if (num_top > num_searched):
             raise ValueError('`num_top` cannot be bigger than size of read-in library.')
         # Log if parameters outside of library
-        self._outside_bounds(df=self.characteristic, params=target_params, display=True)
-
-        ### Setup
-        # Choose from supported metrics, set it to var `find_index`
-        if (metric == 'Euclidian'):
-            find_index = self._find_index_Euclidian
-        elif (metric == 'Manhattan'):
-            find_index = self._find_index_Manhattan
-        elif (metric == 'Chebyshev'):
-            find_index = self._find_index_Chebyshev
+        with trace.stage("bounds_check"):
+            self._outside_bounds(df=self.characteristic, params=numeric_params, display=True)
 
         ### Main Logic
-        indexes_smallest = find_index(target_params=target_params, num_top=num_top)
-        best_geometries = [self.get_geometry_from_index(index=index) for index in indexes_smallest]
-        best_characteristics = [self.get_characteristic_from_index(index=index) for index in indexes_smallest]
+        indexes_smallest, _ = self._find_index(target_params=target_params, num_top=num_top, metric=metric, trace=trace)
+        with trace.stage("dict_conversion"):
+            best_geometries = [self.get_geometry_from_index(index=index) for index in indexes_smallest]
+            best_characteristics = [self.get_characteristic_from_index(index=index) for index in indexes_smallest]
 
         ### Print results in pretty format
         if display:
@@ -128,8 +313,224 @@ class Selector:
             from IPython.display import display, HTML
             display(HTML(df_displayed.to_html(index=False)))
 
+        explanation = trace.finish()
+        if explain:
+            return indexes_smallest, best_characteristics, best_geometries, explanation
         return indexes_smallest, best_characteristics, best_geometries
 
+    def find_in_range(self, ranges: dict, display: bool = False):
+        """
+        Select every presimulated geometry whose characteristics fall w/in some ranges.
+
+        Args:
+            ranges (dict): Keys are column names in `self.characteristic`.
+                           Numeric characteristics take a [min, max] range (inclusive). Use None for an open end.
+                           Categorical characteristics take a value, and are exact-match constraints.
+                           Ex: {"Qubit_Frequency_GHz": [4, 4.5], "Qubit_Anharmonicity_MHz": [None, 200]}
+            display (bool, optional): Log how many rows matched. Defaults to False.
+
+        Returns:
+            indexes (pd.Index): Indexes of the matching rows, in library order.
+            characteristics (list[dict]): Associated characteristics, same order as `indexes`.
+            geometries (list[dict]): Geometries in the style of QComponent.options, same order as `indexes`.
+        """
+        constraints, bounds = self._split_target_params(ranges)
+        for column, bound in bounds.items():
+            if not (isinstance(bound, (list, tuple)) and len(bound) == 2):
+                raise ValueError(f"`ranges[{column}]` must be a [min, max] range, got {bound}")
+
+        matching_labels = []
+        for labels, values in self._get_partitions(constraints):
+            mask = np.ones(len(labels), dtype=bool)
+            for column, (low, high) in bounds.items():
+                column_values = values[:, self.numeric_columns.index(column)]
+                if low is not None:
+                    mask &= column_values >= low
+                if high is not None:
+                    mask &= column_values <= high
+            matching_labels.append(labels[mask])
+        labels = np.sort(np.concatenate(matching_labels)) if matching_labels else np.array([], dtype=int)
+
+        if display:
+            logging.info(f"{len(labels)} geometries match {ranges}")
+
+        indexes = pd.Index(labels)
+        positions = self._get_positions(indexes)
+        geometries = [self.get_geometry_from_index(index=position) for position in positions]
+        characteristics = [self.get_characteristic_from_index(index=position) for position in positions]
+        return indexes, characteristics, geometries
+
+    def assign(self,
+               targets: list[dict],
+               constraints: dict = None,
+               num_candidates: int = None,
+               metric: str = 'Euclidian'):
+        """
+        Pick one distinct presimulated geometry per target (e.g. every qubit on a chip), minimizing the total distance
+        to the targets while keeping the chosen characteristics apart.
+
+        The `num_candidates` closest rows of every target are found first, then the joint assignment is solved
+        w/ the Hungarian algorithm (`scipy.optimize.linear_sum_assignment`). Picks which break `min_spacing` are
+        repaired by pruning candidates and solving again, see `self._solve_assignment`.
+        If the candidates run out, `num_candidates` is doubled.
+
+        Args:
+            targets (list[dict]): One `target_params` per geometry to pick, see `self.find_closest`.
+            constraints (dict, optional): Must choose keys from `self.__supported_assignment_constraints__`.
+                "min_spacing": {column: spacing}. Any two picked rows differ by at least `spacing` in `column`.
+                "forbidden": {column: [[min, max], ...]}. Rows w/ `column` inside a window are never picked.
+                Ex: {"min_spacing": {"Qubit_Frequency_GHz": 0.1}, "forbidden": {"Qubit_Frequency_GHz": [[4.9, 5.1]]}}
+                Defaults to None.
+            num_candidates (int, optional): Closest rows first considered per target. Defaults to `len(targets) + 10`.
+            metric (str, optional): Metric to determine closeness. Defaults to "Euclidian".
+                                    Must choose from `self.__supported_metrics__`.
+
+        Returns:
+            indexes (pd.Index): Index of the row picked for each target, same order as `targets`.
+            characteristics (list[dict]): Associated characteristics, same order as `targets`.
+            geometries (list[dict]): Geometries in the style of QComponent.options, same order as `targets`.
+        """
+        if metric not in self.__supported_metrics__:
+            raise ValueError(f'`metric` must be one of the following: {self.__supported_metrics__}')
+        constraints = constraints or {}
+        unsupported = [key for key in constraints if key not in self.__supported_assignment_constraints__]
+        if unsupported:
+            raise ValueError(f'`constraints` must only have keys from: {self.__supported_assignment_constraints__}')
+        min_spacing = constraints.get('min_spacing', {})
+        forbidden = constraints.get('forbidden', {})
+        for column in list(min_spacing) + list(forbidden):
+            if column not in self.numeric_columns:
+                raise ValueError(f"{column} is not a numeric column. Choose from: {self.numeric_columns}")
+
+        num_targets = len(targets)
+        if num_targets == 0:
+            raise ValueError('`targets` must have at least one entry.')
+        num_candidates = num_candidates if num_candidates is not None else num_targets + 10
+        # Every row is a candidate
+        self.merge_delta()
+        values = self.characteristic[self.numeric_columns].to_numpy(dtype=float)
+
+        # Prune rows inside forbidden windows
+        allowed = np.ones(len(values), dtype=bool)
+        for column, windows in forbidden.items():
+            column_values = values[:, self.numeric_columns.index(column)]
+            for low, high in windows:
+                allowed &= ~((column_values >= low) & (column_values <= high))
+        if allowed.sum() < num_targets:
+            raise ValueError('Not enough rows left in the library to pick a distinct geometry for every target.')
+
+        spacing_values = values[:, [self.numeric_columns.index(column) for column in min_spacing]]
+        spacing = np.array(list(min_spacing.values()), dtype=float)
+        while True:
+            candidates = self._get_assignment_candidates(targets, values, allowed, num_candidates, metric)
+            result = self._solve_assignment(candidates, spacing_values, spacing)
+            if result is not None:
+                break
+            if num_candidates >= allowed.sum():
+                raise ValueError('`constraints` can\'t be satisfied by the library.')
+            num_candidates = min(2 * num_candidates, int(allowed.sum()))
+
+        positions, total_distance = result
+        indexes = self.characteristic.index[positions]
+        characteristics = [self.get_characteristic_from_index(index=position) for position in positions]
+        geometries = [self.get_geometry_from_index(index=position) for position in positions]
+        logging.info(f"Assigned {num_targets} geometries, total distance {total_distance:.6g}")
+        return indexes, characteristics, geometries
+
+    def _get_assignment_candidates(self, targets: list[dict], values: np.ndarray, allowed: np.ndarray,
+                                   num_candidates: int, metric: str) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        The `num_candidates` closest allowed rows of every target. Used in `self.assign`.
+
+        Returns:
+            candidates (list[tuple[np.ndarray, np.ndarray]]): (positions in `self.characteristic`, distances) per target.
+        """
+        distance_function = getattr(self, f'_distance_{metric}')
+        searched = {} # Allowed (labels, positions, values) per set of categorical constraints
+        candidates = []
+        for target_params in targets:
+            constraints, numeric_params = self._split_target_params(target_params)
+            columns = [self.numeric_columns.index(column) for column in numeric_params]
+            target_values = np.array(list(numeric_params.values()), dtype=float)
+
+            key = tuple(sorted(constraints.items()))
+            if key not in searched:
+                partitions = self._get_partitions(constraints)
+                labels = np.concatenate([labels for labels, _ in partitions]) if partitions else np.array([], dtype=int)
+                positions = self.characteristic.index.get_indexer(labels)
+                keep = allowed[positions]
+                searched[key] = (labels[keep], positions[keep], values[positions[keep]])
+            labels, positions, searched_values = searched[key]
+            distances = distance_function(searched_values[:, columns], target_values)
+
+            top = self._top_k(labels, distances, num_candidates)
+            candidates.append((positions[top], distances[top]))
+        return candidates
+
+    @staticmethod
+    def _solve_assignment(candidates: list[tuple[np.ndarray, np.ndarray]], spacing_values: np.ndarray, spacing: np.ndarray):
+        """
+        Min-cost assignment of one distinct candidate per target, w/ picked rows `spacing` apart. Used in `self.assign`.
+
+        Every round solves the targets left w/ the Hungarian algorithm, then locks in every pick w/o a conflict, and
+        for each conflicting pair the pick which is costlier to move. Candidates too close to a locked pick are
+        pruned before the next round. Each round locks at least one target.
+
+        Args:
+            candidates (list[tuple[np.ndarray, np.ndarray]]): See `self._get_assignment_candidates`.
+            spacing_values (np.ndarray): Shape (rows in the library, len(spacing)). Columns w/ a minimum spacing.
+            spacing (np.ndarray): Minimum spacing of each column of `spacing_values`.
+
+        Returns:
+            (positions, total_distance), or None if the candidates can't satisfy the spacing.
+        """
+        num_targets = len(candidates)
+        columns = np.unique(np.concatenate([positions for positions, _ in candidates]))
+        if len(columns) < num_targets:
+            return None
+
+        # Cost matrix: targets x every candidate of any target. Non-candidates can't be picked.
+        cost = np.full((num_targets, len(columns)), np.inf)
+        for t, (positions, distances) in enumerate(candidates):
+            cost[t, np.searchsorted(columns, positions)] = distances
+        column_values = spacing_values[columns]
+
+        picked = np.full(num_targets, -1)
+        remaining = np.arange(num_targets)
+        available = np.ones(len(columns), dtype=bool)
+        while len(remaining):
+            available_columns = np.nonzero(available)[0]
+            if len(available_columns) < len(remaining):
+                return None
+            try:
+                _, sub_picked = linear_sum_assignment(cost[np.ix_(remaining, available_columns)])
+            except ValueError:
+                return None
+            round_picked = available_columns[sub_picked]
+
+            # Pairs of picks which are too close
+            values = column_values[round_picked]
+            too_close = (np.abs(values[:, None, :] - values[None, :, :]) < spacing).any(axis=2)
+            np.fill_diagonal(too_close, False)
+
+            # Lock picks which are costlier to move first. Regret = next best candidate - current pick
+            still_available = available.copy()
+            still_available[round_picked] = False
+            regret = (np.min(cost[np.ix_(remaining, np.nonzero(still_available)[0])], axis=1, initial=np.inf)
+                      - cost[remaining, round_picked])
+            locked = np.zeros(len(remaining), dtype=bool)
+            for r in np.argsort(-regret, kind='stable'):
+                if not (too_close[r] & locked).any():
+                    locked[r] = True
+
+            for r in np.nonzero(locked)[0]:
+                picked[remaining[r]] = round_picked[r]
+                available &= ~(np.abs(column_values - values[r]) < spacing).any(axis=1)
+                available[round_picked[r]] = False
+            remaining = remaining[~locked]
+
+        return columns[picked], cost[np.arange(num_targets), picked].sum()
+
     def get_geometry_from_index(self, index: int) -> dict:
         """
         Get associated QComponent.options dictionary from index num.
@@ -141,14 +542,25 @@ class Selector:
             options (dict): Associated dictionary for QComponent.options
         
         """
-        df = self.geometry.iloc[index]
+        df = self._get_row("geometry", index)
         keys = list(df.keys())
-        values = [list(df.values)]
+        values = [[self._to_option_value(key, value) for key, value in df.items()]]
         
         options = create_dict_list(keys=keys, values=values)[0]
 
         return options
     
+    def _to_option_value(self, key: str, value):
+        """
+        Undo `Reader.read_library(..., memory='compact')` for a single geometry value.
+        Reattaches units, and turns float32 back into the float written in the library.
+        """
+        if key in self.units:
+            return format_unit_value(value, self.units[key])
+        if isinstance(value, np.float32):
+            return float32_to_float(value)
+        return value
+
     def get_characteristic_from_index(self, index: int) -> dict:
         """
         Get associated characteristics from index num.
@@ -160,7 +572,7 @@ class Selector:
             options (dict): Associated dictionary for QComponent.options
         
         """
-        df = self.characteristic.iloc[index]
+        df = self._get_row("characteristic", index)
         keys = list(df.keys())
         values = [list(df.values)]
         
@@ -168,96 +580,198 @@ class Selector:
 
         return options
 
-    def _find_index_Euclidian(self, target_params: dict, num_top: int):
+    def _get_row(self, part: str, position: int) -> pd.Series:
+        """
+        Row at `position` of `self.geometry` or `self.characteristic` (`part`), followed by the rows
+        `self.append` added since the last `self.merge_delta`.
+        """
+        with self._lock:
+            df = getattr(self, part)
+            if 0 <= position < len(df):
+                return df.iloc[position]
+            pending = [frames[part == "characteristic"] for frames in self.reader.library.pending_rows]
+        num_rows = len(df) + sum(len(frame) for frame in pending)
+        remaining = (position + num_rows if position < 0 else position) - len(df)
+        for frame in pending:
+            if 0 <= remaining < len(frame):
+                return frame.iloc[remaining]
+            remaining -= len(frame)
+        raise IndexError(f"{position} is out of bounds of the library, which has {num_rows} rows.")
+
+    def _get_positions(self, indexes: pd.Index) -> np.ndarray:
+        """Positions of index labels for `self._get_row`. -1 for labels which aren't in the library."""
+        with self._lock:
+            positions = self.characteristic.index.get_indexer(indexes)
+            pending_rows = self.reader.library.pending_rows
+            if pending_rows:
+                # Labels of pending rows are consecutive, see `Reader.append`
+                first = pending_rows[0][1].index[0]
+                num_pending = pending_rows[-1][1].index[-1] + 1 - first
+                labels = indexes.to_numpy()
+                in_pending = (positions < 0) & (labels >= first) & (labels < first + num_pending)
+                positions[in_pending] = len(self.characteristic) + labels[in_pending] - first
+        return positions
+
+    def get_jacobians(self,
+                      indexes=None,
+                      characteristic_columns: list[str] = None,
+                      num_neighbors: int = None) -> pd.DataFrame:
         """
-        Calculates the Euclidean distance between each row in `self.characteristic` and a set of target parameters.
-        It then returns the indexes of the 'num_top' rows with the smallest Euclidean distances.
-        The Euclidean distance is calculated as: sqrt(sum_i (x_i - x_{target})^2),
-        where x_i are the values in the DataFrame and x_{target} are the target parameters.
+        Local sensitivities d(characteristic)/d(geometry) of many rows at once, ex: of the results of `self.find_closest`.
+        Estimated by neighborhood least squares on the unit-parsed geometry, see `metal_library.core.sensitivity`.
+        Results are cached until the library changes (ex: `self.append`).
 
         Args:
-            target_params (dict): A dictionary where the keys are the column names in `self.characteristic`,
-                                  and the values are the target values to compare against.
-                                
-            num_top (int): The number of rows with the smallest Euclidean distances to return.
+            indexes (list, optional): Index labels of rows. Defaults to every row.
+            characteristic_columns (list[str], optional): Characteristics to differentiate.
+                Defaults to every numeric characteristic.
+            num_neighbors (int, optional): Rows in each fit. See `LocalJacobian`. Defaults to None.
 
         Returns:
-            indexes_smallest (pd.Index): Indexes of the 'num_top' rows with the smallest Euclidian distances to the target parameters.
+            jacobians (pd.DataFrame): One row per index. Columns are (characteristic, geometry column),
+                in characteristic units per geometry unit. Ex: jacobians["Qubit_Frequency_GHz"][" cross_length"] in GHz / um
         """
-        # Start with an array of zeros with the same length as the DataFrame
-        distances = np.zeros(self.characteristic.shape[0])
-        
-        # Euclidian Metric
-        for column, target_value in target_params.items():
-            distances += (self.characteristic[column] - target_value)**2
-        distances = np.sqrt(distances)
+        trace = Trace("Selector.get_jacobians", num_neighbors=num_neighbors)
+        # Neighbors are searched among every row
+        self.merge_delta()
+        with self._lock:
+            if self._jacobians_version != self.reader.library.version:
+                self._jacobians = {}
+                self._jacobians_version = self.reader.library.version
+            key = (None if characteristic_columns is None else tuple(characteristic_columns), num_neighbors)
+            trace.cache = "hit" if key in self._jacobians else "miss"
+            if key not in self._jacobians:
+                with trace.stage("index_build"):
+                    self._jacobians[key] = LocalJacobian(self.geometry, self.characteristic,
+                                                         categorical_columns=self.categorical_columns,
+                                                         characteristic_columns=characteristic_columns,
+                                                         num_neighbors=num_neighbors,
+                                                         units=self.units)
+            local_jacobian = self._jacobians[key]
+
+            positions = None
+            if indexes is not None:
+                positions = self.characteristic.index.get_indexer(pd.Index(indexes))
+                if (positions < 0).any():
+                    raise ValueError(f"{list(pd.Index(indexes)[positions < 0])} are not indexes of the library.")
+            with trace.stage("least_squares"):
+                jacobians = local_jacobian.to_frame(positions)
+        trace.count("rows_scanned", len(jacobians))
+        trace.finish()
+        return jacobians
+
+    def get_jacobian_from_index(self, index: int) -> dict:
+        """
+        Local sensitivities of one row, see `self.get_jacobians`.
 
-        # Return the indexes of the rows with the smallest distances
-        distances.sort_values(inplace=True)
-        indexes_smallest =  distances.nsmallest(num_top).index
+        Args:
+            index (int): Index of associated geometry.
 
-        return indexes_smallest
+        Returns:
+            jacobian (dict): Characteristic -> {geometry column -> derivative}.
+        """
+        row = self.get_jacobians([index]).iloc[0]
+        return {characteristic: row[characteristic].to_dict() for characteristic in row.index.unique("characteristic")}
 
-    def _find_index_Manhattan(self, target_params: dict, num_top: int):
+    def _find_index(self, target_params: dict, num_top: int, metric: str = 'Euclidian', trace: Trace = None):
         """
-        Calculates the Manhattan distance between each row self.characteristic and a set of target parameters.
-        It then returns the indexes of the 'num_top' rows with the smallest Manhattan distances.
-        The Manhattan distance is calculated as: sum_i |x_i - x_{target}|,
-        where x_i are the values in the DataFrame and x_{target} are the target parameters.
+        Searches the partitions matching the categorical constraints in `target_params`,
+        and returns the 'num_top' rows w/ the smallest distance to the numeric targets.
 
         Args:
-            target_params (dict): A dictionary where the keys are the column names in self.characteristic,
-                                  and the values are the target values to compare against.
-                                
-            num_top (int): The number of rows with the smallest Manhattan distances to return.
+            target_params (dict): See `self.find_closest`.
+            num_top (int): The number of rows to return.
+            metric (str, optional): Must choose from `self.__supported_metrics__`. Defaults to "Euclidian".
+            trace (Trace, optional): Records the "distance" and "top_k" stages, the rows scanned, and the rows
+                scanned in the delta buffer. Defaults to None.
 
         Returns:
-            indexes_smallest (pd.Index): Indexes of the 'num_top' rows with the smallest Manhattan distances to the target parameters.
+            indexes_smallest (pd.Index): Indexes of the 'num_top' closest rows, closest first.
+                Ties are broken by index.
+            distances (np.ndarray): Associated distances.
         """
-        # Start with an array of zeros with the same length as the DataFrame
-        distances = np.zeros(self.characteristic.shape[0])
-        
-        # Manhattan Metric
-        for column, target_value in target_params.items():
-            distances += np.abs(self.characteristic[column] - target_value)
-        
-        # Return the indexes of the rows with the smallest distances
-        distances.sort_values(inplace=True)
-        indexes_smallest = distances.nsmallest(num_top).index
+        trace = trace if trace is not None else Trace("Selector._find_index")
+        constraints, numeric_params = self._split_target_params(target_params)
+        columns = [self.numeric_columns.index(column) for column in numeric_params]
+        targets = np.array(list(numeric_params.values()), dtype=float)
+        distance_function = getattr(self, f'_distance_{metric}')
+
+        with trace.stage("distance"):
+            all_labels = []
+            all_distances = []
+            for labels, values in self._get_partitions(constraints, trace=trace):
+                all_labels.append(labels)
+                all_distances.append(distance_function(values[:, columns], targets))
+            labels = np.concatenate(all_labels) if all_labels else np.array([], dtype=int)
+            distances = np.concatenate(all_distances) if all_distances else np.array([])
+        trace.count("rows_scanned", len(labels))
+        trace.count("partitions_scanned", len(all_labels))
+
+        with trace.stage("top_k"):
+            top = self._top_k(labels, distances, num_top)
+
+        return pd.Index(labels[top]), distances[top]
+
+    @staticmethod
+    def _top_k(labels: np.ndarray, distances: np.ndarray, num_top: int) -> np.ndarray:
+        """
+        Positions of the `num_top` smallest `distances`, closest first. Ties are broken by `labels`.
+        Only a partial sort is done, so this is O(N) for N >> `num_top`.
+        """
+        num_top = min(num_top, len(distances))
+        if num_top == 0:
+            return np.array([], dtype=int)
+        if num_top < len(distances):
+            # Keep everything tied w/ the k-th distance, so ties are broken by label and not by argpartition
+            kth_distance = distances[np.argpartition(distances, num_top - 1)[num_top - 1]]
+            candidates = np.nonzero(distances <= kth_distance)[0]
+        else:
+            candidates = np.arange(len(distances))
+        return candidates[np.lexsort((labels[candidates], distances[candidates]))][:num_top]
 
-        return indexes_smallest
-    
-    def _find_index_Chebyshev(self, target_params: dict, num_top: int):
+    @staticmethod
+    def _distance_Euclidian(values: np.ndarray, targets: np.ndarray) -> np.ndarray:
         """
-        Calculates the Chebyshev distance between each row in self.characteristic and a set of target parameters.
-        It then returns the indexes of the 'num_top' rows with the largest Chebyshev distances.
-        The Chebyshev distance is calculated as: max_i |x_i - x_{target}|,
-        where x_i are the values in the DataFrame and x_{target} are the target parameters.
+        Euclidean distance between each row of `values` and `targets`: sqrt(sum_i (x_i - x_{target})^2),
+        where x_i are the values in the row and x_{target} are the target parameters.
 
         Args:
-            target_params (dict): A dictionary where the keys are the column names self.characteristic,
-                                  and the values are the target values to compare against.
-                                
-            num_top (int): The number of rows with the smallest Chebyshev distances to return.
+            values (np.ndarray): Shape (N, M). Numeric characteristics.
+            targets (np.ndarray): Shape (M,). Target values, same column order as `values`.
 
         Returns:
-            indexes_smallest (pd.Index): Indexes of the 'num_top' rows with the smallest Chebyshev distances to the target parameters.
+            distances (np.ndarray): Shape (N,).
         """
-        # Initialize an array with a small value
-        distances = np.full(self.characteristic.shape[0], -np.inf)
-        
-        # Chebyshev metric
-        for column, target_value in target_params.items():
-            distances = np.maximum(distances, np.abs(self.characteristic[column] - target_value))
-        
-        # Return the indexes of the rows with the smallest distances
-        distances.sort_values(inplace=True)
-        indexes_smallest =  distances.nsmallest(num_top).index
+        return np.sqrt(((values - targets)**2).sum(axis=1))
 
-        return indexes_smallest
+    @staticmethod
+    def _distance_Manhattan(values: np.ndarray, targets: np.ndarray) -> np.ndarray:
+        """
+        Manhattan distance between each row of `values` and `targets`: sum_i |x_i - x_{target}|,
+        where x_i are the values in the row and x_{target} are the target parameters.
 
+        Args:
+            values (np.ndarray): Shape (N, M). Numeric characteristics.
+            targets (np.ndarray): Shape (M,). Target values, same column order as `values`.
 
+        Returns:
+            distances (np.ndarray): Shape (N,).
+        """
+        return np.abs(values - targets).sum(axis=1)
 
-        
-        
-        
\ No newline at end of file
+    @staticmethod
+    def _distance_Chebyshev(values: np.ndarray, targets: np.ndarray) -> np.ndarray:
+        """
+        Chebyshev distance between each row of `values` and `targets`: max_i |x_i - x_{target}|,
+        where x_i are the values in the row and x_{target} are the target parameters.
+
+        Args:
+            values (np.ndarray): Shape (N, M). Numeric characteristics.
+            targets (np.ndarray): Shape (M,). Target values, same column order as `values`.
+
+        Returns:
+            distances (np.ndarray): Shape (N,).
+        """
+        if values.shape[1] == 0:
+            return np.zeros(len(values))
+        return np.abs(values - targets).max(axis=1)
@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from metal_library.core.reader_helperfunctions import parse_geometry, parse_unit_column
+from metal_library.core.misc_extractor import MISC_FIELDS
+from metal_library.core.grid import RegularGrid
+
+'''
+Local sensitivities of a library: d(characteristic)/d(geometry) at every row.
+
+For each row, the `num_neighbors` closest geometries (in steps of each column's typical spacing,
+so on a sweep grid they're the row and its neighbors along every axis) are fitted w/ a local plane,
+    characteristic ~ characteristic_0 + J @ (geometry - geometry_0),
+by least squares. J is the local Jacobian.
+
+Partitions which are regular grids (see `metal_library.core.grid`) skip the neighbor search:
+J is the finite difference along each axis of the grid (`np.gradient`, second order inside the grid,
+first order on its edges), which is what the fit reduces to on an evenly spaced grid.
+
+Neighbors are only taken from the same partition (categorical characteristics, and swept
+geometry columns which aren't numbers), and every row is solved in vectorized batches.
+Geometries are unit-parsed, so J is in characteristic units per geometry unit (ex: GHz / um).
+A derivative is NaN when the neighbors don't vary along that geometry column.
+
+Example:
+reader = Reader(component_name="TransmonCross")
+reader.read_library(component_type="QubitOnly")
+selector = Selector(reader)
+indexes, _, _ = selector.find_closest({"Qubit_Frequency_GHz": 4}, num_top=10, display=False)
+jacobians = selector.get_jacobians(indexes)
+# Frequency shift of each candidate for a +-2um error on cross_length
+(jacobians["Qubit_Frequency_GHz"][" cross_length"] * 2).abs()
+'''
+
+
+class LocalJacobian:
+    """
+    Neighborhood least-squares Jacobians of a library. See the top of `sensitivity.py`.
+    Rows are solved on first request and kept, so repeated screening is a lookup.
+    """
+
+    def __init__(self,
+                 geometry: pd.DataFrame,
+                 characteristic: pd.DataFrame,
+                 categorical_columns: list[str] = (),
+                 characteristic_columns: list[str] = None,
+                 num_neighbors: int = None,
+                 units: dict = None,
+                 batch_size: int = 50_000):
+        """
+        Initalizes LocalJacobian class. Parses the geometry, and detects a grid or builds a KD-tree per partition.
+
+        Args:
+            geometry (pd.DataFrame): Ex: `Reader.library.geometry`.
+            characteristic (pd.DataFrame): Ex: `Reader.library.characteristic`.
+            categorical_columns (list[str], optional): Categorical characteristics. Rows are only compared
+                w/in the same values. Defaults to ().
+            characteristic_columns (list[str], optional): Characteristics to differentiate.
+                Defaults to every numeric characteristic.
+            num_neighbors (int, optional): Rows in each fit, including the row itself.
+                Defaults to 2 * (number of swept geometry columns) + 1.
+            units (dict, optional): Units of geometry columns already parsed into numbers,
+                ex: `Reader.library.units`. Defaults to {}.
+            batch_size (int, optional): Rows solved at once. Bounds memory. Defaults to 50_000.
+        """
+        if characteristic_columns is None:
+            characteristic_columns = [column for column in characteristic.columns
+                                      if column.strip() not in MISC_FIELDS
+                                      and column not in categorical_columns
+                                      and not isinstance(characteristic[column].dtype, pd.CategoricalDtype)
+                                      and not pd.api.types.is_bool_dtype(characteristic[column])
+                                      and pd.api.types.is_numeric_dtype(characteristic[column])]
+        missing = [column for column in characteristic_columns if column not in characteristic.columns]
+        if missing:
+            raise ValueError(f"{missing} are not columns in `characteristic`.")
+        self.characteristic_columns = list(characteristic_columns)
+        self.batch_size = batch_size
+
+        varying = [column for column in geometry.columns if geometry[column].nunique(dropna=False) > 1]
+        numeric_geometry = parse_geometry(geometry[varying])
+        self.geometry_columns = list(numeric_geometry.columns)
+        units = dict(units) if units else {}
+        for column in self.geometry_columns:
+            if column not in units and not pd.api.types.is_numeric_dtype(geometry[column]):
+                # Same unit `parse_geometry` converted to
+                units[column] = parse_unit_column(geometry[column].drop_duplicates().astype(str))[1]
+        self.units = {column: unit for column, unit in units.items() if column in self.geometry_columns}
+        if not self.geometry_columns:
+            raise ValueError("The library has no swept numeric geometry columns to differentiate by.")
+
+        self.labels = geometry.index.to_numpy()
+        self._features = numeric_geometry.to_numpy(dtype=float)
+        self._targets = characteristic[self.characteristic_columns].to_numpy(dtype=float, na_value=np.nan)
+        self.num_neighbors = num_neighbors if num_neighbors is not None else 2 * len(self.geometry_columns) + 1
+
+        # Steps of each column's typical spacing. On a grid, one step along any axis is a distance of 1
+        self._scale = np.array([self._typical_spacing(self._features[:, i]) for i in range(len(self.geometry_columns))])
+
+        # Partitions: positions of their rows, and their grid or a KD-tree over them
+        categorical_geometry = [column for column in varying if column not in self.geometry_columns]
+        partition_columns = list(categorical_columns) + categorical_geometry
+        if partition_columns:
+            partition_values = pd.concat([characteristic[list(categorical_columns)], geometry[categorical_geometry]], axis=1)
+            groups = partition_values.groupby(partition_columns, sort=False, dropna=False, observed=True).indices
+            groups = list(groups.values())
+        else:
+            groups = [np.arange(len(geometry))]
+        self._partition_of = np.empty(len(geometry), dtype=int)
+        self._partitions = []
+        for i, positions in enumerate(groups):
+            self._partition_of[positions] = i
+            grid = RegularGrid.from_numeric_geometry(numeric_geometry.iloc[positions],
+                                                     characteristic[self.characteristic_columns].iloc[positions])
+            tree = cKDTree(self._features[positions] / self._scale) if grid is None else None
+            self._partitions.append((positions, grid, tree))
+
+        # Solved rows
+        self._jacobians = np.full((len(geometry), len(self.characteristic_columns), len(self.geometry_columns)), np.nan)
+        self._solved = np.zeros(len(geometry), dtype=bool)
+
+    @staticmethod
+    def _typical_spacing(values: np.ndarray) -> float:
+        """Median gap between the sorted unique values of a column."""
+        unique_values = np.unique(values[np.isfinite(values)])
+        if len(unique_values) < 2:
+            return 1.0
+        return float(np.median(np.diff(unique_values)))
+
+    def compute(self, positions: np.ndarray = None) -> np.ndarray:
+        """
+        Jacobians of rows, by position in the library.
+
+        Args:
+            positions (np.ndarray, optional): Integer positions. Defaults to every row.
+
+        Returns:
+            jacobians (np.ndarray): Shape (len(positions), len(self.characteristic_columns), len(self.geometry_columns)).
+        """
+        positions = np.arange(len(self.labels)) if positions is None else np.asarray(positions, dtype=int)
+        unsolved = np.unique(positions[~self._solved[positions]])
+        for partition in np.unique(self._partition_of[unsolved]):
+            partition_positions, grid, _ = self._partitions[partition]
+            if grid is not None:
+                # The whole grid costs about as much as a few of its rows
+                self._jacobians[partition_positions] = self._solve_grid(partition)
+                self._solved[partition_positions] = True
+                continue
+            rows = unsolved[self._partition_of[unsolved] == partition]
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size]
+                self._jacobians[batch] = self._solve(partition, batch)
+                self._solved[batch] = True
+        return self._jacobians[positions]
+
+    def _solve(self, partition: int, rows: np.ndarray) -> np.ndarray:
+        """Least-squares plane through the neighbors of each row in `rows`, all at once. Used in `self.compute`."""
+        partition_positions, _, tree = self._partitions[partition]
+        num_neighbors = min(self.num_neighbors, len(partition_positions))
+        _, neighbors = tree.query(self._features[rows] / self._scale, k=num_neighbors, workers=-1)
+        neighbors = partition_positions[neighbors.reshape(len(rows), num_neighbors)]
+
+        # Shape (rows, neighbors, 1 + geometry columns): intercept, then steps from the row
+        steps = (self._features[neighbors] - self._features[rows][:, None, :]) / self._scale
+        design = np.concatenate([np.ones(steps.shape[:2] + (1,)), steps], axis=2)
+        targets = self._targets[neighbors]
+
+        # Columns which don't vary among the neighbors can't be differentiated by
+        varies = np.ptp(steps, axis=1) > 0
+        design[:, :, 1:] *= varies[:, None, :]
+
+        # Minimum-norm least squares of every row at once, w/ the batched eigendecomposition of the Gram matrix
+        gram = design.transpose(0, 2, 1) @ design
+        eigenvalues, eigenvectors = np.linalg.eigh(gram)
+        kept = eigenvalues > eigenvalues[:, -1:] * 1e-10
+        inverse_eigenvalues = np.where(kept, 1 / np.where(kept, eigenvalues, 1), 0)
+        projected = eigenvectors.transpose(0, 2, 1) @ (design.transpose(0, 2, 1) @ targets)
+        coefficients = eigenvectors @ (projected * inverse_eigenvalues[:, :, None])
+
+        jacobians = coefficients[:, 1:, :].transpose(0, 2, 1) / self._scale
+        # Not identifiable: the column doesn't vary, or the neighbors don't span enough directions
+        rank = kept.sum(axis=1)
+        identifiable = varies & (rank >= 1 + varies.sum(axis=1))[:, None]
+        return np.where(identifiable[:, None, :], jacobians, np.nan)
+
+    def _solve_grid(self, partition: int) -> np.ndarray:
+        """Finite differences along every axis of a grid partition, for all its rows. Used in `self.compute`."""
+        partition_positions, grid, _ = self._partitions[partition]
+        columns = [self.geometry_columns.index(column) for column in grid.axis_columns]
+
+        gradients = np.full(grid.shape + (len(self.characteristic_columns), len(self.geometry_columns)), np.nan)
+        for axis, column in enumerate(columns):
+            gradients[..., column] = np.gradient(grid.values, grid.axes[axis], axis=axis)
+
+        grid_positions = tuple(np.searchsorted(grid.axes[axis], self._features[partition_positions, column])
+                               for axis, column in enumerate(columns))
+        return gradients[grid_positions]
+
+    def to_frame(self, positions: np.ndarray = None) -> pd.DataFrame:
+        """
+        `self.compute` as a DataFrame.
+
+        Returns:
+            jacobians (pd.DataFrame): Index is the library labels of `positions`.
+                Columns are (characteristic, geometry column). Ex: jacobians["Qubit_Frequency_GHz"][" cross_length"]
+        """
+        positions = np.arange(len(self.labels)) if positions is None else np.asarray(positions, dtype=int)
+        jacobians = self.compute(positions)
+        columns = pd.MultiIndex.from_product([self.characteristic_columns, self.geometry_columns],
+                                             names=["characteristic", "geometry"])
+        return pd.DataFrame(jacobians.reshape(len(positions), -1), index=pd.Index(self.labels[positions]), columns=columns)
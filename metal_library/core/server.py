@@ -0,0 +1,326 @@
+import json
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+from metal_library import logging
+from metal_library.core.reader import Reader
+from metal_library.core.selector import Selector
+
+'''
+Selector query server.
+
+Reading a library and building a `Selector` takes far longer than a query.
+`SelectorServer` is a long-running process on localhost which reads each library once,
+keeps its `Selector` in memory, and answers queries from many clients concurrently.
+
+Every endpoint takes a JSON body w/ "component_name" and "component_type"
+(plus an optional "library_path", same as `Reader`), and answers in JSON:
+
+POST /find_closest  {"target_params": {...}, "num_top": 3, "metric": "Euclidian"}
+                    -> {"indexes": [...], "characteristics": [...], "geometries": [...]}
+POST /batch         {"queries": [{...}, {...}], "num_top": 3, "metric": "Euclidian"}
+                    -> {"results": [{"indexes": ..., "characteristics": ..., "geometries": ...}, ...]}
+POST /range         {"ranges": {"Qubit_Frequency_GHz": [4, 4.5]}}
+                    -> {"indexes": [...], "characteristics": [...], "geometries": [...]}
+GET  /health        -> {"status": "ok", "loaded": [[component_name, component_type, library_path], ...]}
+
+Geometries are in the style of QComponent.options. Bad queries answer 400 w/ {"error": "..."}.
+
+`SelectorClient` talks to the server, and falls back to an in-process `Selector`
+when no server is running, so scripts work the same either way.
+
+Example:
+python -m metal_library.core.server --preload TransmonCross:QubitOnly
+
+client = SelectorClient(component_name="TransmonCross", component_type="QubitOnly")
+indexes, characteristics, geometries = client.find_closest({"Qubit_Frequency_GHz": 4}, num_top=3)
+'''
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+def _to_json(value):
+    """`json.dumps` default: convert numpy / pandas values."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (np.ndarray, pd.Index)):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _result_to_json(result) -> dict:
+    """(indexes, characteristics, geometries) -> JSON-ready dict."""
+    indexes, characteristics, geometries = result
+    return dict(indexes=list(indexes), characteristics=characteristics, geometries=geometries)
+
+
+def _result_from_json(result: dict):
+    """Inverse of `_result_to_json`."""
+    return pd.Index(result["indexes"]), result["characteristics"], result["geometries"]
+
+
+class SelectorServer:
+    """
+    Long-running localhost HTTP server w/ a hot `Selector` per library. See the top of `server.py`.
+    """
+
+    __supported_endpoints__ = ['find_closest', 'batch', 'range']
+
+    def __init__(self,
+                 host: str = DEFAULT_HOST,
+                 port: int = DEFAULT_PORT,
+                 memory: str = None):
+        """
+        Initalizes SelectorServer class. Binds the socket, but doesn't serve until `self.serve_forever`.
+
+        Args:
+            host (str, optional): Defaults to "127.0.0.1".
+            port (int, optional): Use 0 to pick a free port. Defaults to 8765.
+            memory (str, optional): Passed to `Reader.read_library`. Defaults to None.
+        """
+        self.memory = memory
+        self.selectors = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+
+        handler = type("SelectorRequestHandler", (_SelectorRequestHandler,), dict(selector_server=self))
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def get_selector(self, component_name: str, component_type: str, library_path: str = None) -> Selector:
+        """
+        Hot `Selector` for a library, reading it on first use.
+        Concurrent first requests for the same library read it only once.
+
+        Args:
+            component_name (str): Ex: "TransmonCross"
+            component_type (str): Ex: "QubitOnly"
+            library_path (str, optional): Same as `Reader`. Defaults to None.
+
+        Returns:
+            selector (Selector)
+        """
+        key = (component_name, component_type, library_path)
+        with self._lock:
+            if key in self.selectors:
+                return self.selectors[key]
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self.selectors:
+                    return self.selectors[key]
+
+            reader = Reader(component_name=component_name, library_path=library_path)
+            reader.read_library(component_type=component_type, memory=self.memory)
+            selector = Selector(reader)
+            logging.info(f"Loaded {component_name}/{component_type} ({len(selector.characteristic)} rows)")
+
+            with self._lock:
+                self.selectors[key] = selector
+                self._loading.pop(key, None)
+        return selector
+
+    def handle(self, endpoint: str, request: dict) -> dict:
+        """
+        Answer one query.
+
+        Args:
+            endpoint (str): Must choose from `self.__supported_endpoints__`.
+            request (dict): JSON body. See the top of `server.py`.
+
+        Returns:
+            response (dict)
+        """
+        if endpoint not in self.__supported_endpoints__:
+            raise ValueError(f'`endpoint` must be one of the following: {self.__supported_endpoints__}')
+
+        selector = self.get_selector(request["component_name"], request["component_type"], request.get("library_path"))
+        num_top = request.get("num_top", 1)
+        metric = request.get("metric", "Euclidian")
+
+        if endpoint == "find_closest":
+            return _result_to_json(selector.find_closest(request["target_params"], num_top=num_top, metric=metric, display=False))
+        if endpoint == "batch":
+            results = selector.find_closest(list(request["queries"]), num_top=num_top, metric=metric, display=False)
+            return dict(results=[_result_to_json(result) for result in results])
+        return _result_to_json(selector.find_in_range(request["ranges"]))
+
+    def serve_forever(self):
+        logging.info(f"Serving metal_library selectors on {self.url}")
+        self.httpd.serve_forever()
+
+    def start(self) -> threading.Thread:
+        """Serve from a background thread. Returns the thread."""
+        thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _SelectorRequestHandler(BaseHTTPRequestHandler):
+    """Routes HTTP requests to `self.selector_server`."""
+
+    selector_server = None
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/health":
+            return self._send(404, dict(error=f"Unknown endpoint {self.path}"))
+        with self.selector_server._lock:
+            loaded = [list(key) for key in self.selector_server.selectors]
+        self._send(200, dict(status="ok", loaded=loaded))
+
+    def do_POST(self):
+        endpoint = self.path.strip("/")
+        if endpoint not in SelectorServer.__supported_endpoints__:
+            return self._send(404, dict(error=f"Unknown endpoint {self.path}"))
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            response = self.selector_server.handle(endpoint, request)
+        except KeyError as error:
+            return self._send(400, dict(error=f"{error} is missing from the request."))
+        except (ValueError, TypeError, FileNotFoundError) as error:
+            return self._send(400, dict(error=str(error)))
+        except Exception as error:
+            logging.exception("Selector query failed")
+            return self._send(500, dict(error=str(error)))
+        self._send(200, response)
+
+    def _send(self, status: int, body: dict):
+        content = json.dumps(body, default=_to_json).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+class SelectorClient:
+    """
+    Client for `SelectorServer`. Falls back to an in-process `Selector` when no server is running.
+    Results are the same as `Selector`'s either way.
+    """
+
+    def __init__(self,
+                 component_name: str,
+                 component_type: str,
+                 library_path: str = None,
+                 url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}",
+                 timeout: float = 60):
+        """
+        Initalizes SelectorClient class.
+
+        Args:
+            component_name (str): Ex: "TransmonCross"
+            component_type (str): Ex: "QubitOnly"
+            library_path (str, optional): Same as `Reader`. Defaults to None.
+            url (str, optional): Server address. Defaults to "http://127.0.0.1:8765".
+            timeout (float, optional): Seconds before a request fails. Defaults to 60.
+        """
+        self.component_name = component_name
+        self.component_type = component_type
+        self.library_path = library_path
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+        # Only built if the server can't be reached
+        self.selector = None
+
+    @property
+    def in_process(self) -> bool:
+        """True once the client has fallen back to an in-process `Selector`."""
+        return self.selector is not None
+
+    def find_closest(self, target_params, num_top: int, metric: str = 'Euclidian'):
+        """
+        Same as `Selector.find_closest(..., display=False)`. Pass a list of dicts to batch queries in one request.
+        """
+        if isinstance(target_params, dict):
+            response = self._query("find_closest", dict(target_params=target_params, num_top=num_top, metric=metric))
+            if response is None:
+                return self.selector.find_closest(target_params, num_top=num_top, metric=metric, display=False)
+            return _result_from_json(response)
+
+        queries = list(target_params)
+        response = self._query("batch", dict(queries=queries, num_top=num_top, metric=metric))
+        if response is None:
+            return self.selector.find_closest(queries, num_top=num_top, metric=metric, display=False)
+        return [_result_from_json(result) for result in response["results"]]
+
+    def find_in_range(self, ranges: dict):
+        """
+        Same as `Selector.find_in_range`.
+        """
+        response = self._query("range", dict(ranges=ranges))
+        if response is None:
+            return self.selector.find_in_range(ranges)
+        return _result_from_json(response)
+
+    def _query(self, endpoint: str, body: dict) -> dict:
+        """POST a query. Returns None (after building `self.selector`) if the server can't be reached."""
+        if self.in_process:
+            return None
+
+        body = dict(body, component_name=self.component_name, component_type=self.component_type,
+                    library_path=self.library_path)
+        request = urllib.request.Request(f"{self.url}/{endpoint}",
+                                         data=json.dumps(body, default=_to_json).encode(),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            try:
+                message = json.loads(error.read()).get("error", error.reason)
+            except ValueError:
+                message = error.reason
+            raise ValueError(f"Selector server: {message}") from None
+        except (urllib.error.URLError, ConnectionError):
+            logging.info(f"No selector server at {self.url}, reading the library in-process.")
+            reader = Reader(component_name=self.component_name, library_path=self.library_path)
+            reader.read_library(component_type=self.component_type)
+            self.selector = Selector(reader)
+            return None
+
+
+def main(args=None):
+    """Command line entry point. See `python -m metal_library.core.server --help`."""
+    parser = argparse.ArgumentParser(description="Serve metal_library Selector queries on localhost")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--memory", default=None, choices=[mode for mode in Reader.__supported_memory_modes__ if mode])
+    parser.add_argument("--preload", action="append", default=[],
+                        help="component_name:component_type to read at startup (repeatable). Ex: TransmonCross:QubitOnly")
+    args = parser.parse_args(args)
+
+    server = SelectorServer(host=args.host, port=args.port, memory=args.memory)
+    for preload in args.preload:
+        component_name, component_type = preload.split(":")
+        server.get_selector(component_name, component_type)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
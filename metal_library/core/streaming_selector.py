@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+from metal_library.core.reader import Reader
+from metal_library.core.selector import Selector
+from metal_library.core.reader_helperfunctions import get_categorical_columns
+from metal_library.core.sweeper_helperfunctions import create_dict_list
+
+
+class StreamingSelector:
+    """
+    Out-of-core version of `Selector.find_closest`.
+
+    The library is read w/ `Reader.iter_library` in chunks of `chunksize` rows. Each query keeps its
+    running top `num_top` rows (labels, distances and the rows themselves) and merges every chunk's
+    candidates into it, so memory is bounded by `chunksize` and `num_top * len(queries)`,
+    not by the size of the library. Several queries share one pass over the file.
+
+    Example:
+    reader = Reader(component_name="TransmonCross")
+    selector = StreamingSelector(reader, component_type="QubitOnly", chunksize=50_000)
+    indexes, characteristics, geometries = selector.find_closest({"Qubit_Frequency_GHz": 4}, num_top=3)
+    results = selector.find_closest([{"Qubit_Frequency_GHz": 4}, {"Qubit_Frequency_GHz": 4.2}], num_top=3)
+    """
+
+    __supported_metrics__ = Selector.__supported_metrics__
+
+    def __init__(self,
+                 reader: Reader,
+                 component_type: str,
+                 chunksize: int = 100_000):
+        """
+        Initalizes StreamingSelector class. Unlike `Selector`, `Reader.read_library` doesn't need to be run.
+
+        Args:
+            reader (Reader): Reader pointing at the library.
+            component_type (str): Type of component. Choose from `reader.component_types`.
+            chunksize (int, optional): Rows read per chunk. Defaults to 100_000.
+        """
+        if not isinstance(reader, Reader):
+            raise TypeError("`reader` must be `metal_library.Reader`")
+        if component_type not in reader._get_component_types():
+            raise ValueError(f'`component_type` must be from the following: {reader._get_component_types()}')
+
+        self.reader = reader
+        self.component_type = component_type
+        self.chunksize = chunksize
+
+    def find_closest(self,
+                     target_params,
+                     num_top: int,
+                     metric: str = 'Euclidian'):
+        """
+        Select the closest presimulated geometries for one or many sets of characteristics, in a single pass.
+
+        Args:
+            target_params (dict or list[dict]): Same as `Selector.find_closest`. Pass a list to batch queries.
+                Categorical characteristics are exact-match constraints.
+            num_top (int): The number of closest rows to return, per query.
+            metric (str, optional): Metric to determine closeness. Defaults to "Euclidian".
+                                    Must choose from `self.__supported_metrics__`.
+
+        Returns:
+            For a single dict, same as `Selector.find_closest`:
+                indexes_smallest (pd.Index), best_characteristics (list[dict]), best_geometries (list[dict])
+            For a list of dicts, a list of those tuples, in the same order.
+        """
+        if metric not in self.__supported_metrics__:
+            raise ValueError(f'`metric` must be one of the following: {self.__supported_metrics__}')
+        single_query = isinstance(target_params, dict)
+        queries = [target_params] if single_query else list(target_params)
+        distance_function = getattr(Selector, f'_distance_{metric}')
+
+        # Running top-k per query: labels, distances, geometry rows, characteristic rows
+        best = [None] * len(queries)
+
+        for geometry, characteristic in self.reader.iter_library(self.component_type, chunksize=self.chunksize):
+            categorical_columns = get_categorical_columns(self.reader.metadata, self.component_type, characteristic.columns)
+            labels = characteristic.index.to_numpy()
+
+            for q, query in enumerate(queries):
+                constraints = {column: value for column, value in query.items() if column in categorical_columns}
+                numeric_params = {column: value for column, value in query.items() if column not in categorical_columns}
+                missing = [column for column in query if column not in characteristic.columns]
+                if missing:
+                    raise ValueError(f"{missing} are not columns in the library. Choose from: {list(characteristic.columns)}")
+
+                mask = np.ones(len(characteristic), dtype=bool)
+                for column, value in constraints.items():
+                    mask &= (characteristic[column] == value).to_numpy()
+                if not mask.any():
+                    continue
+
+                values = characteristic.loc[mask, list(numeric_params)].to_numpy(dtype=float)
+                targets = np.array(list(numeric_params.values()), dtype=float)
+                distances = distance_function(values, targets)
+                positions = np.nonzero(mask)[0]
+
+                # Only this chunk's own top-k can make it into the running top-k
+                top = Selector._top_k(labels[positions], distances, num_top)
+                positions, distances = positions[top], distances[top]
+
+                best[q] = self._merge(best[q], labels[positions], distances,
+                                      geometry.iloc[positions], characteristic.iloc[positions], num_top)
+
+        results = []
+        for q, query in enumerate(queries):
+            if best[q] is None or len(best[q][0]) < num_top:
+                raise ValueError('`num_top` cannot be bigger than size of read-in library.')
+            best_labels, _, best_geometry, best_characteristic = best[q]
+            results.append((pd.Index(best_labels),
+                            [self._row_to_dict(row) for _, row in best_characteristic.iterrows()],
+                            [self._row_to_dict(row) for _, row in best_geometry.iterrows()]))
+
+        return results[0] if single_query else results
+
+    @staticmethod
+    def _merge(best, labels, distances, geometry, characteristic, num_top):
+        """Merge a chunk's candidates into a query's running top-k. Ties are broken by index, like `Selector`."""
+        if best is not None:
+            labels = np.concatenate([best[0], labels])
+            distances = np.concatenate([best[1], distances])
+            geometry = pd.concat([best[2], geometry])
+            characteristic = pd.concat([best[3], characteristic])
+
+        order = np.lexsort((labels, distances))[:num_top]
+        return labels[order], distances[order], geometry.iloc[order], characteristic.iloc[order]
+
+    @staticmethod
+    def _row_to_dict(row: pd.Series) -> dict:
+        """Convert a library row into a (nested) dictionary, like `Selector.get_geometry_from_index`."""
+        return create_dict_list(keys=list(row.keys()), values=[list(row.values)])[0]
@@ -0,0 +1,264 @@
+import json
+from itertools import combinations_with_replacement
+
+import numpy as np
+import pandas as pd
+
+from metal_library.core.reader import Reader
+from metal_library.core.reader_helperfunctions import parse_geometry, parse_unit_column
+
+
+class Surrogate:
+    """
+    Forward model from geometry to characteristics, fitted to a library read by `Reader`.
+
+    The model is Bayesian polynomial ridge regression on the unit-parsed, standardized geometry.
+    Geometries to predict are converted to the units of the library (`self.units`), so "0.185mm" and "185um" are the same.
+    Besides the prediction it returns a standard deviation:
+        std = sigma * sqrt(1 + phi^T A^{-1} phi)
+    where `sigma` is the residual error of the fit, `phi` the polynomial features of a geometry
+    and `A = Phi^T Phi + ridge * I`. It grows as you move away from simulated geometries.
+
+    Everything is evaluated w/ matrix products in batches, so millions of candidate
+    geometries can be screened before sending the promising ones to the simulator.
+
+    Example:
+    reader = Reader(component_name="TransmonCross")
+    reader.read_library(component_type="QubitOnly")
+    surrogate = Surrogate.from_reader(reader)
+    mean, std = surrogate.predict(candidate_geometries)
+    surrogate.save("QubitOnly.surrogate.npz")
+    """
+
+    def __init__(self, degree: int = 3, ridge: float = 1e-6):
+        """
+        Initalizes Surrogate class. Call `self.fit` before `self.predict`.
+
+        Args:
+            degree (int, optional): Maximum total degree of the polynomial. Defaults to 3.
+            ridge (float, optional): L2 regularization of the coefficients. Defaults to 1e-6.
+        """
+        self.degree = degree
+        self.ridge = ridge
+
+        # Will be overwritten by `self.fit`
+        self.component_type = None
+        self.feature_columns = None
+        self.units = None
+        self.characteristic_columns = None
+        self.feature_mean = None
+        self.feature_scale = None
+        self.exponents = None
+        self.coefficients = None
+        self.covariance = None
+        self.sigma = None
+
+    @classmethod
+    def from_reader(cls, reader: Reader, characteristic_columns: list[str] = None, **kwargs) -> 'Surrogate':
+        """
+        Fit a surrogate to `reader.library`.
+
+        Args:
+            reader (Reader): Must have run `Reader.read_library`.
+            characteristic_columns (list[str], optional): Characteristics to model.
+                Defaults to every numeric column of `reader.library.characteristic`.
+            **kwargs: Passed to `Surrogate.__init__`.
+
+        Returns:
+            surrogate (Surrogate)
+        """
+        if not (hasattr(reader.library, 'geometry') and hasattr(reader.library, 'characteristic')):
+            raise AttributeError('`Reader` must have `Reader.library` created. Run `Reader.read_library` before fitting `Surrogate`.')
+
+        reader.merge_appended()
+        surrogate = cls(**kwargs)
+        surrogate.fit(reader.library.geometry, reader.library.characteristic, characteristic_columns, units=reader.library.units)
+        surrogate.component_type = reader.library.component_type
+        return surrogate
+
+    def fit(self,
+            geometry: pd.DataFrame,
+            characteristic: pd.DataFrame,
+            characteristic_columns: list[str] = None,
+            units: dict = None) -> 'Surrogate':
+        """
+        Fit the surrogate.
+
+        Args:
+            geometry (pd.DataFrame): Geometries, in the style of `Reader.library.geometry`.
+            characteristic (pd.DataFrame): Characteristics, in the style of `Reader.library.characteristic`.
+            characteristic_columns (list[str], optional): Characteristics to model.
+                Defaults to every numeric column of `characteristic`.
+            units (dict, optional): Units of geometry columns already parsed into numbers,
+                ex: `Reader.library.units`. Defaults to {}.
+
+        Returns:
+            self (Surrogate)
+        """
+        if characteristic_columns is None:
+            characteristic_columns = [column for column in characteristic.columns
+                                      if pd.api.types.is_numeric_dtype(characteristic[column])]
+
+        # Only geometry which varies carries information
+        numeric_geometry = parse_geometry(geometry)
+        varying = numeric_geometry.columns[numeric_geometry.nunique() > 1]
+        numeric_geometry = numeric_geometry[varying]
+
+        x = numeric_geometry.to_numpy(dtype=float)
+        y = characteristic[characteristic_columns].to_numpy(dtype=float)
+        finite = np.isfinite(x).all(axis=1) & np.isfinite(y).all(axis=1)
+        x, y = x[finite], y[finite]
+
+        self.feature_columns = list(varying)
+        units = dict(units) if units else {}
+        for column in self.feature_columns:
+            if column not in units and not pd.api.types.is_numeric_dtype(geometry[column]):
+                # Same unit `parse_geometry` converted to
+                units[column] = parse_unit_column(geometry[column].drop_duplicates().astype(str))[1]
+        self.units = {column: unit for column, unit in units.items() if column in self.feature_columns}
+        self.characteristic_columns = list(characteristic_columns)
+        self.feature_mean = x.mean(axis=0)
+        self.feature_scale = x.std(axis=0)
+        self.exponents = self._make_exponents(len(self.feature_columns), self.degree)
+
+        phi = self._features(x)
+        num_samples, num_terms = phi.shape
+        A = phi.T @ phi + self.ridge * np.eye(num_terms)
+        self.covariance = np.linalg.pinv(A)
+        self.coefficients = self.covariance @ phi.T @ y
+
+        residuals = y - phi @ self.coefficients
+        dof = max(num_samples - num_terms, 1)
+        self.sigma = np.sqrt((residuals**2).sum(axis=0) / dof)
+
+        return self
+
+    def predict(self,
+                geometry,
+                batch_size: int = 100_000) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Predict characteristics for many geometries at once.
+
+        Args:
+            geometry (pd.DataFrame or np.ndarray): Candidate geometries.
+                pd.DataFrame: in the style of `Reader.library.geometry`, must contain `self.feature_columns`.
+                    Strings w/ units are converted to `self.units`, numbers are taken to be in `self.units`.
+                np.ndarray: shape (N, len(self.feature_columns)), already unit-parsed into `self.units`. Fastest.
+            batch_size (int, optional): Rows evaluated per matrix product. Defaults to 100_000.
+
+        Returns:
+            mean (pd.DataFrame): Predicted characteristics. Columns are `self.characteristic_columns`.
+            std (pd.DataFrame): Standard deviation of each prediction.
+        """
+        if self.coefficients is None:
+            raise AttributeError('`Surrogate` must be fit. Run `Surrogate.fit` or `Surrogate.from_reader` first.')
+
+        if isinstance(geometry, pd.DataFrame):
+            index = geometry.index
+            missing = [column for column in self.feature_columns if column not in geometry.columns]
+            if missing:
+                raise ValueError(f'`geometry` is missing columns: {missing}')
+            x = np.column_stack([self._parse_column(geometry[column], column) for column in self.feature_columns])
+        else:
+            x = np.asarray(geometry, dtype=float)
+            if x.ndim != 2 or x.shape[1] != len(self.feature_columns):
+                raise ValueError(f'`geometry` must have shape (N, {len(self.feature_columns)}), ordered as {self.feature_columns}')
+            index = pd.RangeIndex(len(x))
+
+        mean = np.empty((len(x), len(self.characteristic_columns)))
+        std = np.empty((len(x), len(self.characteristic_columns)))
+        for start in range(0, len(x), batch_size):
+            batch = slice(start, start + batch_size)
+            phi = self._features(x[batch])
+            mean[batch] = phi @ self.coefficients
+            leverage = ((phi @ self.covariance) * phi).sum(axis=1)
+            std[batch] = np.sqrt(1 + leverage)[:, None] * self.sigma[None, :]
+
+        return (pd.DataFrame(mean, index=index, columns=self.characteristic_columns),
+                pd.DataFrame(std, index=index, columns=self.characteristic_columns))
+
+    def _parse_column(self, values: pd.Series, column: str) -> np.ndarray:
+        """Numbers of a geometry column, in `self.units[column]`. Used in `self.predict`."""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(values.cat.categories.dtype)
+        if pd.api.types.is_numeric_dtype(values):
+            return values.to_numpy(dtype=float)
+
+        # Sweeps repeat a handful of values, so only parse each one once
+        codes, unique_values = pd.factorize(values, use_na_sentinel=False)
+        parsed = parse_unit_column(pd.Series(np.asarray(unique_values, dtype=object)), unit=self.units.get(column))
+        if parsed is None:
+            raise ValueError(f'`{column}` must be numbers, or numbers w/ units convertible to "{self.units.get(column)}".')
+        return parsed[0][codes]
+
+    def save(self, path: str):
+        """
+        Write the fitted surrogate to a `.npz` file.
+
+        Args:
+            path (str): Ex: "QubitOnly.surrogate.npz"
+        """
+        info = dict(degree=self.degree,
+                    ridge=self.ridge,
+                    component_type=self.component_type,
+                    feature_columns=self.feature_columns,
+                    units=self.units,
+                    characteristic_columns=self.characteristic_columns)
+        np.savez(path,
+                 info=np.array(json.dumps(info)),
+                 feature_mean=self.feature_mean,
+                 feature_scale=self.feature_scale,
+                 exponents=self.exponents,
+                 coefficients=self.coefficients,
+                 covariance=self.covariance,
+                 sigma=self.sigma)
+
+    @classmethod
+    def load(cls, path: str) -> 'Surrogate':
+        """
+        Read a surrogate written by `Surrogate.save`.
+
+        Args:
+            path (str): Ex: "QubitOnly.surrogate.npz"
+
+        Returns:
+            surrogate (Surrogate)
+        """
+        with np.load(path) as data:
+            info = json.loads(str(data['info']))
+            surrogate = cls(degree=info['degree'], ridge=info['ridge'])
+            surrogate.component_type = info['component_type']
+            surrogate.feature_columns = info['feature_columns']
+            surrogate.units = info.get('units', {})
+            surrogate.characteristic_columns = info['characteristic_columns']
+            for name in ['feature_mean', 'feature_scale', 'exponents', 'coefficients', 'covariance', 'sigma']:
+                setattr(surrogate, name, data[name])
+        return surrogate
+
+    def _features(self, x: np.ndarray) -> np.ndarray:
+        """Polynomial features of standardized `x`, shape (N, len(self.exponents))."""
+        scale = np.where(self.feature_scale > 0, self.feature_scale, 1.0)
+        z = (x - self.feature_mean) / scale
+
+        # Each monomial is a lower degree monomial times one more feature
+        combos = [tuple(np.repeat(np.arange(len(exponent)), exponent)) for exponent in self.exponents]
+        column_of = {combo: j for j, combo in enumerate(combos)}
+        phi = np.empty((len(z), len(combos)), order='F')
+        for j, combo in enumerate(combos):
+            if len(combo) == 0:
+                phi[:, j] = 1.0
+            else:
+                np.multiply(phi[:, column_of[combo[:-1]]], z[:, combo[-1]], out=phi[:, j])
+        return phi
+
+    @staticmethod
+    def _make_exponents(num_features: int, degree: int) -> np.ndarray:
+        """Exponents of every monomial w/ total degree <= `degree`. Shape (num_terms, num_features)."""
+        exponents = []
+        for total_degree in range(degree + 1):
+            for combo in combinations_with_replacement(range(num_features), total_degree):
+                exponent = np.zeros(num_features, dtype=int)
+                for k in combo:
+                    exponent[k] += 1
+                exponents.append(exponent)
+        return np.array(exponents, dtype=int).reshape(len(exponents), num_features)
@@ -0,0 +1,446 @@
+import os
+import json
+import time
+import zlib
+import struct
+
+import numpy as np
+import pandas as pd
+
+from metal_library.core.compactor import SPLITTER
+from metal_library.core import misc_extractor
+
+'''
+Chunked, columnar sweep output (`.msweep`).
+
+`QLibrarian.append_csv` reopens the output and formats a whole row as CSV text for every simulated
+configuration. `SweepWriter` instead keeps the file open, buffers configurations, and writes them
+as one binary chunk (a single `write`) every `chunk_size` configurations or every `flush_seconds`,
+whichever comes first. Slow sweeps (minutes per configuration) still write every configuration
+as soon as it's simulated, fast ones batch many configurations into a chunk.
+
+The file is a sequence of blocks, after MAGIC:
+    block = BLOCK (tag, flags, number of rows, header length, body length), body
+
+    SCHEMA_TAG  body: JSON list of new [section, name] columns. A column's id is its position
+                in the list of every column declared so far.
+    CHUNK_TAG   body: header (JSON), then the column buffers. zlib compressed as a whole if
+                flags & COMPRESSED. The header lists the chunk's columns by id. Each column is stored as
+                    - [id, dtype]: its raw little-endian numbers (int, float, bool), or
+                    - [id, number of strings]: the int32 length of each of its distinct strings,
+                      the strings (utf-8), and an int32 code per row (-1 for missing).
+                Values which aren't numbers or strings (ex: the `misc` dict) are stored as `str(value)`,
+                like they would be in a CSV.
+    FOOTER_TAG  body: JSON w/ the offset and rows of every chunk, and every column.
+                Written by `SweepWriter.close`, then followed by TRAILER (offset of the footer, TRAILER_TAG).
+
+Schema evolution: a result key which shows up mid-sweep is declared in a new schema block, and is a column
+of the chunks from then on. `SweepReader` fills it w/ NaN (numbers) or None (strings) in earlier chunks.
+
+`SweepReader` jumps to the chunks through the footer. W/o one (the sweep is still running, or crashed),
+it walks the blocks from the start, and stops before a block which isn't completely written yet.
+`SweepReader.refresh` picks up the chunks written since. Reopening a file w/ `SweepWriter` appends to it.
+
+`sweep_to_csv` converts a sweep to the library CSV layout (geometry, `__SPLITTER__`, characteristics).
+
+Example:
+with SweepWriter("sweep.msweep") as writer:
+    writer.append(qoption_data, simulation_data)  # Same arguments as `QLibrarian.append_csv`
+
+qoptions, simulations = SweepReader("sweep.msweep").read()
+sweep_to_csv("sweep.msweep", "QubitOnly.csv")
+'''
+
+SWEEP_SUFFIX = '.msweep'
+
+MAGIC = b'MLSWEEP1'
+SCHEMA_TAG = b'MLSC'
+CHUNK_TAG = b'MLCK'
+FOOTER_TAG = b'MLFT'
+TRAILER_TAG = b'MLSWIDX1'
+
+COMPRESSED = 1
+
+# Tag, flags, number of rows, header length, body length
+BLOCK = struct.Struct('<4sIIIQ')
+# Footer offset, tag
+TRAILER = struct.Struct('<Q8s')
+
+QOPTION_SECTION = 'qoption'
+SIMULATION_SECTION = 'simulation'
+_SECTIONS = [QOPTION_SECTION, SIMULATION_SECTION]
+
+
+def _encode_column(values: np.ndarray) -> tuple[object, list[bytes]]:
+    """
+    Encode one column of a chunk.
+
+    Returns:
+        description (str or int): Its entry in the chunk header, after its id.
+            The dtype of an "array" column, or the number of strings of a "dictionary" column.
+        buffers (list[bytes])
+    """
+    if values.dtype.kind in 'biufc':
+        values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+        return values.dtype.str, [values.tobytes()]
+
+    values = values.astype(object)
+    missing = pd.isna(values)
+    text = [value if isinstance(value, str) else str(value) for value in values[~missing]]
+    codes = np.full(len(values), -1, dtype='<i4')
+    present_codes, uniques = pd.factorize(pd.Series(text, dtype=object))
+    codes[~missing] = present_codes
+    encoded = [unique.encode('utf-8') for unique in uniques]
+    lengths = np.array([len(value) for value in encoded], dtype='<i4')
+    return len(encoded), [lengths.tobytes(), b''.join(encoded), codes.tobytes()]
+
+
+def _column_end(description, num_rows: int, body: memoryview, offset: int) -> int:
+    """Where the buffers of a column starting at `offset` end."""
+    if isinstance(description, str):
+        return offset + num_rows * np.dtype(description).itemsize
+    lengths = np.frombuffer(body[offset:offset + 4 * description], dtype='<i4')
+    return offset + 4 * description + int(lengths.sum()) + 4 * num_rows
+
+
+def _decode_column(description, num_rows: int, body: memoryview, offset: int) -> np.ndarray:
+    """Inverse of `_encode_column`."""
+    if isinstance(description, str):
+        return np.frombuffer(body[offset:offset + num_rows * np.dtype(description).itemsize], dtype=description)
+
+    lengths = np.frombuffer(body[offset:offset + 4 * description], dtype='<i4')
+    offset += 4 * description
+    ends = np.cumsum(lengths)
+    text = bytes(body[offset:offset + int(ends[-1]) if len(ends) else offset])
+    offset += len(text)
+    # Code -1 (missing) picks the trailing None
+    uniques = np.array([text[end - length:end].decode('utf-8') for length, end in zip(lengths, ends)] + [None],
+                       dtype=object)
+    return uniques[np.frombuffer(body[offset:offset + 4 * num_rows], dtype='<i4')]
+
+
+def _as_frame(data) -> pd.DataFrame:
+    """One configuration (dict), or several (pd.DataFrame), as a DataFrame."""
+    if isinstance(data, pd.DataFrame):
+        return data
+    return pd.DataFrame([data])
+
+
+def _concatenate(pieces: list, lengths: list[int]) -> np.ndarray:
+    """Join the pieces of a column. Pieces w/o the column (None) are filled w/ NaN (numbers) or None."""
+    present = [piece for piece in pieces if piece is not None]
+    if len(present) == 1 and len(pieces) == 1:
+        return present[0]
+    if all(piece.dtype.kind in 'iufc' for piece in present):
+        pieces = [piece if piece is not None else np.full(length, np.nan) for piece, length in zip(pieces, lengths)]
+    elif len(present) < len(pieces) or len({piece.dtype.kind for piece in present}) > 1:
+        pieces = [piece.astype(object) if piece is not None else np.full(length, None, dtype=object)
+                  for piece, length in zip(pieces, lengths)]
+    return np.concatenate(pieces) if pieces else np.array([])
+
+
+class SweepWriter:
+    """
+    Appends simulated configurations to a `.msweep` file. See the top of `sweep_store.py`.
+    """
+
+    def __init__(self,
+                 path: str,
+                 chunk_size: int = 256,
+                 flush_seconds: float = 60.0,
+                 compression_level: int = 1):
+        """
+        Initalizes SweepWriter class. Opens `path`, and appends to it if it already holds a sweep.
+
+        Args:
+            path (str): Ex: "sweep.msweep"
+            chunk_size (int, optional): Configurations per chunk. Defaults to 256.
+            flush_seconds (float, optional): Write buffered configurations once this many seconds have
+                passed since the last write, even if the chunk isn't full. Defaults to 60.
+            compression_level (int, optional): zlib level of the chunks, 0 to not compress. Defaults to 1.
+        """
+        if chunk_size < 1:
+            raise ValueError('`chunk_size` must be at least 1.')
+        self.path = path
+        self.chunk_size = chunk_size
+        self.flush_seconds = flush_seconds
+        self.compression_level = compression_level
+
+        self.chunks = []
+        self.columns = []
+        self._column_ids = {}
+        # (section, name) -> array of each appended batch, or None if the batch didn't have the column
+        self._buffer = {}
+        self._batch_lengths = []
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            # Drop the footer (rewritten on close), and any block a crashed writer left incomplete
+            existing = SweepReader(path)
+            self.chunks = [list(chunk) for chunk in existing.chunks]
+            os.truncate(path, existing.end)
+            self.columns = [list(column) for column in existing.columns]
+            self._column_ids = {tuple(column): i for i, column in enumerate(self.columns)}
+            self._file = open(path, 'ab', buffering=0)
+        else:
+            self._file = open(path, 'wb', buffering=0)
+            self._file.write(MAGIC)
+        self._last_flush = time.monotonic()
+
+    @property
+    def num_rows(self) -> int:
+        """Configurations appended so far, including buffered ones."""
+        return sum(num_rows for _, num_rows in self.chunks) + sum(self._batch_lengths)
+
+    def append(self, qoption_data, simulation_data):
+        """
+        Append configurations.
+
+        Args:
+            qoption_data (pd.DataFrame or dict): Geometry, ex: `QLibrarian.qoptions.tail(n=1)`.
+            simulation_data (pd.DataFrame or dict): Results, ex: `QLibrarian.simulations.tail(n=1)`.
+                New keys become new columns.
+        """
+        if self._file is None:
+            raise ValueError(f'`{self.path}` is closed.')
+        frames = [_as_frame(qoption_data), _as_frame(simulation_data)]
+        if len(frames[0]) != len(frames[1]):
+            raise ValueError('`qoption_data` and `simulation_data` must have the same number of rows.')
+
+        for section, frame in zip(_SECTIONS, frames):
+            for name in frame.columns:
+                pieces = self._buffer.setdefault((section, str(name)), [])
+                pieces.extend([None] * (len(self._batch_lengths) - len(pieces)))
+                pieces.append(frame[name].to_numpy())
+        self._batch_lengths.append(len(frames[0]))
+        if sum(self._batch_lengths) >= self.chunk_size or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def _write_block(self, tag: bytes, body: bytes, flags: int = 0, num_rows: int = 0, header_length: int = 0,
+                     trailer: bytes = b'') -> int:
+        """Write a block w/ one `write`. Returns its offset."""
+        offset = self._file.tell()
+        self._file.write(BLOCK.pack(tag, flags, num_rows, header_length, len(body)) + body + trailer)
+        return offset
+
+    def _declare(self, columns: list):
+        """Add columns to the schema, w/ a schema block."""
+        columns = [list(column) for column in columns]
+        self._write_block(SCHEMA_TAG, json.dumps(columns).encode('utf-8'))
+        for column in columns:
+            self._column_ids[tuple(column)] = len(self.columns)
+            self.columns.append(column)
+
+    def flush(self):
+        """Write buffered configurations as one chunk."""
+        self._last_flush = time.monotonic()
+        num_rows = sum(self._batch_lengths)
+        if not num_rows:
+            return
+
+        new_columns = [column for column in self._buffer if column not in self._column_ids]
+        if new_columns:
+            self._declare(new_columns)
+
+        columns, buffers = [], []
+        for column, pieces in self._buffer.items():
+            pieces.extend([None] * (len(self._batch_lengths) - len(pieces)))
+            description, column_buffers = _encode_column(_concatenate(pieces, self._batch_lengths))
+            columns.append([self._column_ids[column], description])
+            buffers.extend(column_buffers)
+        header = json.dumps(columns, separators=(',', ':')).encode('utf-8')
+        body = b''.join([header] + buffers)
+
+        flags = 0
+        if self.compression_level:
+            compressed = zlib.compress(body, self.compression_level)
+            if len(compressed) < len(body):
+                body, flags = compressed, COMPRESSED
+
+        offset = self._write_block(CHUNK_TAG, body, flags=flags, num_rows=num_rows, header_length=len(header))
+        self.chunks.append([offset, num_rows])
+        self._buffer = {}
+        self._batch_lengths = []
+
+    def close(self):
+        """Flush, then write the footer index."""
+        if self._file is None:
+            return
+        self.flush()
+        footer = json.dumps(dict(num_rows=self.num_rows, chunks=self.chunks, columns=self.columns)).encode('utf-8')
+        offset = self._file.tell()
+        self._write_block(FOOTER_TAG, footer, trailer=TRAILER.pack(offset, TRAILER_TAG))
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SweepReader:
+    """
+    Reads a `.msweep` file, including one which is still being written. See the top of `sweep_store.py`.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initalizes SweepReader class. Indexes the chunks written so far.
+
+        Args:
+            path (str): Ex: "sweep.msweep"
+        """
+        self.path = path
+        self._reset()
+        self.refresh()
+
+    def _reset(self):
+        # [offset, num_rows] of each complete chunk
+        self.chunks = []
+        # [section, name] of every column. Ids are positions in this list
+        self.columns = []
+        # Whether the writer closed the file (it ends w/ a footer)
+        self.complete = False
+        # End of the last complete block, w/o the footer
+        self.end = len(MAGIC)
+
+    @property
+    def num_rows(self) -> int:
+        return sum(num_rows for _, num_rows in self.chunks)
+
+    def refresh(self) -> int:
+        """
+        Index blocks written since the last call.
+
+        Returns:
+            num_new_rows (int)
+        """
+        num_rows = self.num_rows
+        with open(self.path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'`{self.path}` is not a sweep file.')
+            size = os.fstat(file.fileno()).st_size
+            if size < self.end:
+                # Rewritten since
+                self._reset()
+                num_rows = 0
+            if self.end == len(MAGIC) and self._read_footer(file, size):
+                return self.num_rows - num_rows
+
+            self.complete = False
+            file.seek(self.end)
+            while self.end + BLOCK.size <= size:
+                tag, _, block_rows, _, body_length = BLOCK.unpack(file.read(BLOCK.size))
+                if tag == FOOTER_TAG:
+                    self.complete = True
+                    break
+                if tag not in (SCHEMA_TAG, CHUNK_TAG) or self.end + BLOCK.size + body_length > size:
+                    # Not completely written yet
+                    break
+                if tag == SCHEMA_TAG:
+                    self.columns.extend(json.loads(file.read(body_length)))
+                else:
+                    self.chunks.append([self.end, block_rows])
+                    file.seek(body_length, os.SEEK_CUR)
+                self.end += BLOCK.size + body_length
+        return self.num_rows - num_rows
+
+    def _read_footer(self, file, size: int) -> bool:
+        """Index the chunks from the footer, if the file has a valid one. Used in `self.refresh`."""
+        if size < len(MAGIC) + BLOCK.size + TRAILER.size:
+            return False
+        file.seek(size - TRAILER.size)
+        footer_offset, tag = TRAILER.unpack(file.read(TRAILER.size))
+        if tag != TRAILER_TAG or not len(MAGIC) <= footer_offset <= size - TRAILER.size - BLOCK.size:
+            return False
+        file.seek(footer_offset)
+        tag, _, _, _, footer_length = BLOCK.unpack(file.read(BLOCK.size))
+        if tag != FOOTER_TAG or footer_offset + BLOCK.size + footer_length + TRAILER.size != size:
+            return False
+        footer = json.loads(file.read(footer_length))
+        self.chunks = footer['chunks']
+        self.columns = footer['columns']
+        self.end = footer_offset
+        self.complete = True
+        return True
+
+    def read(self, columns: list[str] = None, start_chunk: int = 0) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Read the indexed chunks. Call `self.refresh` first to include chunks written since.
+
+        Args:
+            columns (list[str], optional): Only decode these columns (of either section). Defaults to all.
+            start_chunk (int, optional): Skip the chunks before it, ex: to only read new rows. Defaults to 0.
+
+        Returns:
+            qoptions (pd.DataFrame): Like `QLibrarian.qoptions`.
+            simulations (pd.DataFrame): Like `QLibrarian.simulations`.
+        """
+        chunks = self.chunks[start_chunk:]
+        wanted = [i for i, (_, name) in enumerate(self.columns) if columns is None or name in columns]
+        pieces = {i: [] for i in wanted}
+        lengths = [num_rows for _, num_rows in chunks]
+
+        if chunks:
+            # One read for every chunk
+            with open(self.path, 'rb') as file:
+                file.seek(chunks[0][0])
+                data = memoryview(file.read(self.end - chunks[0][0]))
+        for offset, _ in chunks:
+            position = offset - chunks[0][0]
+            _, flags, num_rows, header_length, body_length = BLOCK.unpack(data[position:position + BLOCK.size])
+            body = data[position + BLOCK.size:position + BLOCK.size + body_length]
+            if flags & COMPRESSED:
+                body = memoryview(zlib.decompress(body))
+
+            decoded = {}
+            body_offset = header_length
+            for i, description in json.loads(bytes(body[:header_length])):
+                if i in pieces:
+                    decoded[i] = _decode_column(description, num_rows, body, body_offset)
+                body_offset = _column_end(description, num_rows, body, body_offset)
+            for i in pieces:
+                pieces[i].append(decoded.get(i))
+
+        frames = {section: {} for section in _SECTIONS}
+        for i, column_pieces in pieces.items():
+            section, name = self.columns[i]
+            frames[section][name] = _concatenate(column_pieces, lengths)
+        return tuple(pd.DataFrame(frames[section], index=pd.RangeIndex(sum(lengths))) for section in _SECTIONS)
+
+    def to_library_frame(self) -> pd.DataFrame:
+        """The sweep in the library layout: geometry columns, `__SPLITTER__`, characteristic columns."""
+        qoptions, simulations = self.read()
+        return pd.concat([qoptions, pd.DataFrame(columns=[SPLITTER]), simulations], axis=1)
+
+
+def read_sweep(path: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Shorthand for `SweepReader(path).read()`."""
+    return SweepReader(path).read()
+
+
+def sweep_to_csv(sweep_path: str, csv_path: str = None, extract_misc: bool = False) -> str:
+    """
+    Convert a sweep to a CSV in the library layout, which `Ingestor` merges into a library.
+
+    Args:
+        sweep_path (str): Ex: "sweep.msweep"
+        csv_path (str, optional): Overwritten if it exists. Defaults to `sweep_path` w/ a ".csv" extension.
+        extract_misc (bool, optional): Write the `misc` column as typed columns, and its raw text to
+            `<csv_path>.misc.jsonl.gz`. Same as `QLibrarian.append_csv`. Defaults to False.
+
+    Returns:
+        csv_path (str)
+    """
+    if csv_path is None:
+        csv_path = os.path.splitext(sweep_path)[0] + '.csv'
+    qoptions, simulations = read_sweep(sweep_path)
+    if extract_misc and misc_extractor.MISC_COLUMN in simulations.columns:
+        simulations, raw = misc_extractor.extract_misc(simulations)
+        cold_storage = misc_extractor.cold_storage_path(csv_path)
+        if os.path.exists(cold_storage):
+            os.remove(cold_storage)
+        misc_extractor.append_cold_storage(cold_storage, raw)
+    pd.concat([qoptions, pd.DataFrame(columns=[SPLITTER]), simulations], axis=1).to_csv(csv_path, index=False)
+    return csv_path
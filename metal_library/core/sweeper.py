@@ -1,8 +1,21 @@
+from metal_library import Dict, logging
 from metal_library.core.librarian import QLibrarian
-from metal_library.core.sweeper_helperfunctions import extract_QSweep_parameters
+from metal_library.core.selector import Selector
+from metal_library.core.sweeper_helperfunctions import extract_QSweep_parameters, extract_parameters, extract_values, create_dict_list
+from metal_library.core.reader_helperfunctions import parse_unit_column, format_unit_value
+from metal_library.core.scheduler import RuntimeModel, schedule_longest_first, append_timing_log, timing_log_path
+from metal_library.core.sweep_store import SweepWriter, SWEEP_SUFFIX
 
 from tqdm import tqdm # creates cute progress bar
+import copy
+import time
+import numpy as np
 import pandas as pd
+from scipy.optimize import minimize
+
+
+class _StopTargetedSweep(Exception):
+    """Raised inside the optimizer's objective to end `QSweeper.run_targeted_sweep`."""
 
 class QSweeper:
     '''
@@ -17,6 +30,9 @@ class QSweeper:
                                    custom_analysis = None, 
                                    parameters_slice: slice = None,
                                    save_path: str = None, 
+                                   selector: Selector = None,
+                                   runtime_model: RuntimeModel = None,
+                                   worker: tuple[int, int] = None,
                                    **kwargs):
         """
         Runs self.analysis.run_sweep() for all combinations of the options and values in the `parameters` dictionary.
@@ -29,12 +45,24 @@ class QSweeper:
         * parameters_slice (slice, optional) - If sweep fails, tell it where to start again from. Defaults to all.
             Example:
             slice(40,)
-        * save_path (str, optional) - save data path associated from sweep
+        * save_path (str, optional) - save data path associated from sweep.
+            A path ending in `.msweep` is written w/ `SweepWriter` (see `metal_library.core.sweep_store`)
+            instead of `QLibrarian.append_csv`.
+        * selector (Selector, optional) - Every simulated configuration is appended to it (`Selector.append`),
+            so it answers queries about the sweep's results while the sweep runs. They're merged into its library
+            (`Selector.merge_delta`) once the sweep ends.
+        * runtime_model (RuntimeModel, optional) - Run configurations longest-predicted-first.
+            See `metal_library.core.scheduler`. Defaults to product order.
+        * worker (tuple[int, int], optional) - (this worker, number of workers). Only run this worker's share of
+            the configurations, split so every worker has about the same predicted runtime.
+            Start every worker w/ the same `runtime_model`. Defaults to all configurations.
         * kwargs - parameters associated w/ QAnalysis.run()
         
         Output:
         * Librarian (QLibrarian)- 
 
+        The runtime of each configuration is logged to `<save_path>.timing.csv`, see `RuntimeModel.from_timing_logs`.
+
         Example:
         If `parameters = {'cross_length': [1, 2], 'cross_gap': [4, 5, 6]}`, then this method will call 
         `self.analysis.()` 6 times with the following arguments:
@@ -59,6 +87,15 @@ class QSweeper:
         if (parameters_slice != None):
             all_combo_parameters = all_combo_parameters[parameters_slice]
 
+        # Longest-predicted first, and only this worker's share
+        if (runtime_model != None) or (worker != None):
+            predicted_seconds = np.ones(len(all_combo_parameters))
+            if runtime_model != None:
+                predicted_seconds = self.predict_runtimes(component.options, all_combo_parameters, runtime_model)
+            worker_index, num_workers = worker if worker != None else (0, 1)
+            schedule = schedule_longest_first(predicted_seconds, num_workers)
+            all_combo_parameters = [all_combo_parameters[position] for position in schedule[worker_index]]
+
         # Select a simulator type
         if custom_analysis != None:
             run_analysis = custom_analysis
@@ -66,41 +103,76 @@ class QSweeper:
             raise ValueError('Default analysis not implemented yet. Please add `custom_analysis`')
         
 
-        # Get all combinations of the options and values, w/ `tqdm` progress bar
-        i = 0
-        for combo_parameter in tqdm(all_combo_parameters):
-            # Update QComponent referenced by 'component_name'
-            component.options = self.update_qcomponent(component.options, combo_parameter)
-            design.rebuild()
+        # Binary, chunked output
+        writer = self._open_writer(save_path)
 
-            # Run the analysis, extract important data
-            data = run_analysis(**kwargs) # type(data) -> dict
+        try:
+            # Get all combinations of the options and values, w/ `tqdm` progress bar
+            i = 0
+            for combo_parameter in tqdm(all_combo_parameters):
+                start_time = time.perf_counter()
 
-            # Log QComponent.options and data from analysis
-            self.librarian.from_dict(component.options, 'single_qoption') # geometrical options
-            self.librarian.from_dict(data, 'simulation') #
+                # Update QComponent referenced by 'component_name'
+                component.options = self.update_qcomponent(component.options, combo_parameter)
+                design.rebuild()
 
-            # Save this data to a csv
-            newest_qoption = self.librarian.qoptions.tail(n=1)
-            newest_simulation = self.librarian.simulations.tail(n=1)
-            
-            if i == 0:
-                header_qoption = self.librarian.qoptions.columns.to_list()
-                header_simulation = self.librarian.simulation.columns.to_list()
+                # Run the analysis, extract important data
+                data = run_analysis(**kwargs) # type(data) -> dict
+                runtime = time.perf_counter() - start_time
 
-                header_qoption = pd.DataFrame(header_qoption, columns=header_qoption)
-                header_simulation = pd.DataFrame(header_simulation, columns=header_simulation)
-                QLibrarian.append_csv(header_qoption, header_simulation, filepath = save_path)
-            
-            QLibrarian.append_csv(newest_qoption, newest_simulation, filepath = save_path)
+                # Log QComponent.options and data from analysis
+                self.librarian.from_dict(component.options, 'single_qoption') # geometrical options
+                self.librarian.from_dict(data, 'simulation') #
 
-            # Tell me this iteration is finished
-            print('Simulated and logged configuration: {}'.format(combo_parameter))
+                # Save this data to a csv
+                newest_qoption, newest_simulation = self._save_newest(save_path, writer, runtime)
+
+                # Make the result searchable right away
+                if selector is not None:
+                    try:
+                        selector.append(pd.concat([newest_qoption, pd.DataFrame(columns=['__SPLITTER__']), newest_simulation], axis=1))
+                    except ValueError as error:
+                        logging.warning(f'Configuration not added to `selector`: {error}')
 
-            i += 1
+                # Tell me this iteration is finished
+                print('Simulated and logged configuration: {}'.format(combo_parameter))
+
+                i += 1
+        finally:
+            if writer is not None:
+                writer.close()
+            if selector is not None:
+                selector.merge_delta()
 
         return self.librarian
 
+    def _open_writer(self, save_path: str) -> SweepWriter:
+        """`SweepWriter` if `save_path` is a `.msweep` file, otherwise None (rows are appended to a `.csv`)."""
+        if (save_path != None) and save_path.endswith(SWEEP_SUFFIX):
+            return SweepWriter(save_path)
+        return None
+
+    def _save_newest(self, save_path: str, writer: SweepWriter, runtime: float) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Save the newest configuration of `self.librarian` to `writer`, or to the `.csv` at `save_path` (w/ a header
+        if it's empty). Its runtime is logged to `<save_path>.timing.csv`.
+
+        Output:
+        * newest_qoption (pd.DataFrame)
+        * newest_simulation (pd.DataFrame)
+        """
+        newest_qoption = self.librarian.qoptions.tail(n=1)
+        newest_simulation = self.librarian.simulations.tail(n=1)
+
+        if writer is not None:
+            writer.append(newest_qoption, newest_simulation)
+        else:
+            QLibrarian.write_csv_header(newest_qoption.columns, newest_simulation.columns, filepath = save_path)
+            QLibrarian.append_csv(newest_qoption, newest_simulation, filepath = save_path)
+        if save_path != None:
+            append_timing_log(timing_log_path(save_path), newest_qoption, runtime)
+        return newest_qoption, newest_simulation
+
     def run_multi_component_sweep(self, 
                                   components_names: list[str], 
                                   parameters: list[dict], 
@@ -181,7 +253,238 @@ class QSweeper:
 
         return self.librarian
 
-        
+    def run_targeted_sweep(self,
+                           component_name: str,
+                           target_params: dict,
+                           parameters: dict,
+                           custom_analysis = None,
+                           selector: Selector = None,
+                           tolerance: float = 1e-3,
+                           max_simulations: int = 30,
+                           metric: str = 'Euclidian',
+                           initial_step: float = 0.1,
+                           decimals: int = 4,
+                           save_path: str = None,
+                           **kwargs):
+        """
+        Instead of simulating every combination, search for a geometry whose characteristics hit `target_params`.
+
+        Starts from the closest presimulated geometry (`selector.find_closest`), then lets Nelder-Mead propose
+        new geometries inside the `parameters` ranges. Only those proposals are simulated w/ `custom_analysis`.
+        Stops once every characteristic is w/in `tolerance` (relative) of its target, or after `max_simulations`.
+
+        Inputs:
+        * component_name (str) - The name of the component to run the sweep on.
+        * target_params (dict) - Keys are keys of the dict returned by `custom_analysis`,
+            values are the targets. Ex: {'Qubit_Frequency_GHz': 4.5, 'Qubit_Anharmonicity_MHz': 200}
+        * parameters (dict) - Same nested structure as QComponent.options, but each value is a [min, max] range.
+            Ex: {'cross_length': ['150um', '250um'], 'connection_pads': {'readout': {'claw_length': ['100um', '200um']}}}
+        * custom_analysis (func (QAnalysis) -> dict) - Create a custom analyzer to parse data
+        * selector (Selector, optional) - Library to seed the search from. Defaults to the middle of `parameters`.
+        * tolerance (float, optional) - Largest allowed relative error of each characteristic. Defaults to 1e-3.
+        * max_simulations (int, optional) - Budget of calls to `custom_analysis`. Defaults to 30.
+        * metric (str, optional) - How relative errors are combined into the objective. Must choose from
+            `Selector.__supported_metrics__`. Defaults to 'Euclidian'.
+        * initial_step (float, optional) - Size of the first simplex, as a fraction of each range. Defaults to 0.1.
+        * decimals (int, optional) - Proposed geometries are rounded to this many decimals (in their units). Defaults to 4.
+        * save_path (str, optional) - save data path associated from sweep. Same formats as `self.run_single_component_sweep`,
+            w/ the runtime of each simulation logged to `<save_path>.timing.csv`. Defaults to not saving.
+        * kwargs - parameters associated w/ QAnalysis.run()
+
+        Output:
+        * Librarian (QLibrarian)- Every simulated point. The best one is in `self.targeted_result`.
+        """
+        if custom_analysis == None:
+            raise ValueError('Default analysis not implemented yet. Please add `custom_analysis`')
+        if metric not in Selector.__supported_metrics__:
+            raise ValueError(f'`metric` must be one of the following: {Selector.__supported_metrics__}')
+
+        # Clear simulations library
+        self.librarian = QLibrarian()
+
+        # Define some useful objects
+        design = self.design
+        component = design.components[component_name]
+        run_analysis = custom_analysis
+        distance_function = getattr(Selector, f'_distance_{metric}')
+        targets = np.array(list(target_params.values()), dtype=float)
+
+        # Parse [min, max] ranges into numbers w/ units
+        keys = extract_parameters(parameters)
+        lower, upper, units = [], [], []
+        for key, bounds in zip(keys, extract_values(parameters)):
+            parsed = parse_unit_column(pd.Series([str(bound) for bound in bounds]))
+            if parsed is None or len(bounds) != 2:
+                raise ValueError(f'`parameters["{key}"]` must be a [min, max] range, got {bounds}')
+            (low, high), unit = parsed
+            lower.append(low)
+            upper.append(high)
+            units.append(unit)
+        lower, upper = np.array(lower), np.array(upper)
+
+        # Seed from the closest presimulated geometry
+        x0 = np.full(len(keys), 0.5)
+        if selector is not None:
+            _, _, best_geometries = selector.find_closest(target_params, num_top=1, metric=metric, display=False)
+            for i, key in enumerate(keys):
+                value = self._get_nested(best_geometries[0], key)
+                parsed = parse_unit_column(pd.Series([str(value)])) if value is not None else None
+                if parsed is not None and upper[i] > lower[i]:
+                    x0[i] = (parsed[0][0] - lower[i]) / (upper[i] - lower[i])
+        x0 = np.clip(x0, 0, 1)
+
+        # Optimize over [0, 1]^N, so every parameter moves on the same scale
+        evaluated = {}
+        self.targeted_result = Dict(converged=False, num_simulations=0, distance=np.inf)
+
+        def to_geometry(x):
+            values = lower + np.clip(x, 0, 1) * (upper - lower)
+            formatted = [format_unit_value(round(value, decimals), unit) if unit else round(value, decimals)
+                         for value, unit in zip(values, units)]
+            return create_dict_list(keys, [formatted])[0]
+
+        def objective(x):
+            geometry = to_geometry(x)
+            geometry_key = repr(geometry)
+            if geometry_key in evaluated:
+                return evaluated[geometry_key]
+            if self.targeted_result.num_simulations >= max_simulations:
+                raise _StopTargetedSweep()
+            start_time = time.perf_counter()
+
+            # Update QComponent referenced by 'component_name'
+            component.options = self.update_qcomponent(component.options, geometry)
+            design.rebuild()
+
+            # Run the analysis, extract important data
+            data = run_analysis(**kwargs)
+            runtime = time.perf_counter() - start_time
+
+            # Log QComponent.options and data from analysis
+            self.librarian.from_dict(component.options, 'single_qoption')
+            self.librarian.from_dict(data, 'simulation')
+            if save_path is not None:
+                self._save_newest(save_path, writer, runtime)
+
+            results = np.array([data[key] for key in target_params], dtype=float)
+            relative_errors = (results - targets) / np.where(targets != 0, np.abs(targets), 1)
+            distance = float(distance_function(relative_errors[None, :], np.zeros(len(targets)))[0])
+
+            self.targeted_result.num_simulations += 1
+            evaluated[geometry_key] = distance
+            logging.info(f'Simulated configuration {self.targeted_result.num_simulations}/{max_simulations}: {geometry} -> {dict(zip(target_params, results))}')
+
+            if distance < self.targeted_result.distance:
+                self.targeted_result.update(best_geometry=geometry, best_data=data, distance=distance)
+            if np.all(np.abs(relative_errors) <= tolerance):
+                self.targeted_result.converged = True
+                raise _StopTargetedSweep()
+            return distance
+
+        # Initial simplex: the seed, plus a step along each parameter (stepping back in if it would leave the range)
+        initial_simplex = [x0]
+        for i in range(len(keys)):
+            vertex = x0.copy()
+            vertex[i] = vertex[i] + initial_step if vertex[i] + initial_step <= 1 else vertex[i] - initial_step
+            initial_simplex.append(vertex)
+
+        writer = self._open_writer(save_path)
+        try:
+            minimize(objective, x0, method='Nelder-Mead', bounds=[(0, 1)] * len(keys),
+                     options=dict(initial_simplex=np.array(initial_simplex), maxfev=10 * max_simulations,
+                                  xatol=1e-6, fatol=0))
+        except _StopTargetedSweep:
+            pass
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if not self.targeted_result.converged:
+            logging.info(f'Targeted sweep did not reach tolerance {tolerance} after {self.targeted_result.num_simulations} simulations.')
+
+        return self.librarian
+
+    def estimate(self,
+                 component_name: str,
+                 parameters: dict,
+                 runtime_model: RuntimeModel,
+                 num_workers: int = 1,
+                 cost_per_hour: float = None,
+                 parameters_slice: slice = None) -> Dict:
+        """
+        Dry run of `self.run_single_component_sweep`: predict how long it takes, w/o simulating anything.
+
+        Inputs:
+        * component_name (str) - The name of the component to run the sweep on.
+        * parameters (dict) - Same as `self.run_single_component_sweep`.
+        * runtime_model (RuntimeModel) - Ex: `RuntimeModel.from_timing_logs(["sweep.timing.csv"])`
+        * num_workers (int, optional) - Workers running the sweep, longest-predicted-first. Defaults to 1.
+        * cost_per_hour (float, optional) - Price of one worker-hour. Defaults to None.
+        * parameters_slice (slice, optional) - Same as `self.run_single_component_sweep`.
+
+        Output:
+        * estimate (Dict) -
+            num_configurations (int)
+            predicted_seconds (list[float]) - Per configuration, in product order.
+            total_seconds (float) - Compute time, summed over configurations.
+            wall_seconds (float) - Time until the last worker finishes.
+            schedule (list[list[int]]) - Configurations each worker runs, see `schedule_longest_first`.
+            cost (float) - `total_seconds` in hours times `cost_per_hour`. None w/o `cost_per_hour`.
+        """
+        component = self.design.components[component_name]
+        all_combo_parameters = extract_QSweep_parameters(parameters)
+        if (parameters_slice != None):
+            all_combo_parameters = all_combo_parameters[parameters_slice]
+
+        predicted_seconds = self.predict_runtimes(component.options, all_combo_parameters, runtime_model)
+        schedule = schedule_longest_first(predicted_seconds, num_workers)
+        total_seconds = float(predicted_seconds.sum())
+        wall_seconds = max(float(predicted_seconds[positions].sum()) for positions in schedule)
+
+        estimate = Dict(num_configurations=len(all_combo_parameters),
+                        predicted_seconds=predicted_seconds.tolist(),
+                        total_seconds=total_seconds,
+                        wall_seconds=wall_seconds,
+                        schedule=schedule,
+                        cost=None if cost_per_hour is None else total_seconds / 3600 * cost_per_hour)
+        logging.info(f'{len(all_combo_parameters)} configurations: {total_seconds / 3600:.2f} compute hours, '
+                     f'{wall_seconds / 3600:.2f} hours on {num_workers} worker(s)')
+        return estimate
+
+    def predict_runtimes(self, qcomponent_options: dict, combo_parameters: list[dict], runtime_model: RuntimeModel) -> np.ndarray:
+        """
+        Predicted seconds to simulate each configuration of a sweep.
+
+        Inputs:
+        * qcomponent_options (dict) - Current QComponent.options, which each configuration updates.
+        * combo_parameters (list[dict]) - Ex: `extract_QSweep_parameters(parameters)`
+        * runtime_model (RuntimeModel)
+
+        Output:
+        * seconds (np.ndarray)
+        """
+        rows = []
+        for combo_parameter in combo_parameters:
+            options = self.update_qcomponent(copy.deepcopy(dict(qcomponent_options)), combo_parameter)
+            keys, values = QLibrarian.extract_keysvalues(options)
+            rows.append(dict(zip(keys, values)))
+        return runtime_model.predict(pd.DataFrame(rows))
+
+    @staticmethod
+    def _get_nested(dictionary: dict, key: str):
+        """
+        Get `dictionary["a"]["b"]` from `key = "a.b"`. Returns None if it doesn't exist.
+        Keys are compared w/o surrounding whitespace, since some library CSV headers have it.
+        """
+        for part in key.split('.'):
+            if not isinstance(dictionary, dict):
+                return None
+            matches = [value for name, value in dictionary.items() if str(name).strip() == part.strip()]
+            if not matches:
+                return None
+            dictionary = matches[0]
+        return dictionary
+
     def update_qcomponent(self, qcomponent_options: dict, dictionary):
         '''
         Given a qcomponent.options dictionary,
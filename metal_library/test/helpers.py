@@ -0,0 +1,81 @@
+import os
+import shutil
+import http.server
+
+import numpy as np
+import pandas as pd
+
+import metal_library
+
+'''
+Fakes and synthetic libraries shared by the unit tests.
+'''
+
+def make_qubit_cavity_library(directory: str, num_rows: int = 200, seed: int = 0) -> str:
+    """Write a small synthetic TransmonCross `QubitCavity.csv` (w/ categorical characteristics) to `directory`."""
+    library_path = os.path.join(directory, "TransmonCross")
+    os.makedirs(library_path)
+    shutil.copy(os.path.join(metal_library.__library_path__, "TransmonCross", "metadata.json"), library_path)
+
+    rng = np.random.default_rng(seed)
+    cross_length = rng.choice([185, 195, 205, 215], size=num_rows)
+    claw_length = rng.choice([100, 150, 200], size=num_rows)
+    df = pd.DataFrame({
+        "cross_length": [f"{value}um" for value in cross_length],
+        "connection_pads.readout.claw_length": [f"{value}um" for value in claw_length],
+        "__SPLITTER__": np.nan,
+        "Qubit_Frequency_GHz": 6 - cross_length / 100 + rng.normal(0, 0.01, num_rows),
+        "Qubit_Anharmonicity_MHz": 380 - cross_length + rng.normal(0, 1, num_rows),
+        "Cavity_Frequency_GHz": rng.uniform(6, 8, num_rows),
+        "Coupling_Strength_MHz": claw_length / 2 + rng.normal(0, 1, num_rows),
+        "wavelength": rng.choice(["half", "quarter"], size=num_rows),
+        "feedline_coupling": rng.choice(["capacitive", "inductive"], size=num_rows),
+    })
+    df.to_csv(os.path.join(library_path, "QubitCavity.csv"), index=False)
+    return library_path
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file server which answers `Range: bytes=<start>-<end>` requests (unless `ignore_ranges`), and logs every request."""
+
+    requests = []
+    ignore_ranges = False
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as file:
+            content = file.read()
+
+        byte_range = self.headers.get("Range")
+        type(self).requests.append((os.path.basename(path), byte_range))
+        if byte_range and not type(self).ignore_ranges:
+            start, end = (int(value) for value in byte_range.replace("bytes=", "").split("-"))
+            content = content[start:end + 1]
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeTransmonCross:
+    """Stand-in for a qiskit-metal component, only `options` is used by `QSweeper`"""
+    def __init__(self, options: dict = None):
+        self.options = options or {'cross_length': '200um', 'cross_gap': '30um',
+                                   'connection_pads': {'readout': {'claw_length': '150um'}}}
+
+
+class FakeDesign:
+    """Stand-in for a qiskit-metal design holding one `FakeTransmonCross`"""
+    def __init__(self, options: dict = None):
+        self.components = {'qubit': FakeTransmonCross(options)}
+
+    def rebuild(self):
+        pass
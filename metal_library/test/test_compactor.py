@@ -0,0 +1,91 @@
+import unittest
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import metal_library
+from metal_library.core.reader import Reader
+from metal_library.core.selector import Selector
+from metal_library.core import compactor
+
+
+class TestCompactor(unittest.TestCase):
+    """Units test `metal_library.core.compactor`"""
+
+    def test_compactor_round_trip(self):
+        """Test compacting a library, writing it to disk, and expanding it back"""
+        df = pd.read_csv(os.path.join(metal_library.__library_path__, "TransmonCross", "QubitOnly.csv"))
+        compact_df, compact_info = compactor.compact_library(df)
+
+        self.assertIn("pos_x", compact_info["constants"])
+        self.assertNotIn("pos_x", compact_df.columns)
+        self.assertEqual(len(compact_df) + compact_info["num_merged"], len(df))
+        self.assertFalse(compact_df.duplicated(subset=[c for c in compact_df.columns if c in compact_info["geometry_columns"]]).any())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path_prefix = os.path.join(directory, "QubitOnly")
+            compactor.save_compact_library(compact_df, compact_info, path_prefix)
+            loaded_df, loaded_info = compactor.load_compact_library(path_prefix)
+
+        expanded_df = compactor.expand_library(loaded_df, loaded_info)
+        self.assertEqual(list(expanded_df.columns), list(df.columns))
+        self.assertEqual(len(expanded_df), len(compact_df))
+
+    def test_compactor_merges_duplicates_w_missing_values(self):
+        """Test averaging duplicate geometries skips missing values and their weight"""
+        df = pd.DataFrame({"cross_length": ["185um", "185um", "195um"],
+                           "__SPLITTER__": np.nan,
+                           "Qubit_Frequency_GHz": [4.0, 5.0, 6.0],
+                           "Qubit_Anharmonicity_MHz": [np.nan, 200.0, 210.0],
+                           "Cavity_Frequency_GHz": [np.nan, np.nan, 7.0]})
+        compact_df, compact_info = compactor.compact_library(df)
+        self.assertEqual(compact_info["num_merged"], 1)
+        merged = compact_df.set_index("cross_length")
+        self.assertAlmostEqual(merged.loc["185um", "Qubit_Frequency_GHz"], 4.5)
+        self.assertAlmostEqual(merged.loc["185um", "Qubit_Anharmonicity_MHz"], 200.0)
+        self.assertTrue(np.isnan(merged.loc["185um", "Cavity_Frequency_GHz"]))
+
+    def test_compactor_options(self):
+        """Test compacted rows round-trip to the same QComponent.options as the full library"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        selector = Selector(reader)
+
+        df = pd.read_csv(os.path.join(reader.path, "QubitOnly.csv"))
+        compact_df, compact_info = compactor.compact_library(df)
+        for i in [0, 10, len(compact_df) - 1]:
+            original_index = int(compact_df[compactor.PROVENANCE].iloc[i].split(compactor.PROVENANCE_SEPARATOR)[0])
+            self.assertEqual(compactor.get_options_from_compact(compact_df, compact_info, i),
+                             selector.get_geometry_from_index(original_index))
+
+    def test_reader_compact_memory(self):
+        """Test `Reader.read_library(memory='compact')` shrinks the library w/o changing QComponent.options"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        compact_reader = Reader(component_name="TransmonCross")
+        compact_reader.read_library(component_type="QubitOnly", memory='compact')
+
+        memory_usage = compact_reader.library.memory_usage
+        self.assertLess(memory_usage.after, memory_usage.before)
+        self.assertEqual(compact_reader.library.units[" cross_length"], "um")
+        self.assertEqual(str(compact_reader.library.characteristic["Qubit_Frequency_GHz"].dtype), "float32")
+
+        selector = Selector(reader)
+        compact_selector = Selector(compact_reader)
+        for index in [0, 100, 727]:
+            self.assertEqual(selector.get_geometry_from_index(index), compact_selector.get_geometry_from_index(index))
+
+        # Re-reading w/o `memory` drops the dtype plan, and gets a version it never had before
+        version = compact_reader.library.version
+        compact_reader.read_library(component_type="QubitOnly")
+        self.assertEqual(compact_reader.library.dtype_plan, {})
+        self.assertNotIn("memory_usage", compact_reader.library)
+        self.assertEqual(str(compact_reader.library.characteristic["Qubit_Frequency_GHz"].dtype), "float64")
+        self.assertGreater(compact_reader.library.version, version)
+        self.assertNotEqual(compact_reader.library.version, reader.library.version)
+
+        with self.assertRaises(ValueError):
+            reader.read_library(component_type="QubitOnly", memory="tiny")
@@ -0,0 +1,60 @@
+import unittest
+
+import tempfile
+
+import numpy as np
+
+from metal_library.core.federated_selector import FederatedSelector
+from metal_library.test.helpers import make_qubit_cavity_library
+
+
+class TestFederatedSelector(unittest.TestCase):
+    """Units test `metal_library.core.federated_selector`"""
+
+    def test_federated_selector_merges_libraries(self):
+        """Test federated queries match each library's own results, merged and tagged by library"""
+        # Between rows of both libraries
+        target_params = {"Qubit_Frequency_GHz": 4.05, "Qubit_Anharmonicity_MHz": 186}
+        with tempfile.TemporaryDirectory() as directory:
+            library_path = make_qubit_cavity_library(directory)
+            federated_selector = FederatedSelector([("TransmonCross", "QubitOnly"),
+                                                    ("TransmonCross", "QubitCavity", library_path),
+                                                    ("TransmonPocket", "QubitOnly")], ignore_errors=True)
+        self.assertEqual(list(federated_selector.errors), [("TransmonPocket", "QubitOnly")])
+        self.assertEqual(str(federated_selector.errors[("TransmonPocket", "QubitOnly")]), "TransmonPocket has no component type QubitOnly")
+        self.assertEqual(federated_selector.characteristic_columns, ["Qubit_Frequency_GHz", "Qubit_Anharmonicity_MHz"])
+
+        # Same as the closest rows of both libraries, sorted by distance
+        selectors = list(federated_selector.selectors.values())
+        expected = []
+        for key, selector in federated_selector.selectors.items():
+            indexes, characteristics, _ = selector.find_closest(target_params, num_top=10, display=False)
+            for index, characteristic in zip(indexes, characteristics):
+                distance = np.hypot(characteristic["Qubit_Frequency_GHz"] - 4.05, characteristic["Qubit_Anharmonicity_MHz"] - 186)
+                expected.append((distance, key + (index,)))
+        expected = [row for _, row in sorted(expected)[:10]]
+
+        indexes, characteristics, geometries = federated_selector.find_closest(target_params, num_top=10)
+        self.assertEqual(list(indexes), expected)
+        self.assertEqual(set(indexes.get_level_values("component_type")), {"QubitOnly", "QubitCavity"})
+        for (_, component_type, index), characteristic, geometry in zip(indexes, characteristics, geometries):
+            selector = selectors[0] if component_type == "QubitOnly" else selectors[1]
+            self.assertEqual(geometry, selector.get_geometry_from_index(index))
+            self.assertEqual(characteristic, selector.get_characteristic_from_index(index))
+
+        batch = federated_selector.find_closest([target_params, {"Qubit_Frequency_GHz": 4.0}], num_top=3)
+        self.assertEqual(list(batch[0][0]), expected[:3])
+        self.assertEqual(len(batch[1][0]), 3)
+
+        indexes, characteristics, _ = federated_selector.find_in_range({"Qubit_Frequency_GHz": [4.0, 4.1]})
+        expected_count = sum(len(selector.find_in_range({"Qubit_Frequency_GHz": [4.0, 4.1]})[0]) for selector in selectors)
+        self.assertEqual(len(indexes), expected_count)
+        self.assertTrue(all(4.0 <= characteristic["Qubit_Frequency_GHz"] <= 4.1 for characteristic in characteristics))
+
+        # Only in QubitCavity
+        with self.assertRaises(ValueError):
+            federated_selector.find_closest({"Cavity_Frequency_GHz": 7}, num_top=1)
+        federated_selector.close()
+
+        with self.assertRaisesRegex(ValueError, "TransmonCross has no component type NotAType"):
+            FederatedSelector([("TransmonCross", "QubitOnly"), ("TransmonCross", "NotAType")])
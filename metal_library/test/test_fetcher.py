@@ -0,0 +1,94 @@
+import unittest
+
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import functools
+import http.server
+
+import pandas as pd
+
+import metal_library
+from metal_library.core.reader import Reader
+from metal_library.core.fetcher import ContentCache, write_manifest
+from metal_library.test.helpers import RangeRequestHandler
+
+
+class TestFetcher(unittest.TestCase):
+    """Units test `metal_library.core.fetcher`"""
+
+    def test_remote_library_fetch_and_cache(self):
+        """Test a remote library is fetched per component type in shards, then served from the cache"""
+        with tempfile.TemporaryDirectory() as directory:
+            served_path = os.path.join(directory, "served", "TransmonCross")
+            shutil.copytree(os.path.join(metal_library.__library_path__, "TransmonCross"), served_path)
+            write_manifest(served_path, shard_size=2**18)
+
+            handler = functools.partial(RangeRequestHandler, directory=os.path.join(directory, "served"))
+            server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}/TransmonCross"
+
+            try:
+                RangeRequestHandler.requests = []
+                cache = ContentCache(os.path.join(directory, "cache"))
+                reader = Reader(component_name="TransmonCross", library_path=url, cache=cache)
+                reader.read_library(component_type="QubitOnly")
+
+                requested_files = {file_name for file_name, _ in RangeRequestHandler.requests}
+                self.assertEqual(requested_files, {"manifest.json", "metadata.json", "QubitOnly.csv"})
+                self.assertGreater(sum(byte_range is not None for _, byte_range in RangeRequestHandler.requests), 1)
+
+                local_reader = Reader(component_name="TransmonCross")
+                local_reader.read_library(component_type="QubitOnly")
+                pd.testing.assert_frame_equal(reader.library.characteristic, local_reader.library.characteristic)
+
+                # A fresh mirror only needs the manifest, every shard comes from the cache
+                shutil.rmtree(reader.path)
+                RangeRequestHandler.requests = []
+                Reader(component_name="TransmonCross", library_path=url, cache=cache).read_library(component_type="QubitOnly")
+                self.assertEqual(RangeRequestHandler.requests, [("manifest.json", None)])
+
+                # The mirror counts towards the budget of the cache, next to the shards it was assembled from
+                csv_size = os.path.getsize(os.path.join(reader.path, "QubitOnly.csv"))
+                self.assertGreaterEqual(cache.size(), 2 * csv_size)
+                cache.max_bytes = 0
+                cache.evict()
+                self.assertEqual(cache.size(), 0)
+
+                # A server which ignores range requests is asked for each file once
+                RangeRequestHandler.requests = []
+                RangeRequestHandler.ignore_ranges = True
+                cache = ContentCache(os.path.join(directory, "other_cache"))
+                reader = Reader(component_name="TransmonCross", library_path=url, cache=cache)
+                reader.read_library(component_type="QubitOnly")
+                self.assertEqual([file_name for file_name, _ in RangeRequestHandler.requests].count("QubitOnly.csv"), 1)
+                pd.testing.assert_frame_equal(reader.library.characteristic, local_reader.library.characteristic)
+            finally:
+                RangeRequestHandler.ignore_ranges = False
+                server.shutdown()
+                server.server_close()
+
+    def test_content_cache_verify_and_evict(self):
+        """Test corrupted blobs are dropped and eviction removes the least recently used blobs"""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ContentCache(directory, max_bytes=250)
+            blobs = [bytes([i]) * 100 for i in range(3)]
+            hashes = [hashlib.sha256(blob).hexdigest() for blob in blobs]
+            for i, (sha256, blob) in enumerate(zip(hashes, blobs)):
+                cache.put(sha256, blob)
+                os.utime(cache._path(sha256), (i, i))
+
+            with self.assertRaises(ValueError):
+                cache.put(hashes[0], b"not the right content")
+
+            cache.evict()
+            self.assertIsNone(cache.get(hashes[0]))
+            self.assertEqual(cache.get(hashes[2]), blobs[2])
+            self.assertLessEqual(cache.size(), 250)
+
+            with open(cache._path(hashes[2]), 'wb') as file:
+                file.write(b"corrupted")
+            self.assertIsNone(cache.get(hashes[2]))
@@ -0,0 +1,70 @@
+import unittest
+
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from metal_library.core.reader import Reader
+from metal_library.core.grid import RegularGrid
+from metal_library.test.helpers import make_qubit_cavity_library
+
+
+class TestGrid(unittest.TestCase):
+    """Units test `metal_library.core.grid`"""
+
+    def test_reader_detects_regular_grid(self):
+        """Test QubitOnly is detected as a grid w/ O(1) lookups and multilinear interpolation, and partitions get their own grid"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        geometry, characteristic = reader.library.geometry, reader.library.characteristic
+        grid = reader.get_grid()
+        self.assertEqual(grid.shape, (4, 5, 2, 6, 3))
+        self.assertEqual(grid.characteristic_columns, ["Qubit_Frequency_GHz", "Qubit_Anharmonicity_MHz"])
+
+        # Geometries simulated twice keep their last row
+        axis_geometry = geometry[grid.axis_columns]
+        duplicated = axis_geometry.index[axis_geometry.duplicated(keep=False)]
+        last = axis_geometry.index[axis_geometry.duplicated(keep=False) & ~axis_geometry.duplicated(keep="last")]
+        for label in duplicated:
+            row = {column.strip(): value for column, value in geometry.loc[label].items()}
+            self.assertIn(grid.lookup_index(row), last)
+        row = {column.strip(): value for column, value in geometry.loc[0].items()}
+        row["cross_length"] = "0.185mm"
+        self.assertEqual(grid.lookup(row), {column: characteristic.loc[grid.lookup_index(row), column] for column in grid.characteristic_columns})
+        row["cross_length"] = "190um"
+        self.assertIsNone(grid.lookup(row))
+
+        # Interpolation is exact on the grid, and halfway between two grid points along one axis
+        unique_rows = ~axis_geometry.duplicated(keep=False)
+        interpolated = grid.interpolate(geometry[unique_rows])
+        np.testing.assert_allclose(interpolated.to_numpy(), characteristic.loc[unique_rows, grid.characteristic_columns].to_numpy())
+        position = (1, 2, 0, 3, 1)
+        point = {column.strip(): axis[i] for column, axis, i in zip(grid.axis_columns, grid.axes, position)}
+        point["cross_length"] = (grid.axes[3][3] + grid.axes[3][4]) / 2
+        expected = (grid.values[position] + grid.values[(1, 2, 0, 4, 1)]) / 2
+        for method in ["linear", "slinear"]:
+            np.testing.assert_allclose(grid.interpolate(point, method=method).to_numpy()[0], expected)
+        with self.assertRaises(ValueError):
+            grid.interpolate(point, method="cubic")
+
+        # Appending a geometry already in the grid replaces it
+        new_row = reader.library.geometry.loc[[0]].join(pd.DataFrame({"__SPLITTER__": [np.nan]}))
+        new_row = new_row.join(characteristic.loc[[0]])
+        label = reader.append(new_row)[0]
+        self.assertEqual(reader.get_grid().lookup_index(row | {"cross_length": "185um"}), label)
+
+        with tempfile.TemporaryDirectory() as directory:
+            library_path = make_qubit_cavity_library(directory, num_rows=400)
+            reader = Reader(component_name="TransmonCross", library_path=library_path)
+            reader.read_library(component_type="QubitCavity", memory="compact")
+            self.assertNotIn("grids", reader.library)
+            grid = reader.get_grid(("half", "inductive"))
+            self.assertEqual(reader.library.grid_partition_columns, ["wavelength", "feedline_coupling"])
+            self.assertEqual(len(reader.library.grids), 4)
+            self.assertEqual(grid.shape, (4, 3))
+            self.assertIsNone(RegularGrid.detect(reader.library.geometry.iloc[:5], reader.library.characteristic.iloc[:5]))
+
+            label = grid.lookup_index({"cross_length": "195um", "connection_pads.readout.claw_length": 150})
+            self.assertEqual(reader.library.characteristic.loc[label, "wavelength"], "half")
+            self.assertEqual(reader.library.geometry.loc[label, "cross_length"], 195)
@@ -0,0 +1,158 @@
+import unittest
+
+import os
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+import pandas as pd
+
+import metal_library
+from metal_library.core.reader import Reader
+from metal_library.core.selector import Selector
+from metal_library.core import compactor
+from metal_library.core.ingestor import Ingestor
+from metal_library.core import misc_extractor
+
+
+class TestIngestor(unittest.TestCase):
+    """Units test `metal_library.core.ingestor`"""
+
+    def test_ingestor_appends_new_files_once(self):
+        """Test ingesting a drop directory appends valid files, once, and records the contributor"""
+        with tempfile.TemporaryDirectory() as directory:
+            library_path = os.path.join(directory, "TransmonCross")
+            drop_directory = os.path.join(directory, "drop")
+            shutil.copytree(os.path.join(metal_library.__library_path__, "TransmonCross"), library_path)
+            os.makedirs(drop_directory)
+
+            library_df = pd.read_csv(os.path.join(library_path, "QubitOnly.csv"))
+            library_df.iloc[:3].to_csv(os.path.join(drop_directory, "with_header.csv"), index=False)
+            library_df.iloc[3:5].to_csv(os.path.join(drop_directory, "without_header.csv"), index=False, header=False)
+            with open(os.path.join(drop_directory, "invalid.csv"), "w") as file:
+                file.write("1,2,3\n")
+
+            author = {"name": ["Test Author"], "pi": ["Test PI"], "institution": ["Test University"]}
+            ingestor = Ingestor("TransmonCross", library_path=library_path, num_workers=2)
+            ingested_files = ingestor.ingest(drop_directory, "QubitOnly", author=author)
+            self.assertEqual([os.path.basename(f) for f in ingested_files], ["with_header.csv", "without_header.csv"])
+            self.assertEqual(ingestor.ingest(drop_directory, "QubitOnly", author=author), [])
+
+            reader = Reader(component_name="TransmonCross", library_path=library_path)
+            reader.read_library(component_type="QubitOnly")
+            self.assertEqual(len(reader.library.geometry), len(library_df) + 5)
+
+            with open(os.path.join(library_path, "metadata.json")) as file:
+                contribution = json.load(file)["contributors"]["simulation"]["authors"][-1]["contribution"]["QubitOnly"]
+            self.assertEqual((contribution["csv_startline"], contribution["csv_endline"]), (len(library_df), len(library_df) + 5))
+
+    def test_ingestor_updates_compact_cache(self):
+        """Test ingesting new rows updates an existing compacted library"""
+        with tempfile.TemporaryDirectory() as directory:
+            library_path = os.path.join(directory, "TransmonCross")
+            drop_directory = os.path.join(directory, "drop")
+            shutil.copytree(os.path.join(metal_library.__library_path__, "TransmonCross"), library_path)
+            os.makedirs(drop_directory)
+            Reader(component_name="TransmonCross", library_path=library_path).compact_library("QubitOnly")
+
+            library_df = pd.read_csv(os.path.join(library_path, "QubitOnly.csv"))
+            library_df.iloc[:4].to_csv(os.path.join(drop_directory, "sweep.csv"), index=False)
+            Ingestor("TransmonCross", library_path=library_path, num_workers=1).ingest(drop_directory, "QubitOnly")
+
+            compact_df, compact_info = compactor.load_compact_library(os.path.join(library_path, "QubitOnly"))
+            self.assertEqual(compact_info["num_rows"], len(library_df) + 4)
+            self.assertEqual(len(compact_df), compact_info["num_rows"] - compact_info["num_merged"])
+
+    def test_ingestor_resumes_after_failure(self):
+        """Test a failure after a file is appended doesn't append it again on the next run, and the compact cache catches up"""
+        with tempfile.TemporaryDirectory() as directory:
+            library_path = os.path.join(directory, "TransmonCross")
+            drop_directory = os.path.join(directory, "drop")
+            shutil.copytree(os.path.join(metal_library.__library_path__, "TransmonCross"), library_path)
+            os.makedirs(drop_directory)
+            Reader(component_name="TransmonCross", library_path=library_path).compact_library("QubitOnly")
+
+            library_df = pd.read_csv(os.path.join(library_path, "QubitOnly.csv"))
+            for i, name in enumerate(["a.csv", "b.csv", "c.csv"]):
+                library_df.iloc[2 * i:2 * i + 2].to_csv(os.path.join(drop_directory, name), index=False)
+
+            def failing_updater(component_type, new_df, first_row):
+                if first_row > len(library_df):
+                    raise RuntimeError("Updater failed")
+
+            ingestor = Ingestor("TransmonCross", library_path=library_path, num_workers=1)
+            ingestor.cache_updaters.insert(0, failing_updater)
+            with self.assertRaises(RuntimeError):
+                ingestor.ingest(drop_directory, "QubitOnly")
+            with open(os.path.join(library_path, "ingested.json")) as file:
+                self.assertEqual(sorted(entry["file_name"] for entry in json.load(file).values()), ["a.csv", "b.csv"])
+
+            ingested_files = Ingestor("TransmonCross", library_path=library_path, num_workers=1).ingest(drop_directory, "QubitOnly")
+            self.assertEqual([os.path.basename(f) for f in ingested_files], ["c.csv"])
+            self.assertEqual(len(pd.read_csv(os.path.join(library_path, "QubitOnly.csv"))), len(library_df) + 6)
+
+            _, compact_info = compactor.load_compact_library(os.path.join(library_path, "QubitOnly"))
+            self.assertEqual(compact_info["num_rows"], len(library_df) + 6)
+
+    def test_ingestor_extracts_misc(self):
+        """Test `misc` becomes typed columns, w/ the raw text in cold storage, for the library and ingested files"""
+        with tempfile.TemporaryDirectory() as directory:
+            library_path = os.path.join(directory, "TransmonCross")
+            drop_directory = os.path.join(directory, "drop")
+            shutil.copytree(os.path.join(metal_library.__library_path__, "TransmonCross"), library_path)
+            os.makedirs(drop_directory)
+            csv_path = os.path.join(library_path, "QubitOnly.csv")
+
+            library_df = pd.read_csv(csv_path)
+            library_df.iloc[:3].to_csv(os.path.join(drop_directory, "with_header.csv"), index=False)
+            library_df.iloc[3:5].to_csv(os.path.join(drop_directory, "without_header.csv"), index=False, header=False)
+
+            cold_storage_path = misc_extractor.extract_library_misc(csv_path)
+            Ingestor("TransmonCross", library_path=library_path, num_workers=1).ingest(drop_directory, "QubitOnly")
+
+            reader = Reader(component_name="TransmonCross", library_path=library_path)
+            reader.read_library(component_type="QubitOnly")
+            characteristic = reader.library.characteristic
+            self.assertNotIn("misc", characteristic.columns)
+            self.assertEqual(len(characteristic), len(library_df) + 5)
+            self.assertEqual(characteristic["misc.setup_name"].iloc[0], "TransmonSetup")
+            self.assertEqual(characteristic["misc.num_passes"].iloc[0], 19)
+            self.assertAlmostEqual(characteristic["misc.final_delta_percent"].iloc[0], 0.081948)
+            self.assertEqual(characteristic["misc.dissipative_surfaces"].iloc[0], "layer_3_datatype_0_plane")
+            self.assertEqual(characteristic["misc.convergence_deltas"].iloc[0].split(";")[:2], ["89.153", "17.507"])
+            # Ingested rows are parsed like the library's own
+            pd.testing.assert_frame_equal(characteristic.iloc[len(library_df):].reset_index(drop=True),
+                                          characteristic.iloc[:5].reset_index(drop=True))
+
+            raw = misc_extractor.read_cold_storage(cold_storage_path, rows=[0, len(library_df) + 4])
+            self.assertEqual(raw[0], library_df["misc"].iloc[0])
+            self.assertEqual(raw[len(library_df) + 4], library_df["misc"].iloc[4])
+
+            # Convergence filtering is a numeric range query
+            indexes, _, _ = Selector(reader).find_in_range({"misc.final_delta_percent": [None, 0.07]})
+            self.assertEqual(list(indexes), list(characteristic.index[characteristic["misc.final_delta_percent"] <= 0.07]))
+
+    def test_cold_storage_appends_dont_rescan(self):
+        """Test appending to cold storage reads its row count from the index, and rescans if the file changed"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "QubitOnly" + misc_extractor.COLD_STORAGE_SUFFIX)
+            opened_modes = []
+            gzip_open = misc_extractor.gzip.open
+            def counting_open(filename, mode='rb', *args, **kwargs):
+                opened_modes.append(mode)
+                return gzip_open(filename, mode, *args, **kwargs)
+
+            with mock.patch.object(misc_extractor.gzip, "open", counting_open):
+                for i in range(50):
+                    misc_extractor.append_cold_storage(path, pd.Series([f"misc {i}"]))
+            self.assertEqual(opened_modes, ['at'] * 50)
+            self.assertEqual(misc_extractor.count_cold_storage(path), 50)
+            self.assertEqual(misc_extractor.read_cold_storage(path, rows=[49]), {49: "misc 49"})
+
+            # Written w/o updating the index
+            with gzip_open(path, 'at') as file:
+                file.write(json.dumps(dict(row=50, misc="misc 50")) + "\n")
+            self.assertEqual(misc_extractor.count_cold_storage(path), 51)
+            misc_extractor.append_cold_storage(path, pd.Series(["misc 51"]))
+            self.assertEqual(misc_extractor.read_cold_storage(path, rows=[51]), {51: "misc 51"})
@@ -0,0 +1,52 @@
+import unittest
+
+import os
+import tempfile
+
+from metal_library.core.reader import Reader
+from metal_library.core.selector import Selector
+from metal_library.core import instrumentation
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Units test `metal_library.core.instrumentation`"""
+
+    def test_instrumentation_explain_and_sinks(self):
+        """Test `find_closest(..., explain=True)` breaks down its time, and traces reach callback and Prometheus sinks"""
+        records = []
+        with tempfile.TemporaryDirectory() as directory:
+            prometheus = instrumentation.PrometheusTextfileSink(os.path.join(directory, "metal_library.prom"))
+            instrumentation.add_sink(records.append)
+            instrumentation.add_sink(prometheus)
+            try:
+                reader = Reader(component_name="TransmonCross")
+                reader.read_library(component_type="QubitOnly")
+                selector = Selector(reader)
+                target_params = {"Qubit_Frequency_GHz": 4.0}
+                indexes, _, geometries, explanation = selector.find_closest(target_params, num_top=3, display=False, explain=True)
+                selector.find_closest([target_params], num_top=3, display=False)
+            finally:
+                instrumentation.remove_sink(records.append)
+                instrumentation.remove_sink(prometheus)
+            with open(prometheus.path) as file:
+                text = file.read()
+
+        self.assertEqual(list(indexes), list(selector.find_closest(target_params, num_top=3, display=False)[0]))
+        self.assertEqual(set(reader.library.trace["stages"]), {"fetch", "parse", "split"})
+        self.assertEqual(reader.library.trace["counters"]["rows_read"], len(reader.library.characteristic))
+        self.assertEqual(selector.index_trace["counters"]["rows_indexed"], len(reader.library.characteristic))
+        self.assertTrue({"split", "distance", "top_k", "dict_conversion"} <= set(explanation["stages"]))
+        self.assertEqual(explanation["counters"]["rows_scanned"], len(reader.library.characteristic))
+        self.assertEqual(explanation["counters"]["delta_rows"], 0)
+        self.assertTrue(sum(explanation["stages"].values()) <= explanation["total_seconds"])
+
+        self.assertEqual([record["operation"] for record in records],
+                         ["Reader.read_library", "Selector.build_index", "Selector.find_closest", "Selector.find_closest"])
+        self.assertIn('metal_library_operations_total{operation="Selector.find_closest"} 2', text)
+        self.assertIn('metal_library_rows_scanned_total{operation="Selector.find_closest"} 1456', text)
+        self.assertIn('metal_library_stage_seconds_total{operation="Reader.read_library",stage="parse"}', text)
+
+        # Label values are escaped
+        prometheus = instrumentation.PrometheusTextfileSink(os.path.join(directory, "escaped.prom"), min_interval=float("inf"))
+        prometheus({"operation": 'say "hi"\\n\n', "total_seconds": 1.0, "stages": {}, "counters": {}, "cache": None})
+        self.assertIn('metal_library_operations_total{operation="say \\"hi\\"\\\\n\\n"} 1\n', prometheus.to_text())
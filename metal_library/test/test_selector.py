@@ -0,0 +1,189 @@
+import unittest
+
+import os
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import metal_library
+from metal_library.core.reader import Reader
+from metal_library.core.selector import Selector
+from metal_library.test.helpers import make_qubit_cavity_library
+
+
+class TestSelector(unittest.TestCase):
+    """Units test `metal_library.core.selector`"""
+
+    def test_selector_find_closest(self):
+        """Test every metric returns the closest rows, closest first"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        selector = Selector(reader)
+        target_params = {"Qubit_Frequency_GHz": 4.0, "Qubit_Anharmonicity_MHz": 190}
+
+        for metric in selector.__supported_metrics__:
+            indexes, characteristics, geometries = selector.find_closest(target_params, num_top=5, metric=metric, display=False)
+            distances = getattr(selector, f"_distance_{metric}")(
+                reader.library.characteristic[list(target_params)].to_numpy(), np.array(list(target_params.values())))
+            self.assertEqual(len(indexes), 5)
+            self.assertAlmostEqual(distances[indexes[0]], distances.min())
+            self.assertTrue(np.all(np.diff(distances[indexes]) >= 0))
+            self.assertEqual(geometries[0], selector.get_geometry_from_index(indexes[0]))
+
+    def test_selector_categorical_partitions(self):
+        """Test categorical characteristics partition the library and act as exact-match constraints"""
+        with tempfile.TemporaryDirectory() as directory:
+            library_path = make_qubit_cavity_library(directory)
+            reader = Reader(component_name="TransmonCross", library_path=library_path)
+            reader.read_library(component_type="QubitCavity")
+        selector = Selector(reader)
+
+        self.assertEqual(selector.categorical_columns, ["wavelength", "feedline_coupling"])
+        self.assertEqual(len(selector._partitions), 4)
+
+        target_params = {"Qubit_Frequency_GHz": 4.0, "Coupling_Strength_MHz": 75,
+                         "wavelength": "quarter", "feedline_coupling": "inductive"}
+        indexes, characteristics, _ = selector.find_closest(target_params, num_top=5, display=False)
+        for characteristic in characteristics:
+            self.assertEqual(characteristic["wavelength"], "quarter")
+            self.assertEqual(characteristic["feedline_coupling"], "inductive")
+
+        # Partially constrained search covers every matching partition
+        indexes, characteristics, _ = selector.find_closest({"Qubit_Frequency_GHz": 4.0, "wavelength": "half"},
+                                                            num_top=10, display=False)
+        self.assertTrue(all(characteristic["wavelength"] == "half" for characteristic in characteristics))
+        num_half = (reader.library.characteristic["wavelength"] == "half").sum()
+        with self.assertRaises(ValueError):
+            selector.find_closest({"Qubit_Frequency_GHz": 4.0, "wavelength": "half"}, num_top=num_half + 1, display=False)
+
+    def test_selector_find_in_range(self):
+        """Test range queries return every row inside the ranges, and batches match single queries"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        selector = Selector(reader)
+
+        frequency = reader.library.characteristic["Qubit_Frequency_GHz"]
+        indexes, characteristics, geometries = selector.find_in_range({"Qubit_Frequency_GHz": [4, 4.5]})
+        expected = frequency.index[(frequency >= 4) & (frequency <= 4.5)]
+        self.assertEqual(list(indexes), list(expected))
+        self.assertEqual(geometries, [selector.get_geometry_from_index(index) for index in expected])
+        self.assertTrue(all(4 <= characteristic["Qubit_Frequency_GHz"] <= 4.5 for characteristic in characteristics))
+
+        indexes, _, _ = selector.find_in_range({"Qubit_Frequency_GHz": [None, 4]})
+        self.assertEqual(len(indexes), (frequency <= 4).sum())
+
+        queries = [{"Qubit_Frequency_GHz": 4, "Qubit_Anharmonicity_MHz": 200}, {"Qubit_Frequency_GHz": 5}]
+        batch = selector.find_closest(queries, num_top=3)
+        for query, result in zip(queries, batch):
+            single = selector.find_closest(query, num_top=3, display=False)
+            self.assertEqual(list(result[0]), list(single[0]))
+            self.assertEqual(result[2], single[2])
+
+    def test_selector_assign(self):
+        """Test joint assignment picks distinct rows which respect spacing, forbidden windows and categorical constraints"""
+        with tempfile.TemporaryDirectory() as directory:
+            library_path = make_qubit_cavity_library(directory, num_rows=2000)
+            reader = Reader(component_name="TransmonCross", library_path=library_path)
+            reader.read_library(component_type="QubitCavity")
+            selector = Selector(reader)
+
+            # W/o constraints, identical targets get the closest rows
+            target_params = {"Cavity_Frequency_GHz": 7, "Coupling_Strength_MHz": 75}
+            indexes, _, _ = selector.assign([target_params] * 5)
+            self.assertEqual(sorted(indexes), sorted(selector.find_closest(target_params, num_top=5, display=False)[0]))
+
+            rng = np.random.default_rng(0)
+            targets = [{"Cavity_Frequency_GHz": frequency, "Coupling_Strength_MHz": 75, "wavelength": "half"}
+                       for frequency in rng.uniform(6.5, 7.5, 40)]
+            constraints = {"min_spacing": {"Cavity_Frequency_GHz": 0.01},
+                           "forbidden": {"Cavity_Frequency_GHz": [[7.0, 7.1]]}}
+            indexes, characteristics, geometries = selector.assign(targets, constraints=constraints)
+
+            self.assertEqual(len(set(indexes)), len(targets))
+            frequencies = np.array([characteristic["Cavity_Frequency_GHz"] for characteristic in characteristics])
+            spacings = np.abs(frequencies[:, None] - frequencies[None, :])[np.triu_indices(len(targets), k=1)]
+            self.assertGreaterEqual(spacings.min(), 0.01)
+            self.assertFalse(((frequencies >= 7.0) & (frequencies <= 7.1)).any())
+            self.assertTrue(all(characteristic["wavelength"] == "half" for characteristic in characteristics))
+            self.assertEqual(geometries, [selector.get_geometry_from_index(index) for index in indexes])
+
+        # QubitOnly only has 18 distinct qubit frequencies
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        with self.assertRaises(ValueError):
+            Selector(reader).assign([{"Qubit_Frequency_GHz": 4}] * 20, constraints={"min_spacing": {"Qubit_Frequency_GHz": 0.01}})
+
+    def test_selector_append(self):
+        """Test appended rows are searchable right away, before and after the delta buffer is merged"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly", memory='compact')
+        selector = Selector(reader, merge_threshold=6)
+
+        rows = pd.read_csv(os.path.join(metal_library.__library_path__, "TransmonCross", "QubitOnly.csv")).iloc[:10]
+        rows["Qubit_Frequency_GHz"] = 5 + np.arange(10) / 100
+        rows["Qubit_Anharmonicity_MHz"] = 250.0
+        target_params = {"Qubit_Frequency_GHz": 5.031, "Qubit_Anharmonicity_MHz": 250}
+
+        index = selector.append(rows.iloc[:4])
+        self.assertEqual(list(index), [728, 729, 730, 731])
+        self.assertEqual(list(selector.find_closest(target_params, num_top=2, display=False)[0]), [731, 730])
+        self.assertEqual(sum(len(labels) for labels, _ in selector._delta.values()), 4)
+        explanation = selector.find_closest(target_params, num_top=2, display=False, explain=True)[3]
+        self.assertEqual(explanation["counters"]["delta_rows"], 4)
+
+        # Crosses `merge_threshold`
+        selector.append(rows.iloc[4:10])
+        selector.merge_delta()
+        self.assertEqual(selector._delta, {})
+        self.assertEqual(sum(len(labels) for labels, _ in selector._partitions.values()), 738)
+
+        indexes, characteristics, geometries = selector.find_closest(target_params, num_top=3, display=False)
+        self.assertEqual(list(indexes), [731, 732, 730])
+        self.assertEqual(geometries[0], selector.get_geometry_from_index(3))
+        self.assertEqual(characteristics[0]["Qubit_Frequency_GHz"], 5.03)
+
+        # Same as rebuilding from scratch
+        rebuilt = Selector(reader).find_closest(target_params, num_top=3, display=False)
+        self.assertEqual(list(rebuilt[0]), list(indexes))
+        self.assertEqual(rebuilt[2], geometries)
+
+        with self.assertRaises(ValueError):
+            selector.append(rows.drop(columns=["Qubit_Frequency_GHz"]))
+
+    def test_selector_append_copies_library_once(self):
+        """Test single-row appends don't copy the library, and are concatenated once when merged"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly", memory='compact')
+        selector = Selector(reader, merge_threshold=1_000)
+
+        rows = pd.read_csv(os.path.join(metal_library.__library_path__, "TransmonCross", "QubitOnly.csv")).iloc[:200]
+        rows["Qubit_Frequency_GHz"] = 5 + np.arange(200) / 1000
+        rows["Qubit_Anharmonicity_MHz"] = 250.0
+        target_params = {"Qubit_Frequency_GHz": 5.1502, "Qubit_Anharmonicity_MHz": 250}
+
+        concat_rows = mock.Mock(wraps=Reader._concat_rows)
+        with mock.patch.object(Reader, "_concat_rows", concat_rows):
+            for i in range(200):
+                selector.append(rows.iloc[[i]])
+            self.assertEqual(concat_rows.call_count, 0)
+            self.assertEqual(len(reader.library.pending_rows), 200)
+
+            # Pending rows are found, and read back
+            indexes, characteristics, geometries = selector.find_closest(target_params, num_top=2, display=False)
+            self.assertEqual(list(indexes), [878, 879])
+            self.assertEqual(characteristics[0]["Qubit_Frequency_GHz"], 5.15)
+            self.assertEqual(geometries[0], selector.get_geometry_from_index(150))
+            indexes, characteristics, _ = selector.find_in_range({"Qubit_Frequency_GHz": [5.1975, None]})
+            self.assertEqual(list(indexes), [926, 927])
+            self.assertEqual(characteristics[1]["Qubit_Frequency_GHz"], 5.199)
+            self.assertEqual(concat_rows.call_count, 0)
+
+            # Geometry and characteristic, each once
+            selector.merge_delta()
+            self.assertEqual(concat_rows.call_count, 2)
+        self.assertEqual(reader.library.pending_rows, [])
+        self.assertEqual(len(selector.characteristic), 928)
+        self.assertIs(selector.characteristic, reader.library.characteristic)
+        self.assertEqual(list(selector.find_closest(target_params, num_top=2, display=False)[0]), [878, 879])
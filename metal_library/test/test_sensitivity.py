@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from metal_library.core.reader import Reader
+from metal_library.core.selector import Selector
+from metal_library.core.sensitivity import LocalJacobian
+
+
+class TestSensitivity(unittest.TestCase):
+    """Units test `metal_library.core.sensitivity`"""
+
+    def test_selector_jacobians(self):
+        """Test local Jacobians match finite differences on a grid, recover a linear model from scattered rows, and are cached per library version"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        selector = Selector(reader)
+        grid = reader.get_grid()
+
+        # Interior grid point: central difference along cross_length
+        position = (1, 2, 0, 3, 1)
+        label = grid.labels[position]
+        jacobians = selector.get_jacobians([label, grid.labels[(1, 2, 0, 0, 1)]])
+        frequency = grid.values[..., 0]
+        expected = (frequency[1, 2, 0, 4, 1] - frequency[1, 2, 0, 2, 1]) / (grid.axes[3][4] - grid.axes[3][2])
+        self.assertAlmostEqual(jacobians.loc[label, ("Qubit_Frequency_GHz", " cross_length")], expected)
+        self.assertEqual(selector.get_jacobian_from_index(label)["Qubit_Frequency_GHz"][" cross_length"],
+                         jacobians.loc[label, ("Qubit_Frequency_GHz", " cross_length")])
+        self.assertEqual(jacobians.shape, (2, 2 * len(grid.axis_columns)))
+
+        # Cached until the library changes
+        local_jacobian = next(iter(selector._jacobians.values()))
+        selector.get_jacobians()
+        self.assertIs(next(iter(selector._jacobians.values())), local_jacobian)
+        selector.append(reader.library.geometry.loc[[0]].join(pd.DataFrame({"__SPLITTER__": [np.nan]})).join(reader.library.characteristic.loc[[0]]))
+        self.assertEqual(len(selector.get_jacobians()), len(reader.library.characteristic))
+        self.assertIsNot(next(iter(selector._jacobians.values())), local_jacobian)
+        with self.assertRaises(ValueError):
+            selector.get_jacobians([10**6])
+
+        # Scattered rows: the least-squares fit recovers a linear model, a constant column has no derivative
+        rng = np.random.default_rng(0)
+        geometry = pd.DataFrame({"cross_length": [f"{value:.3f}um" for value in rng.uniform(150, 250, 500)],
+                                 "cross_gap": rng.uniform(20, 40, 500), "cross_width": "30um"})
+        numbers = np.column_stack([geometry["cross_length"].str[:-2].astype(float), geometry["cross_gap"]])
+        characteristic = pd.DataFrame({"Qubit_Frequency_GHz": 8 - 0.02 * numbers[:, 0] + 0.01 * numbers[:, 1]})
+        local_jacobian = LocalJacobian(geometry, characteristic)
+        self.assertEqual(local_jacobian.geometry_columns, ["cross_length", "cross_gap"])
+        self.assertEqual(local_jacobian.units, {"cross_length": "um"})
+        np.testing.assert_allclose(local_jacobian.compute()[:, 0, :], np.tile([-0.02, 0.01], (500, 1)), atol=1e-9)
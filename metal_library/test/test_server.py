@@ -0,0 +1,53 @@
+import unittest
+
+import json
+
+from metal_library.core.reader import Reader
+from metal_library.core.selector import Selector
+from metal_library.core.server import SelectorServer, SelectorClient
+
+
+class TestServer(unittest.TestCase):
+    """Units test `metal_library.core.server`"""
+
+    def test_selector_server_and_client(self):
+        """Test the client gets the same answers from the server and in-process, and reports bad queries"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        selector = Selector(reader)
+        target_params = {"Qubit_Frequency_GHz": 4, "Qubit_Anharmonicity_MHz": 200}
+        expected = selector.find_closest(target_params, num_top=3, display=False)
+        expected_range = selector.find_in_range({"Qubit_Frequency_GHz": [4, 4.1]})
+
+        server = SelectorServer(port=0)
+        server.start()
+        try:
+            client = SelectorClient("TransmonCross", "QubitOnly", url=server.url)
+            indexes, characteristics, geometries = client.find_closest(target_params, num_top=3)
+            self.assertFalse(client.in_process)
+            self.assertEqual(list(indexes), list(expected[0]))
+            self.assertEqual(geometries, expected[2])
+            self.assertEqual(characteristics, json.loads(json.dumps(expected[1], default=float)))
+
+            batch = client.find_closest([target_params, {"Qubit_Frequency_GHz": 5}], num_top=2)
+            self.assertEqual(len(batch), 2)
+            self.assertEqual(list(batch[0][0]), list(expected[0][:2]))
+
+            indexes, _, geometries = client.find_in_range({"Qubit_Frequency_GHz": [4, 4.1]})
+            self.assertEqual(list(indexes), list(expected_range[0]))
+            self.assertEqual(geometries, expected_range[2])
+
+            with self.assertRaises(ValueError):
+                client.find_closest({"not_a_column": 1}, num_top=1)
+
+            # The library was only read once
+            self.assertEqual(len(server.selectors), 1)
+        finally:
+            server.shutdown()
+
+        # Nothing listens on the old port anymore
+        client = SelectorClient("TransmonCross", "QubitOnly", url=server.url)
+        indexes, _, geometries = client.find_closest(target_params, num_top=3)
+        self.assertTrue(client.in_process)
+        self.assertEqual(list(indexes), list(expected[0]))
+        self.assertEqual(geometries, expected[2])
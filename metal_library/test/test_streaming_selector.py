@@ -0,0 +1,46 @@
+import unittest
+
+import tempfile
+
+from metal_library.core.reader import Reader
+from metal_library.core.selector import Selector
+from metal_library.core.streaming_selector import StreamingSelector
+from metal_library.test.helpers import make_qubit_cavity_library
+
+
+class TestStreamingSelector(unittest.TestCase):
+    """Units test `metal_library.core.streaming_selector`"""
+
+    def test_streaming_selector_matches_selector(self):
+        """Test streaming, batched queries give the same results as `Selector` for any chunk size"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        selector = Selector(reader)
+
+        queries = [{"Qubit_Frequency_GHz": 4.0, "Qubit_Anharmonicity_MHz": 190},
+                   {"Qubit_Frequency_GHz": 3.7},
+                   {"Qubit_Anharmonicity_MHz": 210}]
+        for chunksize in [50, 1000]:
+            streaming_selector = StreamingSelector(reader, component_type="QubitOnly", chunksize=chunksize)
+            results = streaming_selector.find_closest(queries, num_top=4, metric="Manhattan")
+            for query, (indexes, characteristics, geometries) in zip(queries, results):
+                expected_indexes, expected_characteristics, expected_geometries = selector.find_closest(
+                    query, num_top=4, metric="Manhattan", display=False)
+                self.assertEqual(list(indexes), list(expected_indexes))
+                self.assertEqual(geometries, expected_geometries)
+
+    def test_streaming_selector_categorical_constraints(self):
+        """Test streaming search applies categorical constraints"""
+        with tempfile.TemporaryDirectory() as directory:
+            library_path = make_qubit_cavity_library(directory)
+            reader = Reader(component_name="TransmonCross", library_path=library_path)
+            streaming_selector = StreamingSelector(reader, component_type="QubitCavity", chunksize=32)
+            indexes, characteristics, _ = streaming_selector.find_closest(
+                {"Qubit_Frequency_GHz": 4.0, "feedline_coupling": "capacitive"}, num_top=5)
+
+            reader.read_library(component_type="QubitCavity")
+            expected_indexes, _, _ = Selector(reader).find_closest(
+                {"Qubit_Frequency_GHz": 4.0, "feedline_coupling": "capacitive"}, num_top=5, display=False)
+
+        self.assertEqual(list(indexes), list(expected_indexes))
+        self.assertTrue(all(characteristic["feedline_coupling"] == "capacitive" for characteristic in characteristics))
@@ -0,0 +1,58 @@
+import unittest
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from metal_library.core.reader import Reader
+from metal_library.core.surrogate import Surrogate
+
+
+class TestSurrogate(unittest.TestCase):
+    """Units test `metal_library.core.surrogate`"""
+
+    def test_surrogate_fit_predict_save(self):
+        """Test the surrogate reproduces the library, and survives a save / load"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        surrogate = Surrogate.from_reader(reader)
+
+        self.assertEqual(surrogate.characteristic_columns, ["Qubit_Frequency_GHz", "Qubit_Anharmonicity_MHz"])
+        mean, std = surrogate.predict(reader.library.geometry)
+        error = (mean - reader.library.characteristic[surrogate.characteristic_columns]).abs()
+        spread = reader.library.characteristic[surrogate.characteristic_columns].std()
+        self.assertTrue((error.mean() < 0.05 * spread).all())
+        self.assertTrue((std > 0).all().all())
+
+        # Uncertainty grows away from the library
+        far_away = surrogate.feature_mean + 10 * surrogate.feature_scale
+        _, far_std = surrogate.predict(far_away[None, :])
+        self.assertTrue((far_std.iloc[0] > std.max()).all())
+
+        # Same geometry in other units
+        self.assertEqual(surrogate.units[" cross_length"], "um")
+        geometry = reader.library.geometry.iloc[[0]].copy()
+        self.assertEqual(geometry[" cross_length"].iloc[0], "185um")
+        geometry[" cross_length"] = "0.185mm"
+        pd.testing.assert_frame_equal(surrogate.predict(geometry)[0], mean.iloc[[0]])
+        geometry[" cross_length"] = "185GHz"
+        with self.assertRaises(ValueError):
+            surrogate.predict(geometry)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "QubitOnly.surrogate.npz")
+            surrogate.save(path)
+            loaded = Surrogate.load(path)
+            loaded_mean, _ = loaded.predict(reader.library.geometry)
+        pd.testing.assert_frame_equal(mean, loaded_mean)
+        self.assertEqual(loaded.units, surrogate.units)
+
+        # Libraries read w/ `memory="compact"` store numbers, their units come from `Reader.library.units`
+        compact_reader = Reader(component_name="TransmonCross")
+        compact_reader.read_library(component_type="QubitOnly", memory="compact")
+        compact_surrogate = Surrogate.from_reader(compact_reader)
+        self.assertEqual(compact_surrogate.units, surrogate.units)
+        geometry[" cross_length"] = "0.185mm"
+        np.testing.assert_allclose(compact_surrogate.predict(geometry)[0].to_numpy(), mean.iloc[[0]].to_numpy(), rtol=1e-4)
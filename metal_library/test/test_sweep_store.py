@@ -0,0 +1,75 @@
+import unittest
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from metal_library.core.sweeper import QSweeper
+from metal_library.core.sweep_store import SweepWriter, SweepReader, sweep_to_csv
+from metal_library.test.helpers import FakeDesign
+
+
+class TestSweepStore(unittest.TestCase):
+    """Units test `metal_library.core.sweep_store`"""
+
+    def test_sweep_store_round_trip(self):
+        """Test a sweep written to `.msweep` reads back while being written, w/ new result keys, and converts to the CSV a `.csv` sweep writes"""
+        design = FakeDesign()
+
+        def analysis(late_key=True):
+            cross_length = float(design.components['qubit'].options['cross_length'][:-2])
+            data = {'Qubit_Frequency_GHz': 12 - 0.04 * cross_length, 'misc': {'passes': 3}}
+            if late_key and cross_length > 180:
+                data['Qubit_Anharmonicity_MHz'] = 2 * cross_length
+            return data
+
+        parameters = {'cross_length': ['150um', '175um', '200um']}
+        with tempfile.TemporaryDirectory() as directory:
+            sweep_path = os.path.join(directory, "sweep.msweep")
+            csv_path = os.path.join(directory, "sweep.csv")
+            QSweeper(design).run_single_component_sweep('qubit', parameters, custom_analysis=analysis, save_path=sweep_path)
+            # A CSV can't grow a column mid-file
+            QSweeper(design).run_single_component_sweep('qubit', parameters, custom_analysis=analysis, save_path=csv_path, late_key=False)
+            csv_sweep = pd.read_csv(csv_path)
+
+            reader = SweepReader(sweep_path)
+            self.assertTrue(reader.complete)
+            qoptions, simulations = reader.read()
+            self.assertEqual(list(qoptions['cross_length']), ['150um', '175um', '200um'])
+            self.assertEqual(list(qoptions['connection_pads.readout.claw_length']), ['150um'] * 3)
+            np.testing.assert_allclose(simulations['Qubit_Frequency_GHz'], [6, 5, 4])
+            np.testing.assert_allclose(simulations['Qubit_Anharmonicity_MHz'], [np.nan, np.nan, 400])
+            self.assertEqual(list(simulations['misc']), ["{'passes': 3}"] * 3)
+
+            # The converted CSV matches the one written row by row, plus the late key
+            converted = pd.read_csv(sweep_to_csv(sweep_path, os.path.join(directory, "converted.csv")))
+            self.assertEqual(list(converted.columns), list(csv_sweep.columns) + ['Qubit_Anharmonicity_MHz'])
+            pd.testing.assert_frame_equal(converted[csv_sweep.columns], csv_sweep)
+            self.assertEqual(list(csv_sweep.columns)[:4], ['cross_length', 'cross_gap', 'connection_pads.readout.claw_length', '__SPLITTER__'])
+
+            # A reader follows a file which is still being written, and reopening appends to it
+            writer = SweepWriter(sweep_path, chunk_size=2)
+            writer.append(qoptions.head(1), simulations.head(1))
+            # Buffered, and the footer is gone until the writer closes
+            self.assertEqual(reader.refresh(), 0)
+            self.assertFalse(reader.complete)
+            writer.append({'cross_length': '225um'}, {'Qubit_Frequency_GHz': 3.0, 'Cavity_Frequency_GHz': 7.0})
+            self.assertEqual(reader.refresh(), 2)
+            # A chunk which isn't completely written yet
+            partial_path = shutil.copy(sweep_path, os.path.join(directory, "partial.msweep"))
+            with open(partial_path, 'ab') as file:
+                file.write(b'MLCK\x00\x00')
+            self.assertEqual(SweepReader(partial_path).num_rows, reader.num_rows)
+            _, simulations = reader.read(columns=['Cavity_Frequency_GHz'], start_chunk=len(reader.chunks) - 1)
+            np.testing.assert_allclose(simulations['Cavity_Frequency_GHz'], [np.nan, 7.0])
+            writer.close()
+
+            reader = SweepReader(sweep_path)
+            self.assertTrue(reader.complete)
+            self.assertEqual(reader.num_rows, 5)
+            qoptions, simulations = reader.read()
+            self.assertEqual(list(qoptions['cross_length']), ['150um', '175um', '200um', '150um', '225um'])
+            self.assertTrue(pd.isna(qoptions['cross_gap'].iloc[-1]))
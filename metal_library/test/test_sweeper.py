@@ -0,0 +1,172 @@
+import unittest
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from metal_library.core.reader import Reader
+from metal_library.core.selector import Selector
+from metal_library.core.sweeper import QSweeper
+from metal_library.core.scheduler import RuntimeModel, schedule_longest_first, append_timing_log
+from metal_library.core.sweep_store import SweepReader
+from metal_library.test.helpers import FakeDesign
+
+
+class TestSweeper(unittest.TestCase):
+    """Units test `metal_library.core.sweeper`"""
+
+    @staticmethod
+    def runtime(cross_length, claw_length):
+        """Seconds a configuration takes, for the runtime model to learn"""
+        return np.exp(1 + 0.02 * cross_length - 0.01 * claw_length)
+
+    @classmethod
+    def setUpClass(cls):
+        """Fit a runtime model on a timing log of `cls.runtime`."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sweep.timing.csv")
+            for cross_length in [150, 175, 200, 225, 250]:
+                for claw_length in [100, 150, 200]:
+                    qoption = pd.DataFrame([{'cross_length': f'{cross_length}um', 'cross_gap': '30um',
+                                             'connection_pads.readout.claw_length': f'{claw_length}um'}])
+                    append_timing_log(path, qoption, cls.runtime(cross_length, claw_length))
+            cls.runtime_model = RuntimeModel.from_timing_logs([path])
+
+    def test_sweeper_targeted_sweep(self):
+        """Test the targeted sweep converges to reachable characteristics and records every simulation"""
+        design = FakeDesign()
+        calls = []
+
+        def analysis():
+            options = design.components['qubit'].options
+            cross_length = float(options['cross_length'][:-2])
+            claw_length = float(options['connection_pads']['readout']['claw_length'][:-2])
+            calls.append((cross_length, claw_length))
+            return {'Qubit_Frequency_GHz': 12 - 0.04 * cross_length - 0.002 * claw_length,
+                    'Qubit_Anharmonicity_MHz': 380 - 0.9 * cross_length - 0.1 * claw_length + 0.0005 * cross_length * claw_length}
+
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        selector = Selector(reader)
+
+        # Reached at cross_length = 190um, claw_length = 180um
+        target_params = {'Qubit_Frequency_GHz': 4.04, 'Qubit_Anharmonicity_MHz': 208.1}
+        parameters = {'cross_length': ['150um', '250um'],
+                      'connection_pads': {'readout': {'claw_length': ['100um', '250um']}}}
+
+        with tempfile.TemporaryDirectory() as directory:
+            save_path = os.path.join(directory, "targeted.csv")
+            sweeper = QSweeper(design)
+            librarian = sweeper.run_targeted_sweep('qubit', target_params, parameters, custom_analysis=analysis,
+                                                   selector=selector, max_simulations=60, save_path=save_path)
+            result = sweeper.targeted_result
+
+            self.assertTrue(result['converged'])
+            for name, target in target_params.items():
+                self.assertLessEqual(abs(result['best_data'][name] - target) / abs(target), 1e-3)
+            self.assertEqual(result['num_simulations'], len(calls))
+            self.assertEqual(len(set(calls)), len(calls))
+            self.assertEqual(len(librarian.qoptions), len(calls))
+
+            # Saved w/ a header, like a grid sweep, and timed
+            saved = pd.read_csv(save_path)
+            self.assertEqual(list(saved.columns), list(librarian.qoptions.columns) + ['__SPLITTER__'] + list(librarian.simulations.columns))
+            saved_lengths = zip(saved['cross_length'].str[:-2].astype(float), saved['connection_pads.readout.claw_length'].str[:-2].astype(float))
+            self.assertEqual(list(saved_lengths), calls)
+            self.assertEqual(len(pd.read_csv(os.path.join(directory, "targeted.timing.csv"))), len(calls))
+
+            num_calls = len(calls)
+            sweep_path = os.path.join(directory, "targeted.msweep")
+            QSweeper(design).run_targeted_sweep('qubit', target_params, parameters, custom_analysis=analysis,
+                                                max_simulations=5, save_path=sweep_path)
+            reader = SweepReader(sweep_path)
+            self.assertTrue(reader.complete)
+            qoptions, simulations = reader.read()
+            self.assertEqual(list(qoptions['cross_length'].str[:-2].astype(float)), [cross_length for cross_length, _ in calls[num_calls:]])
+            np.testing.assert_allclose(simulations['Qubit_Frequency_GHz'],
+                                       [12 - 0.04 * cross_length - 0.002 * claw_length for cross_length, claw_length in calls[num_calls:]])
+            # Both sweeps log to "targeted.timing.csv"
+            self.assertEqual(len(pd.read_csv(os.path.join(directory, "targeted.timing.csv"))), len(calls))
+
+        # Every proposal stays inside the ranges
+        for cross_length, claw_length in calls:
+            self.assertTrue(150 <= cross_length <= 250)
+            self.assertTrue(100 <= claw_length <= 250)
+
+    def test_sweeper_appends_to_selector(self):
+        """Test every configuration of a sweep is searchable in `selector` as soon as it's simulated"""
+        reader = Reader(component_name="TransmonCross")
+        reader.read_library(component_type="QubitOnly")
+        selector = Selector(reader)
+        # Same options as the library, so every row fits it
+        options = {name.strip(): value for name, value in selector.get_geometry_from_index(0).items()}
+        design = FakeDesign(options)
+
+        def analysis():
+            cross_length = float(design.components['qubit'].options['cross_length'][:-2])
+            return {'Qubit_Frequency_GHz': cross_length / 10, 'Qubit_Anharmonicity_MHz': 999.0, 'misc': 'sweep'}
+
+        parameters = {'cross_length': ['300um', '310um']}
+        with tempfile.TemporaryDirectory() as directory:
+            save_path = os.path.join(directory, "sweep.csv")
+            QSweeper(design).run_single_component_sweep('qubit', parameters, custom_analysis=analysis,
+                                                        selector=selector, save_path=save_path)
+            self.assertEqual(list(pd.read_csv(save_path)['cross_length']), ['300um', '310um'])
+
+        self.assertEqual(len(reader.library.characteristic), 730)
+        indexes, characteristics, geometries = selector.find_closest({'Qubit_Frequency_GHz': 31, 'Qubit_Anharmonicity_MHz': 999},
+                                                                     num_top=2, display=False)
+        self.assertEqual(list(indexes), [729, 728])
+        self.assertEqual(characteristics[0]['Qubit_Frequency_GHz'], 31)
+        self.assertEqual(geometries[0][' cross_length'], '310um')
+
+    def test_sweeper_estimate_and_schedule(self):
+        """Test the runtime model learns from timing logs, and the estimate splits work evenly between workers"""
+        runtime, model = self.runtime, self.runtime_model
+        self.assertEqual(model.num_samples, 15)
+
+        sweeper = QSweeper(FakeDesign())
+        parameters = {'cross_length': ['160um', '240um'], 'connection_pads': {'readout': {'claw_length': ['120um', '180um']}}}
+        estimate = sweeper.estimate('qubit', parameters, runtime_model=model, num_workers=2, cost_per_hour=3600)
+        expected = [runtime(160, 120), runtime(160, 180), runtime(240, 120), runtime(240, 180)]
+        np.testing.assert_allclose(estimate.predicted_seconds, expected, rtol=1e-3)
+        self.assertAlmostEqual(estimate.total_seconds, sum(estimate.predicted_seconds))
+        self.assertAlmostEqual(estimate.cost, estimate.total_seconds)
+        # Longest first: (240, 120) alone on one worker, the rest on the other
+        self.assertEqual(estimate.schedule, [[2], [3, 0, 1]])
+        self.assertAlmostEqual(estimate.wall_seconds, max(estimate.predicted_seconds[2], estimate.total_seconds - estimate.predicted_seconds[2]))
+        # The options of the design aren't changed by the dry run
+        self.assertEqual(sweeper.design.components['qubit'].options['cross_length'], '200um')
+
+        self.assertEqual(schedule_longest_first([5, 4, 3, 3, 3], num_workers=2), [[0, 3], [1, 2, 4]])
+        self.assertEqual(schedule_longest_first([1, 2, 3]), [[2, 1, 0]])
+
+    def test_sweeper_workers_run_their_share(self):
+        """Test each worker runs its share of the schedule, longest first, and logs the runtime of each configuration"""
+        parameters = {'cross_length': ['160um', '240um'], 'connection_pads': {'readout': {'claw_length': ['120um', '180um']}}}
+        schedule = QSweeper(FakeDesign()).estimate('qubit', parameters, runtime_model=self.runtime_model, num_workers=2).schedule
+        configurations = [('160um', '120um'), ('160um', '180um'), ('240um', '120um'), ('240um', '180um')]
+
+        with tempfile.TemporaryDirectory() as directory:
+            for worker_index in range(2):
+                design = FakeDesign()
+                calls = []
+
+                def analysis():
+                    options = design.components['qubit'].options
+                    calls.append((options['cross_length'], options['connection_pads']['readout']['claw_length']))
+                    return {'Qubit_Frequency_GHz': 4.0}
+
+                save_path = os.path.join(directory, f"sweep_{worker_index}.csv")
+                QSweeper(design).run_single_component_sweep('qubit', parameters, custom_analysis=analysis, save_path=save_path,
+                                                            runtime_model=self.runtime_model, worker=(worker_index, 2))
+                expected = [configurations[position] for position in schedule[worker_index]]
+                self.assertEqual(calls, expected)
+
+                timing_log = pd.read_csv(os.path.join(directory, f"sweep_{worker_index}.timing.csv"))
+                self.assertEqual(list(zip(timing_log['cross_length'], timing_log['connection_pads.readout.claw_length'])), expected)
+                self.assertEqual(list(timing_log['cross_gap']), ['30um'] * len(expected))
+                self.assertTrue((timing_log['runtime_s'] >= 0).all())
+                self.assertEqual(len(pd.read_csv(save_path)), len(expected))